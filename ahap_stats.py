@@ -0,0 +1,387 @@
+# Streaming AHAP loader, validator and statistics.
+#
+# Patterns are parsed incrementally: the file is read in chunks and the
+# "Pattern" array is decoded one entry at a time, so memory stays bounded by
+# the chunk size plus one entry, not by the size of the file. Each entry is
+# checked against the AHAP rules (entry kinds, event types, parameter IDs and
+# ranges, continuous durations, curve control points) and folded into
+# fixed-resolution timelines (event counts, active time), from which the
+# statistics come: events per second, peak density windows and total active
+# haptic time. The timelines grow with the pattern's duration only (a 500 MB,
+# 8 h pattern analyses in ~150 MB, where json.load takes ~2 GB).
+#
+#   python ahap_stats.py pattern_generated.ahap
+#   python ahap_stats.py big.ahap --json big_stats.json --window 0.5
+
+import argparse
+import json
+import re
+import sys
+import numpy as np
+
+from instrument import stage
+from limits import MAX_DURATION, MAX_CURVE_POINTS
+
+CHUNK_SIZE = 1 << 20      # characters read per chunk
+RESOLUTION = 0.01         # seconds per bin of the event count timeline
+COVER_RESOLUTION = 0.001  # seconds per bin of the active-time timeline
+TRANSIENT_SEC = 0.02      # nominal length of a transient when measuring active time
+PEAK_WINDOW = 1.0         # seconds, for the densest-window search
+PEAK_COUNT = 5            # densest non-overlapping windows reported
+MAX_ENTRY = 1 << 24       # characters one Pattern entry may take
+MAX_ISSUES = 100          # issues kept in full; beyond that only counted
+RATE_BINS = (0, 1, 5, 10, 20, 40, 80, 160)  # events/sec histogram edges (last bin open)
+
+# Parameter ranges per event type (None: unbounded)
+EVENT_PARAMETERS = {
+    "HapticTransient": {"HapticIntensity": (0.0, 1.0), "HapticSharpness": (0.0, 1.0)},
+    "HapticContinuous": {"HapticIntensity": (0.0, 1.0), "HapticSharpness": (0.0, 1.0),
+                         "AttackTime": (0.0, None), "DecayTime": (0.0, None), "ReleaseTime": (0.0, None),
+                         "Sustained": (0.0, 1.0)},
+    "AudioContinuous": {"AudioVolume": (0.0, 1.0), "AudioPan": (-1.0, 1.0), "AudioPitch": (-1.0, 1.0),
+                        "AudioBrightness": (0.0, 1.0), "AttackTime": (0.0, None), "DecayTime": (0.0, None),
+                        "ReleaseTime": (0.0, None), "Sustained": (0.0, 1.0)},
+    "AudioCustom": {"AudioVolume": (0.0, 1.0), "AudioPan": (-1.0, 1.0), "AudioPitch": (-1.0, 1.0),
+                    "AudioBrightness": (0.0, 1.0)},
+}
+# Ranges of dynamic parameters and parameter curves
+CONTROL_PARAMETERS = {
+    "HapticIntensityControl": (0.0, 1.0),
+    "HapticSharpnessControl": (-1.0, 1.0),
+    "HapticAttackTimeControl": (-1.0, 1.0),
+    "HapticDecayTimeControl": (-1.0, 1.0),
+    "HapticReleaseTimeControl": (-1.0, 1.0),
+    "AudioVolumeControl": (0.0, 1.0),
+    "AudioPanControl": (-1.0, 1.0),
+    "AudioPitchControl": (-1.0, 1.0),
+    "AudioBrightnessControl": (-1.0, 1.0),
+}
+ENTRY_KINDS = ("Event", "Parameter", "ParameterCurve")
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def iter_pattern(path, header=None, chunk_size=CHUNK_SIZE):
+    # Yields the entries of the top-level "Pattern" array one by one. Other
+    # top-level keys (Version, Metadata, ...) are stored in `header` as they
+    # are reached.
+    if header is None:
+        header = {}
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as f:
+        buf, pos, eof = '', 0, False
+        offset = 0  # characters dropped from the front of buf
+
+        def fill():
+            nonlocal buf, pos, eof, offset
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            offset += pos
+            buf, pos = buf[pos:] + chunk, 0
+
+        def peek():
+            # Next non-whitespace character (consumed up to it), '' at the end
+            nonlocal pos
+            while True:
+                pos = _WHITESPACE.match(buf, pos).end()
+                if pos < len(buf) or eof:
+                    return buf[pos:pos + 1]
+                fill()
+
+        def expect(char):
+            nonlocal pos
+            if peek() != char:
+                raise ValueError(f"{path}: expected {char!r} at character {offset + pos}")
+            pos += 1
+
+        def value():
+            # One complete JSON value; a value ending exactly at the buffer end
+            # may be cut short (a number), so it is only accepted at EOF
+            nonlocal pos
+            peek()
+            while True:
+                try:
+                    obj, end = decoder.raw_decode(buf, pos)
+                    if end < len(buf) or eof:
+                        pos = end
+                        return obj
+                except json.JSONDecodeError as e:
+                    # Malformed, or cut at the buffer end: more data decides,
+                    # up to MAX_ENTRY characters for one value
+                    if eof or len(buf) - pos > MAX_ENTRY:
+                        raise ValueError(f"{path}: {e.msg} (character {offset + e.pos})") from None
+                fill()
+
+        expect('{')
+        while peek() != '}':
+            key = value()
+            expect(':')
+            if key != "Pattern":
+                header[key] = value()
+            else:
+                expect('[')
+                while peek() != ']':
+                    yield value()
+                    if peek() == ',':
+                        pos += 1
+                pos += 1
+            if peek() == ',':
+                pos += 1
+        expect('}')
+
+
+def _number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value == value
+
+
+def _check_range(issues, where, name, value, bounds):
+    if not _number(value):
+        issues.append(('error', 'bad_value', f"{where}: {name} is not a number ({value!r})"))
+        return
+    lo, hi = bounds
+    if (lo is not None and value < lo) or (hi is not None and value > hi):
+        issues.append(('error', 'out_of_range', f"{where}: {name} {value} outside [{lo}, {hi}]"))
+
+
+def validate_entry(entry, index):
+    # [(severity, code, message)] for one Pattern entry; ('error' breaks the
+    # pattern for Core Haptics, 'warning' is suspicious but playable)
+    where = f"Pattern[{index}]"
+    issues = []
+    if not isinstance(entry, dict) or len(entry) != 1 or next(iter(entry)) not in ENTRY_KINDS:
+        return [('error', 'bad_entry', f"{where}: expected one of {', '.join(ENTRY_KINDS)}")]
+    kind, body = next(iter(entry.items()))
+    if not isinstance(body, dict):
+        return [('error', 'bad_entry', f"{where}: {kind} is not an object")]
+    if not _number(body.get("Time")) or body["Time"] < 0:
+        issues.append(('error', 'bad_time', f"{where}: Time {body.get('Time')!r} is not a number >= 0"))
+
+    if kind == "Event":
+        event_type = body.get("EventType")
+        allowed = EVENT_PARAMETERS.get(event_type)
+        if allowed is None:
+            return issues + [('error', 'bad_event_type', f"{where}: unknown EventType {event_type!r}")]
+        if event_type in ("HapticContinuous", "AudioContinuous"):
+            duration = body.get("EventDuration")
+            if not _number(duration) or duration <= 0:
+                issues.append(('error', 'bad_duration', f"{where}: {event_type} needs EventDuration > 0"))
+            elif duration > MAX_DURATION:
+                issues.append(('error', 'too_long', f"{where}: EventDuration {duration} > {MAX_DURATION} s"))
+        elif "EventDuration" in body and not _number(body["EventDuration"]):
+            issues.append(('error', 'bad_duration', f"{where}: EventDuration is not a number"))
+        if event_type == "AudioCustom" and not isinstance(body.get("EventWaveformPath"), str):
+            issues.append(('error', 'missing_waveform', f"{where}: AudioCustom needs EventWaveformPath"))
+        seen = set()
+        for param in body.get("EventParameters", []):
+            name = param.get("ParameterID") if isinstance(param, dict) else None
+            if name not in allowed:
+                issues.append(('error', 'bad_parameter', f"{where}: {name!r} is not a {event_type} parameter"))
+                continue
+            if name in seen:
+                issues.append(('warning', 'duplicate_parameter', f"{where}: {name} given twice"))
+            seen.add(name)
+            _check_range(issues, where, name, param.get("ParameterValue"), allowed[name])
+
+    elif kind == "Parameter":
+        name = body.get("ParameterID")
+        if name not in CONTROL_PARAMETERS:
+            issues.append(('error', 'bad_parameter', f"{where}: unknown dynamic parameter {name!r}"))
+        else:
+            _check_range(issues, where, name, body.get("ParameterValue"), CONTROL_PARAMETERS[name])
+
+    else:
+        name = body.get("ParameterID")
+        points = body.get("ParameterCurveControlPoints")
+        if name not in CONTROL_PARAMETERS:
+            issues.append(('error', 'bad_parameter', f"{where}: unknown curve parameter {name!r}"))
+        if not isinstance(points, list) or not points:
+            return issues + [('error', 'bad_curve', f"{where}: curve without control points")]
+        if len(points) > MAX_CURVE_POINTS:
+            issues.append(('error', 'too_many_points',
+                           f"{where}: {len(points)} control points > {MAX_CURVE_POINTS}"))
+        previous = None
+        for k, point in enumerate(points):
+            t = point.get("Time") if isinstance(point, dict) else None
+            if not _number(t) or t < 0:
+                issues.append(('error', 'bad_time', f"{where}: control point {k} Time {t!r}"))
+                break
+            if previous is not None and t < previous:
+                issues.append(('error', 'unordered_points', f"{where}: control point {k} goes back in time"))
+                break
+            previous = t
+            if name in CONTROL_PARAMETERS:
+                _check_range(issues, f"{where} point {k}", name, point.get("ParameterValue"),
+                             CONTROL_PARAMETERS[name])
+    return issues
+
+
+class PatternStats:
+    # Accumulates event times, a block of events at a time, into an event
+    # count per RESOLUTION bin and an active flag per COVER_RESOLUTION bin.
+    # Both grow with the duration of the pattern (a few MB per hour), not
+    # with the number of events.
+    def __init__(self, block_size=1 << 16):
+        self.block_size = block_size
+        self.counts = np.zeros(0, dtype=np.int32)
+        self.active = np.zeros(0, dtype=bool)
+        self.n_bins = 0     # count bins in use (the arrays grow ahead)
+        self.end = 0.0      # seconds, end of the last event to finish
+        self._start, self._end = [], []
+
+    def add(self, time, end):
+        self._start.append(time)
+        self._end.append(end)
+        if len(self._start) >= self.block_size:
+            self.flush()
+
+    @staticmethod
+    def _grown(a, n):
+        return a if n <= len(a) else np.concatenate([a, np.zeros(max(n, 2 * len(a)) - len(a), dtype=a.dtype)])
+
+    def flush(self):
+        if not self._start:
+            return
+        start, end = np.array(self._start), np.array(self._end)
+        self._start, self._end = [], []
+        self.end = max(self.end, float(end.max()))
+        bins = (start / RESOLUTION).astype(np.int64)
+        self.n_bins = max(self.n_bins, int(bins.max()) + 1)
+        self.counts = self._grown(self.counts, self.n_bins)
+        np.add.at(self.counts, bins, 1)
+
+        # Union of this block's intervals (sorted, then merged where one
+        # starts before the running end), or-ed into the active flags. A block
+        # can span the whole pattern when entries are out of order, so no
+        # array over its span is built.
+        order = np.argsort(start, kind='stable')
+        first = np.round(start[order] / COVER_RESOLUTION).astype(np.int64)
+        last = np.maximum.accumulate(np.maximum(np.round(end[order] / COVER_RESOLUTION).astype(np.int64), first + 1))
+        new = np.flatnonzero(np.concatenate([[True], first[1:] > last[:-1]]))
+        self.active = self._grown(self.active, int(last[-1]))
+        for a, b in zip(first[new].tolist(), last[np.append(new[1:] - 1, len(last) - 1)].tolist()):
+            self.active[a:b] = True
+
+    def per_second(self):
+        per_bin = int(round(1.0 / RESOLUTION))
+        counts = self.counts[:self.n_bins]
+        counts = np.concatenate([counts, np.zeros(-len(counts) % per_bin, dtype=counts.dtype)])
+        return counts.reshape(-1, per_bin).sum(axis=1)
+
+    def active_seconds(self):
+        return float(np.count_nonzero(self.active) * COVER_RESOLUTION)
+
+    def peak_windows(self, window=PEAK_WINDOW, count=PEAK_COUNT):
+        # Densest non-overlapping windows as [{"start", "end", "events"}]
+        width = max(1, int(round(window / RESOLUTION)))
+        counts = self.counts[:self.n_bins]
+        if len(counts) == 0:
+            return []
+        # Events in the window starting at each bin
+        total = np.concatenate([[0], np.cumsum(counts, dtype=np.int64)])
+        sums = total[width:] - total[:-width] if len(counts) >= width else total[-1:]
+        peaks = []
+        while len(peaks) < count:
+            i = int(np.argmax(sums))
+            if sums[i] <= 0:
+                break
+            peaks.append({"start": round(i * RESOLUTION, 3), "end": round((i + width) * RESOLUTION, 3),
+                          "events": int(sums[i])})
+            sums[max(0, i - width + 1):i + width] = -1  # no overlap with later picks
+        return peaks
+
+
+def analyse(path, window=PEAK_WINDOW, chunk_size=CHUNK_SIZE):
+    # Validation issues and statistics of one .ahap, in a single streaming pass
+    header = {}
+    stats = PatternStats()
+    types, issue_counts, issues = {}, {}, []
+    entries = curves = points = errors = 0
+    last_time = None
+    out_of_order = 0
+    with stage('ahap_stats') as timer:
+        for index, entry in enumerate(iter_pattern(path, header, chunk_size)):
+            entries += 1
+            found = validate_entry(entry, index)
+            body = next(iter(entry.values())) if isinstance(entry, dict) and entry else None
+            time = body.get("Time") if isinstance(body, dict) else None
+            if _number(time):
+                if last_time is not None and time < last_time:
+                    out_of_order += 1
+                    found.append(('warning', 'out_of_order', f"Pattern[{index}]: Time {time} < previous {last_time}"))
+                last_time = time
+            for severity, code, message in found:
+                issue_counts[code] = issue_counts.get(code, 0) + 1
+                if len(issues) < MAX_ISSUES:
+                    issues.append({"severity": severity, "code": code, "message": message})
+            if any(severity == 'error' for severity, _, _ in found):
+                errors += 1
+                continue
+
+            if "Event" in entry:
+                event_type = body["EventType"]
+                types[event_type] = types.get(event_type, 0) + 1
+                duration = body.get("EventDuration", 0.0) if event_type.endswith("Continuous") else 0.0
+                stats.add(time, time + (duration or TRANSIENT_SEC))
+            elif "ParameterCurve" in entry:
+                curves += 1
+                points += len(body["ParameterCurveControlPoints"])
+        stats.flush()
+        timer.items = entries
+
+    per_second = stats.per_second()
+    n_events = sum(types.values())
+    duration = stats.end
+    edges = list(RATE_BINS) + [np.inf]
+    histogram, _ = np.histogram(per_second, bins=edges) if len(per_second) else (np.zeros(len(RATE_BINS)), None)
+    return {
+        "file": path,
+        "version": header.get("Version"),
+        "entries": entries,
+        "events": n_events,
+        "event_types": types,
+        "curves": curves,
+        "curve_points": points,
+        "duration": round(duration, 3),
+        "active_seconds": round(stats.active_seconds(), 3),
+        "mean_events_per_second": n_events / duration if duration else 0.0,
+        "max_events_per_second": int(per_second.max()) if len(per_second) else 0,
+        "events_per_second": per_second.tolist(),
+        "rate_histogram": [{"from": lo, "to": None if hi == np.inf else hi, "seconds": int(n)}
+                           for lo, hi, n in zip(edges[:-1], edges[1:], histogram)],
+        "peak_windows": stats.peak_windows(window),
+        "time_ordered": out_of_order == 0,
+        "invalid_entries": errors,
+        "valid": errors == 0,
+        "issue_counts": issue_counts,
+        "issues": issues,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Validate an AHAP file and report event statistics.")
+    parser.add_argument('ahap')
+    parser.add_argument('--window', type=float, default=PEAK_WINDOW, help="seconds per peak density window")
+    parser.add_argument('--json', help="write the full report here")
+    args = parser.parse_args()
+
+    report = analyse(args.ahap, args.window)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(f"{report['file']}: {report['entries']} entries, {report['events']} events "
+          f"({', '.join(f'{n} {t}' for t, n in report['event_types'].items())}), "
+          f"{report['curves']} curves / {report['curve_points']} points")
+    print(f"  {report['duration']:.1f} s, {report['active_seconds']:.1f} s active, "
+          f"{report['mean_events_per_second']:.1f} events/s mean, {report['max_events_per_second']} max")
+    for bucket in report['rate_histogram']:
+        if bucket['seconds']:
+            upper = f"{bucket['to']}" if bucket['to'] is not None else "+"
+            print(f"  {bucket['from']:>4}-{upper:<4} events/s: {bucket['seconds']} s")
+    for peak in report['peak_windows']:
+        print(f"  peak {peak['start']:.2f}-{peak['end']:.2f} s: {peak['events']} events")
+    print(f"  {'valid' if report['valid'] else 'INVALID'}, {'time-ordered' if report['time_ordered'] else 'not time-ordered'}")
+    for code, n in sorted(report['issue_counts'].items()):
+        print(f"  {n:8d} x {code}")
+    for issue in report['issues'][:10]:
+        print(f"  {issue['severity']}: {issue['message']}")
+    sys.exit(0 if report['valid'] else 1)
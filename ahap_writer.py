@@ -0,0 +1,114 @@
+# Streaming AHAP writer.
+#
+# Writes pattern entries to the file as they come instead of building the
+# whole {"Version": ..., "Pattern": [...]} tree and handing it to json.dump.
+# With the defaults the output is byte-identical to json.dump(ahap, f, indent=2);
+# minify=True drops all whitespace and decimals=N writes floats with at most
+# N decimals. EventTable rows are formatted straight from their columns.
+
+import json
+import os
+from contextlib import nullcontext
+
+from event_table import EventTable, EVENT_TYPES, CONTINUOUS
+from instrument import stage
+
+CHUNK_ROWS = 4096  # table rows formatted per write
+
+
+def _round_floats(obj, decimals):
+    if isinstance(obj, float):
+        return round(obj, decimals)
+    if isinstance(obj, dict):
+        return {k: _round_floats(v, decimals) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_round_floats(v, decimals) for v in obj]
+    return obj
+
+
+class _Format:
+    def __init__(self, minify):
+        if minify:
+            self.dump_kwargs = {"separators": (",", ":")}
+            self.indent = ""
+        else:
+            self.dump_kwargs = {"indent": 2}
+            self.indent = "\n    "  # entries sit two levels deep
+        self._templates = {}
+
+    def entry(self, entry):
+        return json.dumps(entry, **self.dump_kwargs).replace("\n", self.indent)
+
+    def row_template(self, event_type, has_duration):
+        # Layout of one table row, taken from json.dumps itself so both paths agree
+        key = (event_type, has_duration)
+        if key not in self._templates:
+            event = {"Time": "@0", "EventType": EVENT_TYPES[event_type]}
+            if has_duration:
+                event["EventDuration"] = "@1"
+            event["EventParameters"] = [
+                {"ParameterID": "HapticIntensity", "ParameterValue": "@2"},
+                {"ParameterID": "HapticSharpness", "ParameterValue": "@3"}
+            ]
+            text = self.entry({"Event": event}).replace("{", "{{").replace("}", "}}")
+            for i in range(4):
+                text = text.replace(f'"@{i}"', "{%d!r}" % i)
+            self._templates[key] = text
+        return self._templates[key]
+
+
+def _table_rows(table, fmt, decimals):
+    for start in range(0, len(table), CHUNK_ROWS):
+        stop = start + CHUNK_ROWS
+        columns = zip(table.time[start:stop].tolist(), table.event_type[start:stop].tolist(),
+                      table.duration[start:stop].tolist(), table.intensity[start:stop].tolist(),
+                      table.sharpness[start:stop].tolist())
+        rows = []
+        for t, event_type, duration, inten, sharp in columns:
+            t = round(t, 3)
+            if decimals is not None:
+                t, duration = round(t, decimals), round(duration, decimals)
+                inten, sharp = round(inten, decimals), round(sharp, decimals)
+            template = fmt.row_template(event_type, event_type == CONTINUOUS or duration > 0)
+            rows.append(template.format(t, duration, inten, sharp))
+        yield rows
+
+
+def _entry_chunks(pattern, fmt, decimals):
+    if isinstance(pattern, EventTable):
+        pattern = [pattern]
+    for entry in pattern:
+        if isinstance(entry, EventTable):
+            yield from _table_rows(entry, fmt, decimals)
+        else:
+            if decimals is not None:
+                entry = _round_floats(entry, decimals)
+            yield [fmt.entry(entry)]
+
+
+def write_ahap(path, pattern, minify=False, decimals=None, version=1):
+    # pattern: an EventTable, or an iterable of AHAP pattern entries (dicts) and/or EventTables.
+    # path may also be an open text file (e.g. io.StringIO). Returns the number of bytes written.
+    fmt = _Format(minify)
+    if minify:
+        head = '{"Version":%d,"Pattern":[' % version
+        first_sep, sep, tail, empty_tail = "", ",", "]}", "]}"
+    else:
+        head = '{\n  "Version": %d,\n  "Pattern": [' % version
+        first_sep, sep, tail, empty_tail = "\n    ", ",\n    ", "\n  ]\n}", "]\n}"
+
+    with stage('write_ahap', minify=minify, decimals=decimals) as timer:
+        written = 0
+        with open(path, "w") if isinstance(path, (str, bytes, os.PathLike)) else nullcontext(path) as f:
+            written += f.write(head)
+            n_entries = 0
+            for rows in _entry_chunks(pattern, fmt, decimals):
+                if not rows:
+                    continue
+                text = (sep if n_entries else first_sep) + sep.join(rows)
+                written += f.write(text)
+                n_entries += len(rows)
+            written += f.write(tail if n_entries else empty_tail)
+        timer.items = n_entries
+        timer.info['bytes'] = written
+    return written
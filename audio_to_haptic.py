@@ -1,44 +1,73 @@
 import librosa
 import numpy as np
-import json
+
+from features import load_features, BANDS
+from event_table import EventTable
+from onsets import onset_events, ONSET_HOP
+from bands import band_events
+from ahap_writer import write_ahap
+from instrument import stage
 
 audio_file = 'audio.wav'
-y, sr = librosa.load(audio_file, sr=44100, mono=True)
+output_ahap = 'pattern_generated.ahap'
+sr = 44100
 
 frame_length = 2048  # ~50ms
 hop_length = 1024    # ~25ms
 
-# Compute root-mean-square energy (loudness)
-rms = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=hop_length)[0]
+mode = 'frames'        # 'frames': one transient per hop; 'onsets': one per detected attack;
+                       # 'bands': low-band rumble plus high-band transients (bands.py)
+stereo = False         # bands mode: analyse each channel instead of a mono downmix
+
+minify = False         # compact AHAP without whitespace
+float_decimals = None  # e.g. 4 to cap float precision in the output
+
+
+def audio_events(audio_file=audio_file, mode=mode, stereo=stereo):
+    # EventTable of haptic events for one audio file
+    if mode == 'bands':
+        # Band energies and fluxes come out of the same STFT as RMS and centroid
+        feats = load_features(audio_file, sr=sr, frame_length=frame_length, hop_length=hop_length,
+                              bands=BANDS, stereo=stereo)
+        with stage('events', mode=mode) as timer:
+            events = band_events(feats, sr=sr, hop_length=hop_length)
+            timer.items = len(events)
+        return events
+
+    if mode == 'onsets':
+        # Transients only where the spectral flux rises above its adaptive threshold
+        feats = load_features(audio_file, sr=sr, frame_length=frame_length, hop_length=ONSET_HOP)
+        with stage('events', mode=mode) as timer:
+            events = onset_events(feats, sr=sr, hop_length=ONSET_HOP)
+            timer.items = len(events)
+        return events
+
+    # Root-mean-square energy (loudness) and spectral centroid (brightness),
+    # computed block by block and cached per audio file
+    feats = load_features(audio_file, sr=sr, frame_length=frame_length, hop_length=hop_length)
+    rms, cent = feats['rms'], feats['centroid']
 
-# Compute spectral centroid (brightness)
-cent = librosa.feature.spectral_centroid(y=y, sr=sr, n_fft=frame_length, hop_length=hop_length)[0]
+    times = librosa.frames_to_time(np.arange(len(rms)), sr=sr, hop_length=hop_length, n_fft=frame_length)
 
-times = librosa.frames_to_time(np.arange(len(rms)), sr=sr, hop_length=hop_length, n_fft=frame_length)
+    # Normalize to [0, 1]
+    intensity = (rms - rms.min()) / (rms.max() - rms.min() + 1e-6)
+    sharpness = (cent - cent.min()) / (cent.max() - cent.min() + 1e-6)
 
-# Normalize to [0, 1]
-intensity = (rms - rms.min()) / (rms.max() - rms.min() + 1e-6)
-sharpness = (cent - cent.min()) / (cent.max() - cent.min() + 1e-6)
+    # One transient per frame, built column-wise
+    with stage('events', mode=mode) as timer:
+        events = EventTable(times, intensity, sharpness)
+        timer.items = len(events)
+    return events
 
-ahap_events = []
-for t, inten, sharp in zip(times, intensity, sharpness):
-    ahap_events.append({
-        "Event": {
-            "Time": round(float(t), 3),
-            "EventType": "HapticTransient",
-            "EventParameters": [
-                {"ParameterID": "HapticIntensity", "ParameterValue": float(inten)},
-                {"ParameterID": "HapticSharpness", "ParameterValue": float(sharp)}
-            ]
-        }
-    })
 
-ahap = {
-    "Version": 1,
-    "Pattern": ahap_events
-}
+def generate(audio_file=audio_file, output_ahap=output_ahap, mode=mode, minify=minify, decimals=float_decimals,
+             stereo=stereo):
+    # Returns (n_events, n_bytes)
+    events = audio_events(audio_file, mode, stereo)
+    n_bytes = write_ahap(output_ahap, events, minify=minify, decimals=decimals)
+    return len(events), n_bytes
 
-with open("pattern_generated.ahap", "w") as f:
-    json.dump(ahap, f, indent=2)
 
-print(f"Generated pattern_generated.ahap with {len(ahap_events)} events.")
+if __name__ == '__main__':
+    n_events, n_bytes = generate()
+    print(f"Generated {output_ahap} with {n_events} events ({n_bytes} bytes).")
@@ -0,0 +1,83 @@
+# Multi-band haptics.
+#
+# The dense mapping (audio_to_haptic.py) summarizes each frame with one RMS
+# and one spectral centroid, so a kick drum and a hi-hat both end up as
+# generic transients. Here the spectrum is split into bands (features.BANDS:
+# sub, bass, mid, high) taken from the same STFT as the other features:
+#
+# - low-band (sub + bass) energy drives continuous rumble, one event per
+#   RUMBLE_SEC slice loud enough to feel; the sub share of the slice sets how
+#   dull it is
+# - high-band flux drives sharp transients, picked with the adaptive onset
+#   threshold of onsets.py
+#
+# Stereo features (load_features(..., stereo=True)) are mapped per channel
+# and the louder channel wins frame by frame, so bass that cancels in a mono
+# downmix still rumbles.
+
+import numpy as np
+
+from event_table import EventTable, CONTINUOUS
+from features import BANDS
+from onsets import onset_frames
+
+LOW_BANDS = ('sub', 'bass')
+HIGH_BANDS = ('high',)
+RUMBLE_SEC = 0.1                 # rumble resolution
+RUMBLE_THRESHOLD = 0.15          # low-band energy (fraction of its peak) below which nothing rumbles
+RUMBLE_SHARPNESS = (0.0, 0.4)    # all sub .. all bass
+TRANSIENT_SHARPNESS = (0.6, 1.0)  # quietest .. brightest high band
+
+
+def _band_rows(names, bands=BANDS):
+    return [i for i, (name, _, _) in enumerate(bands) if name in names]
+
+
+def _normalize(x):
+    return (x - x.min()) / (x.max() - x.min() + 1e-6)
+
+
+def rumble_events(band_energy, sr=44100, hop_length=1024, bands=BANDS, slice_sec=RUMBLE_SEC,
+                  threshold=RUMBLE_THRESHOLD):
+    # Continuous events tiling the track in slice_sec steps where the low
+    # bands carry energy; band_energy is (n_bands, n_frames)
+    low_rows = _band_rows(LOW_BANDS, bands)
+    power = band_energy[low_rows] ** 2
+    per_slice = max(1, int(round(slice_sec * sr / hop_length)))
+    starts = np.arange(0, band_energy.shape[-1], per_slice)
+    if len(starts) == 0:
+        return EventTable([], [], [])
+    counts = np.diff(np.append(starts, band_energy.shape[-1]))
+    low = np.add.reduceat(np.sqrt(power.sum(axis=0)), starts) / counts
+    sub_share = np.add.reduceat(power[0], starts) / (np.add.reduceat(power.sum(axis=0), starts) + 1e-12)
+
+    # Scaled by the peak only: a steady bass bed should rumble, not normalize away
+    intensity = low / (low.max() + 1e-12)
+    keep = intensity > threshold
+    lo, hi = RUMBLE_SHARPNESS
+    sharpness = lo + (hi - lo) * (1.0 - sub_share)
+    return EventTable(starts * hop_length / sr, intensity, sharpness, CONTINUOUS,
+                      counts * hop_length / sr).select(keep)
+
+
+def transient_events(band_energy, band_flux, sr=44100, hop_length=1024, bands=BANDS, **threshold):
+    # One sharp transient per high-band flux onset
+    high_rows = _band_rows(HIGH_BANDS, bands)
+    flux = band_flux[high_rows].mean(axis=0)
+    energy = np.sqrt((band_energy[high_rows] ** 2).sum(axis=0))
+    peaks = onset_frames(flux, sr, hop_length, **threshold)
+    lo, hi = TRANSIENT_SHARPNESS
+    return EventTable(peaks * hop_length / sr, flux[peaks] / (flux.max() + 1e-12),
+                      lo + (hi - lo) * _normalize(energy)[peaks])
+
+
+def band_events(feats, sr=44100, hop_length=1024, bands=BANDS, **threshold):
+    # Time-sorted EventTable of rumble and transients from a
+    # load_features(..., bands=bands) dict, mono or stereo
+    energy, flux = feats['band_energy'], feats['band_flux']
+    if energy.ndim == 3:
+        energy, flux = energy.max(axis=0), flux.max(axis=0)
+    return EventTable.concat([
+        rumble_events(energy, sr, hop_length, bands),
+        transient_events(energy, flux, sr, hop_length, bands, **threshold),
+    ]).sorted()
@@ -0,0 +1,229 @@
+# Batch driver: run the full video -> audio -> YAMNet timeline -> hybrid AHAP
+# pipeline over a directory (or manifest) of videos in a process pool.
+#
+# Every video gets its own output directory, YAMNet is loaded once per worker,
+# and a throughput summary is printed and saved as batch_summary.json. The
+# pattern is generated on the audio's timeline; with --sync it is also
+# aligned to the video's frame timing (sync.py) as pattern_synced.ahap. A
+# failed alignment is recorded in the job's summary and keeps the unaligned
+# pattern as the output.
+#
+#   python batch.py videos/ -o out/ -j 4
+#   python batch.py manifest.txt -o out/     (one video path per line)
+#   python batch.py videos/ --pipe           (no intermediate audio.wav)
+#   python batch.py videos/ --sync           (also write pattern_synced.ahap)
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.mkv', '.avi', '.webm', '.m4v')
+STAGES = ('extract', 'classify', 'generate', 'sync')
+
+# Per-worker state, filled in by _init_worker
+_model = None
+_class_map = None
+
+
+def find_videos(source):
+    # Videos in a directory, or the paths listed in a manifest file
+    if os.path.isdir(source):
+        return sorted(os.path.join(source, name) for name in os.listdir(source)
+                      if name.lower().endswith(VIDEO_EXTENSIONS))
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source) as f:
+        lines = [line.strip() for line in f]
+    return [os.path.join(base, line) for line in lines if line and not line.startswith('#')]
+
+
+def job_names(videos):
+    # Unique output directory name per video, even when stems collide
+    names, seen = [], {}
+    for video in videos:
+        stem = os.path.splitext(os.path.basename(video))[0]
+        seen[stem] = seen.get(stem, 0) + 1
+        names.append(stem if seen[stem] == 1 else f"{stem}_{seen[stem]}")
+    return names
+
+
+def _init_worker(tf_threads):
+    global _model, _class_map
+    import tensorflow as tf
+    if tf_threads:
+        # Keep workers from oversubscribing the cores between them
+        tf.config.threading.set_intra_op_parallelism_threads(tf_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    import yamnet_to_json
+    _class_map = yamnet_to_json.load_class_map()
+    _model = yamnet_to_json.load_model()
+
+
+def sync_output(video_file, job_dir, result):
+    # Align the job's pattern to the video; on failure the result keeps the
+    # unaligned pattern and records the error
+    from sync import align_file
+    synced_ahap = os.path.join(job_dir, 'pattern_synced.ahap')
+    t0 = time.perf_counter()
+    try:
+        result["sync"] = align_file(video_file, result["output"], synced_ahap)
+        result["output"] = synced_ahap
+    except Exception as e:
+        result["sync_error"] = repr(e)
+    result["stages"]['sync'] = time.perf_counter() - t0
+    return result
+
+
+def process_video(video_file, job_dir, sync=False):
+    import soundfile as sf
+    import yamnet_to_json
+    from extract_audio import extract_audio
+    from scores import scores_path
+    from test import generate
+
+    os.makedirs(job_dir, exist_ok=True)
+    audio_file = os.path.join(job_dir, 'audio.wav')
+    yamnet_file = os.path.join(job_dir, 'yamnet_timeline.json')
+    output_ahap = os.path.join(job_dir, 'pattern_hybrid.ahap')
+    stages = {}
+
+    t0 = time.perf_counter()
+    extract_audio(video_file, audio_file, quiet=True)
+    stages['extract'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    timeline = yamnet_to_json.audio_timeline(_model, audio_file, _class_map,
+                                             scores_file=scores_path(yamnet_file))
+    with open(yamnet_file, 'w') as f:
+        json.dump(timeline, f, indent=2)
+    stages['classify'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    n_events, n_bytes = generate(audio_file, yamnet_file, output_ahap)
+    stages['generate'] = time.perf_counter() - t0
+
+    result = {
+        "video": video_file,
+        "output": output_ahap,
+        "audio_seconds": sf.info(audio_file).duration,
+        "events": n_events,
+        "bytes": n_bytes,
+        "stages": stages,
+    }
+    return sync_output(video_file, job_dir, result) if sync else result
+
+
+def process_video_piped(video_file, job_dir, sync=False, sr=44100):
+    # Same pipeline without the intermediate audio.wav: one ffmpeg decode feeds
+    # both the feature pass and YAMNet straight from pipes
+    import yamnet_to_json
+    from extract_audio import pipe_audio, YAMNET_SR
+    from scores import scores_path
+    from test import generate, engine_frame_params
+
+    os.makedirs(job_dir, exist_ok=True)
+    yamnet_file = os.path.join(job_dir, 'yamnet_timeline.json')
+    output_ahap = os.path.join(job_dir, 'pattern_hybrid.ahap')
+    stages = {}
+
+    # The timeline windows are YAMNet's hop, so its frame size is known before classifying
+    window_params = (int(yamnet_to_json.hop_duration * sr),) * 2
+    t0 = time.perf_counter()
+    tracks, wav = pipe_audio(video_file, (window_params, engine_frame_params(sr)), sr=sr)
+    stages['extract'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    timeline = yamnet_to_json.wav_timeline(_model, wav, _class_map, scores_file=scores_path(yamnet_file))
+    with open(yamnet_file, 'w') as f:
+        json.dump(timeline, f, indent=2)
+    stages['classify'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    n_events, n_bytes = generate(None, yamnet_file, output_ahap, feats=tracks[window_params],
+                                 engine_feats=tracks[engine_frame_params(sr)])
+    stages['generate'] = time.perf_counter() - t0
+
+    result = {
+        "video": video_file,
+        "output": output_ahap,
+        "audio_seconds": len(wav) / YAMNET_SR,
+        "events": n_events,
+        "bytes": n_bytes,
+        "stages": stages,
+    }
+    return sync_output(video_file, job_dir, result) if sync else result
+
+
+def run_batch(videos, out_dir, workers=None, tf_threads=1, pipe=False, sync=False):
+    os.makedirs(out_dir, exist_ok=True)
+    results, failures = [], []
+    t_start = time.perf_counter()
+    # spawn: TensorFlow is not fork-safe
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('spawn'),
+                             initializer=_init_worker, initargs=(tf_threads,)) as pool:
+        job = process_video_piped if pipe else process_video
+        futures = {pool.submit(job, video, os.path.join(out_dir, name), sync): video
+                   for video, name in zip(videos, job_names(videos))}
+        for future in as_completed(futures):
+            video = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failures.append({"video": video, "error": repr(e)})
+                print(f"FAILED {video}: {e!r}")
+                continue
+            results.append(result)
+            print(f"done   {video} -> {result['output']} "
+                  f"({result['events']} events, {sum(result['stages'].values()):.1f} s)")
+            if "sync_error" in result:
+                print(f"       not aligned to the video: {result['sync_error']}")
+    wall = time.perf_counter() - t_start
+    return summarize(results, failures, wall)
+
+
+def summarize(results, failures, wall):
+    stage_totals = {stage: sum(r['stages'].get(stage, 0.0) for r in results) for stage in STAGES}
+    audio_seconds = sum(r['audio_seconds'] for r in results)
+    return {
+        "videos": len(results),
+        "failed": len(failures),
+        "sync_failed": sum("sync_error" in r for r in results),
+        "wall_seconds": wall,
+        "videos_per_hour": len(results) / wall * 3600 if wall > 0 else 0.0,
+        "audio_hours_per_hour": audio_seconds / wall if wall > 0 else 0.0,
+        "stage_seconds": stage_totals,
+        "stage_mean_seconds": {stage: total / len(results) if results else 0.0
+                               for stage, total in stage_totals.items()},
+        "jobs": results,
+        "failures": failures,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate hybrid AHAP patterns for many videos in parallel.")
+    parser.add_argument('source', help="directory of videos or a manifest file with one path per line")
+    parser.add_argument('-o', '--out-dir', default='batch_out')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--tf-threads', type=int, default=1, help="TensorFlow threads per worker (0 = TF default)")
+    parser.add_argument('--pipe', action='store_true', help="decode through pipes instead of writing audio.wav")
+    parser.add_argument('--sync', action='store_true',
+                        help="also align each pattern to its video's frame timing (pattern_synced.ahap)")
+    args = parser.parse_args(argv)
+
+    videos = find_videos(args.source)
+    summary = run_batch(videos, args.out_dir, args.workers, args.tf_threads, args.pipe, args.sync)
+    with open(os.path.join(args.out_dir, 'batch_summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"\n{summary['videos']} videos ({summary['failed']} failed) in {summary['wall_seconds']:.1f} s "
+          f"-> {summary['videos_per_hour']:.1f} videos/hour, "
+          f"{summary['audio_hours_per_hour']:.1f} h of audio per hour")
+    for stage in STAGES:
+        print(f"  {stage:<9} total {summary['stage_seconds'][stage]:8.1f} s   "
+              f"mean {summary['stage_mean_seconds'][stage]:6.2f} s/video")
+
+
+if __name__ == '__main__':
+    main()
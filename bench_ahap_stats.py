@@ -0,0 +1,63 @@
+# Benchmark: streaming validation and statistics (ahap_stats.py) vs.
+# json.load of the whole pattern, on a long synthetic AHAP. Each side runs in
+# its own process so peak RSS is its own.
+#
+#   python bench_ahap_stats.py        # 4 h, ~300 MB
+#   python bench_ahap_stats.py 1      # hours
+
+import os
+import subprocess
+import sys
+import tempfile
+import numpy as np
+
+from ahap_writer import write_ahap
+from event_table import EventTable
+from patterns import library, expand
+
+hours = float(sys.argv[1]) if len(sys.argv) > 1 else 4.0
+hop = 1024 / 44100
+
+# Each prints "<seconds> <peak RSS bytes>"
+STREAMING = """
+import resource, sys, time
+from ahap_stats import analyse
+t0 = time.perf_counter()
+report = analyse(sys.argv[1])
+print(time.perf_counter() - t0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, report['events'])
+"""
+JSON_LOAD = """
+import json, resource, sys, time
+t0 = time.perf_counter()
+with open(sys.argv[1]) as f:
+    pattern = json.load(f)["Pattern"]
+n = sum("Event" in e for e in pattern)
+print(time.perf_counter() - t0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, n)
+"""
+
+
+def synthetic_pattern(hours, seed=0):
+    # audio_to_haptic.py-style transients every hop plus a rumble every 10 s
+    rng = np.random.default_rng(seed)
+    n = int(hours * 3600 / hop)
+    table = EventTable(np.arange(n) * hop, rng.random(n), rng.random(n))
+    rumble = library(None)['rumble']
+    effects = expand([(rumble, float(t)) for t in np.arange(0, hours * 3600, 10.0)])
+    return [table] + effects
+
+
+def run(script, path):
+    out = subprocess.run([sys.executable, '-c', script, path], check=True, capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+    return float(out[0]), int(out[1]), int(out[2])
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'long.ahap')
+        write_ahap(path, synthetic_pattern(hours))
+        print(f"{hours:g} h pattern, {os.path.getsize(path) / 1e6:.0f} MB")
+        print(f"{'':<22}{'runtime':>10}{'peak RSS':>12}{'events':>10}")
+        for name, script in (('json.load', JSON_LOAD), ('ahap_stats (stream)', STREAMING)):
+            seconds, rss, n = run(script, path)
+            print(f"{name:<22}{seconds:9.2f}s{rss / 2 ** 20:10.0f}MB{n:10d}")
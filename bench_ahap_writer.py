@@ -0,0 +1,57 @@
+# Benchmark: json.dump on a materialized AHAP dict vs. the streaming writer (ahap_writer.py)
+
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+from event_table import EventTable
+from ahap_writer import write_ahap
+
+# ~23 ms hop as in audio_to_haptic.py; default is about 1 hour of transients
+n_events = int(sys.argv[1]) if len(sys.argv) > 1 else 150_000
+
+rng = np.random.default_rng(0)
+times = np.arange(n_events) * 1024 / 44100
+events = EventTable(times, rng.random(n_events, dtype=np.float32), rng.random(n_events))
+
+
+def json_dump(path):
+    ahap = {"Version": 1, "Pattern": events.to_ahap_events()}
+    with open(path, "w") as f:
+        json.dump(ahap, f, indent=2)
+    return os.path.getsize(path)
+
+
+cases = [
+    ("json.dump indent=2", json_dump),
+    ("write_ahap", lambda path: write_ahap(path, events)),
+    ("write_ahap minify", lambda path: write_ahap(path, events, minify=True)),
+    ("write_ahap minify, 4 dp", lambda path: write_ahap(path, events, minify=True, decimals=4)),
+    ("write_ahap minify, 3 dp", lambda path: write_ahap(path, events, minify=True, decimals=3)),
+]
+
+print(f"{n_events} transient events")
+print(f"{'writer':<26} {'time (s)':>9} {'size (MB)':>10} {'peak mem (MB)':>14}")
+with tempfile.TemporaryDirectory() as tmp:
+    reference = None
+    for name, write in cases:
+        path = os.path.join(tmp, "out.ahap")
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        n_bytes = write(path)
+        elapsed = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        with open(path) as f:
+            ahap = json.load(f)
+        if reference is None:
+            reference = ahap
+        elif "dp" not in name:
+            assert ahap == reference, name
+        assert len(ahap["Pattern"]) == n_events
+        print(f"{name:<26} {elapsed:9.2f} {n_bytes / 1e6:10.2f} {peak / 1e6:14.1f}")
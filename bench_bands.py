@@ -0,0 +1,121 @@
+# Benchmark: multi-band features (bands.py) vs. today's RMS / centroid pass.
+#
+# Synthetic stereo mix of kicks, hi-hats and a bass line that is out of phase
+# between the channels in its second half (it cancels in a mono downmix).
+# Reports feature-pass runtime and STFT calls per pass for:
+#   frames        today's path (audio_to_haptic.py mode='frames')
+#   bands         + sub / bass / mid / high energy and flux from the same STFT
+#   bands stereo  the same per channel, both channels in one STFT call
+#   filterbank    today's path + a Butterworth band-pass and RMS per band
+# and what the multi-band mapping makes of the mix.
+
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import librosa
+import scipy.signal
+import soundfile as sf
+
+import features
+from features import load_features, BANDS
+from bands import band_events
+from event_table import CONTINUOUS
+
+sr = 44100
+frame_length = 2048
+hop_length = 1024
+seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 300.0
+
+
+def synthetic_stereo(seconds, seed=0):
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sr)
+    t = np.arange(n) / sr
+    left, right = np.zeros(n), np.zeros(n)
+    kick = np.sin(2 * np.pi * 55 * t[:int(0.2 * sr)]) * np.exp(-t[:int(0.2 * sr)] / 0.05)
+    hat = rng.standard_normal(int(0.03 * sr)) * np.exp(-t[:int(0.03 * sr)] / 0.005)
+    hat = scipy.signal.sosfilt(scipy.signal.butter(4, 6000, 'highpass', fs=sr, output='sos'), hat)
+    for beat in np.arange(0.0, seconds - 0.5, 0.5):
+        i = int(beat * sr)
+        left[i:i + len(kick)] += kick
+        right[i:i + len(kick)] += kick
+        j = int((beat + 0.25) * sr)
+        pan = rng.uniform(0.2, 0.8)
+        left[j:j + len(hat)] += (1 - pan) * hat
+        right[j:j + len(hat)] += pan * hat
+    bass = 0.3 * np.sin(2 * np.pi * 82.4 * t)
+    polarity = np.where(t < seconds / 2, 1.0, -1.0)  # out of phase in the second half
+    left += bass
+    right += polarity * bass
+    y = np.stack([left, right], axis=1)
+    return (0.8 * y / np.abs(y).max()).astype(np.float32)
+
+
+def filterbank(audio_file):
+    # Reference approach: one band-pass filter and RMS track per band on the mono mix
+    y, _ = librosa.load(audio_file, sr=sr, mono=True)
+    tracks = []
+    for _, lo, hi in BANDS:
+        if hi is None:
+            sos = scipy.signal.butter(4, lo, 'highpass', fs=sr, output='sos')
+        else:
+            sos = scipy.signal.butter(4, [lo, hi], 'bandpass', fs=sr, output='sos')
+        tracks.append(librosa.feature.rms(y=scipy.signal.sosfilt(sos, y), frame_length=frame_length,
+                                          hop_length=hop_length)[0])
+    return np.stack(tracks)
+
+
+def count_stft(fn):
+    # (result, seconds, STFT calls counted per channel) for one run of fn
+    calls = [0]
+    stft = librosa.stft
+
+    def counted(y, **kwargs):
+        calls[0] += 1 if np.ndim(y) == 1 else np.shape(y)[0]
+        return stft(y, **kwargs)
+
+    features.librosa.stft = counted
+    try:
+        t0 = time.perf_counter()
+        result = fn()
+        return result, time.perf_counter() - t0, calls[0]
+    finally:
+        features.librosa.stft = stft
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp:
+        audio_file = os.path.join(tmp, 'mix.wav')
+        sf.write(audio_file, synthetic_stereo(seconds), sr)
+        load_features(audio_file, sr=sr, cache_dir=None)  # warm up
+
+        def pass_of(**kwargs):
+            return lambda: load_features(audio_file, sr=sr, frame_length=frame_length, hop_length=hop_length,
+                                         cache_dir=None, **kwargs)
+
+        runs = [
+            ('frames', pass_of()),
+            ('bands', pass_of(bands=BANDS)),
+            ('bands stereo', pass_of(bands=BANDS, stereo=True)),
+            ('filterbank', lambda: (pass_of()(), filterbank(audio_file))),
+        ]
+        print(f"{seconds:.0f} s stereo mix, {frame_length}/{hop_length} frames")
+        print(f"{'pass':<14}{'runtime':>10}{'STFT passes':>13}")
+        n_blocks = None
+        results = {}
+        for name, fn in runs:
+            results[name], elapsed, calls = count_stft(fn)
+            # load_features runs one STFT call per block (per channel)
+            n_blocks = n_blocks or calls
+            print(f"{name:<14}{elapsed:9.2f}s{calls / n_blocks:13.1f}")
+
+        print()
+        half = seconds / 2
+        for name in ('bands', 'bands stereo'):
+            events = band_events(results[name], sr=sr, hop_length=hop_length)
+            rumble = events.event_type == CONTINUOUS
+            late = events.time >= half
+            print(f"{name:<14} {int(rumble.sum()):6d} rumble slices ({int((rumble & late).sum())} in the "
+                  f"out-of-phase half), {int((~rumble).sum())} transients for {int(seconds / 0.5) - 1} hi-hats")
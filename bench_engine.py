@@ -0,0 +1,81 @@
+# Benchmark: per-window engine rumble (STFT per window, per-window normalization)
+# vs. one precomputed 100 ms track sliced per window (test.py make_engine)
+
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import librosa
+import soundfile as sf
+
+from features import load_features
+from test import build_engine_track, engine_frame_params, make_engine
+
+sr = 44100
+win_sec = 0.5
+minutes = float(sys.argv[1]) if len(sys.argv) > 1 else 10.0
+
+
+def synthetic_engine(seconds, seed=0):
+    # Low hum plus noise, with slow throttle swells so the level moves across windows
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    throttle = 0.55 + 0.45 * np.sin(2 * np.pi * t / 7.0)
+    rpm = 30 + 25 * throttle
+    hum = np.sin(2 * np.pi * np.cumsum(rpm) / sr) + 0.5 * np.sin(4 * np.pi * np.cumsum(rpm) / sr)
+    noise = rng.standard_normal(len(t))
+    return (0.3 * throttle * (hum + 0.3 * noise)).astype(np.float32)
+
+
+def make_engine_per_window(time, duration, y):
+    # Previous test.py behaviour: STFT on each window's slice, normalized by its own min/max
+    chunk_frame, chunk_hop = engine_frame_params(sr)
+    y_chunk = y[int(time * sr):int((time + duration) * sr)]
+    rms = librosa.feature.rms(y=y_chunk, frame_length=chunk_frame, hop_length=chunk_hop)[0]
+    cent = librosa.feature.spectral_centroid(y=y_chunk, sr=sr, n_fft=chunk_frame, hop_length=chunk_hop)[0]
+    inten = (rms - rms.min()) / (rms.max() - rms.min() + 1e-6)
+    sharp = (cent - cent.min()) / (cent.max() - cent.min() + 1e-6)
+    return [(round(time + i * 0.1, 3), float(a), float(b)) for i, (a, b) in enumerate(zip(inten, sharp))]
+
+
+def boundary_jump(events, win_sec):
+    # Mean |intensity step| between consecutive events, at window boundaries vs. inside windows
+    events = sorted(events)
+    times = np.array([e[0] for e in events])
+    inten = np.array([e[1] for e in events])
+    steps = np.abs(np.diff(inten))
+    at_boundary = np.isclose(np.mod(times[1:] + 1e-6, win_sec), 0, atol=1e-3)
+    return steps[at_boundary].mean(), steps[~at_boundary].mean()
+
+
+y = synthetic_engine(minutes * 60)
+timeline = [{"time": round(i * win_sec, 2), "label": "Vehicle", "confidence": 1.0}
+            for i in range(int(len(y) / sr / win_sec) - 1)]
+print(f"{minutes:.0f} min engine segment, {len(timeline)} Engine windows")
+
+t0 = time.perf_counter()
+before = []
+for entry in timeline:
+    before.extend(make_engine_per_window(entry['time'], win_sec, y))
+t_before = time.perf_counter() - t0
+
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, 'engine.wav')
+    sf.write(path, y, sr, subtype='FLOAT')
+    t0 = time.perf_counter()
+    engine_feats = load_features(path, sr, *engine_frame_params(sr), cache_dir=None)
+    track = build_engine_track(engine_feats, timeline, win_sec)
+    after = []
+    for entry in timeline:
+        for e in make_engine(entry['time'], win_sec, track):
+            params = e['Event']['EventParameters']
+            after.append((e['Event']['Time'], params[0]['ParameterValue'], params[1]['ParameterValue']))
+    t_after = time.perf_counter() - t0
+
+jump_before = boundary_jump(before, win_sec)
+jump_after = boundary_jump(after, win_sec)
+print(f"{'':<22} {'time (s)':>9} {'events':>8} {'boundary step':>14} {'inner step':>11}")
+print(f"{'per-window STFT':<22} {t_before:9.2f} {len(before):8d} {jump_before[0]:14.3f} {jump_before[1]:11.3f}")
+print(f"{'global 100 ms track':<22} {t_after:9.2f} {len(after):8d} {jump_after[0]:14.3f} {jump_after[1]:11.3f}")
+print(f"speedup: {t_before / t_after:.1f}x")
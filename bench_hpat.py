@@ -0,0 +1,67 @@
+# Benchmark: reloading and slicing a long pattern from AHAP JSON vs. the
+# columnar .hpat format (hpat.py)
+
+import json
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+from ahap_writer import write_ahap
+from event_table import EventTable
+from hpat import PatternFile, write_hpat
+from patterns import library, expand
+
+hours = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+hop = 1024 / 44100
+
+
+def synthetic_pattern(hours, seed=0):
+    # audio_to_haptic.py-style transients every hop plus a rumble every 10 s
+    rng = np.random.default_rng(seed)
+    n = int(hours * 3600 / hop)
+    table = EventTable(np.arange(n) * hop, rng.random(n), rng.random(n))
+    rumble = library(None)['rumble']
+    effects = expand([(rumble, float(t)) for t in np.arange(0, hours * 3600, 10.0)])
+    return [table] + effects
+
+
+def playing(entry, start, end):
+    # Starts in [start, end), or started earlier and is still playing at start
+    body = next(iter(entry.values()))
+    if "ParameterCurve" in entry:
+        stop = body["Time"] + body["ParameterCurveControlPoints"][-1]["Time"]
+    else:
+        stop = body["Time"] + body.get("EventDuration", 0.0)
+    return start <= body["Time"] < end or body["Time"] < start < stop
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - t0, result
+
+
+pattern = synthetic_pattern(hours)
+with tempfile.TemporaryDirectory() as tmp:
+    ahap_path, hpat_path = os.path.join(tmp, 'p.ahap'), os.path.join(tmp, 'p.hpat')
+    write_ahap(ahap_path, pattern)
+    t_convert, _ = timed(lambda: write_hpat(hpat_path, json.load(open(ahap_path))["Pattern"]))
+    mid = hours * 1800
+
+    t_json, ahap = timed(lambda: json.load(open(ahap_path)))
+    t_json_slice, json_slice = timed(lambda: [e for e in ahap["Pattern"] if playing(e, mid, mid + 10)])
+    t_open, pf = timed(lambda: PatternFile(hpat_path))
+    t_index, _ = timed(pf._max_end)  # built by the first slice
+    t_slice, hpat_slice = timed(lambda: pf.entries(mid, mid + 10))
+    t_events, events = timed(lambda: pf.events())
+    assert hpat_slice == json_slice
+
+    print(f"{hours:.0f} h pattern, {len(ahap['Pattern'])} entries; AHAP -> .hpat conversion {t_convert:.2f} s")
+    print(f"{'':<26} {'AHAP':>10} {'.hpat':>10}")
+    print(f"{'file size (MB)':<26} {os.path.getsize(ahap_path) / 1e6:10.1f} {os.path.getsize(hpat_path) / 1e6:10.1f}")
+    print(f"{'open (s)':<26} {t_json:10.3f} {t_open:10.4f}")
+    print(f"{'10 s slice (s)':<26} {t_json_slice:10.3f} {t_slice:10.4f}   ({len(hpat_slice)} entries; "
+          f"max-end index built once in {t_index:.3f} s)")
+    print(f"{'all events as columns (s)':<26} {'-':>10} {t_events:10.4f}   ({len(events)} events)")
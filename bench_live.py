@@ -0,0 +1,55 @@
+# Benchmark: latency and jitter of the live generator (live.py) against a
+# simulated real-time source, for a few block sizes.
+#
+# Latency is measured from the moment the sound an event represents (its frame
+# centre) is captured to the moment the event is emitted; it includes the
+# frame_length // 2 samples of look-ahead that centred framing needs.
+
+import asyncio
+import sys
+import time
+import numpy as np
+
+from features import _features
+import live
+
+sr = live.sr
+seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 20.0
+BLOCK_SIZES = (128, 256, 1024)
+TARGET_MS = 50.0
+
+
+def synthetic_audio(seconds, seed=0):
+    # Noise bursts over a tone with a slowly moving level
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    level = 0.2 + 0.15 * np.sin(2 * np.pi * t / 5.0)
+    bursts = (rng.random(len(t) // sr + 1)[t.astype(int)] > 0.6) * rng.standard_normal(len(t)) * 0.3
+    return (level * np.sin(2 * np.pi * 220 * t) + bursts).astype(np.float32)
+
+
+async def run(y, block_size):
+    start = time.perf_counter()
+    times, emitted = [], []
+    async for event in live.stream_haptics(live.simulated_blocks(y, sr, block_size, start)):
+        emitted.append(time.perf_counter() - start)
+        times.append(event['Event']['Time'])
+    return np.array(times), np.array(emitted)
+
+
+y = synthetic_audio(seconds)
+n_offline = len(_features(y, sr, live.frame_length, live.hop_length)[0][0])
+lookahead_ms = 1000 * (live.frame_length // 2) / sr
+print(f"{seconds:.0f} s simulated stream, {n_offline} frames, "
+      f"{lookahead_ms:.1f} ms framing look-ahead, target < {TARGET_MS:.0f} ms")
+print(f"{'block':>6} {'events':>7} {'mean ms':>8} {'p50 ms':>7} {'p99 ms':>7} {'max ms':>7} "
+      f"{'jitter ms':>10} {'< target':>9}")
+for block_size in BLOCK_SIZES:
+    times, emitted = asyncio.run(run(y, block_size))
+    # The final, zero-padded frames are flushed at end of stream
+    live_part = times <= (len(y) - live.frame_length // 2) / sr
+    latency = 1000 * (emitted - times)[live_part]
+    print(f"{block_size:6d} {len(times):7d} {latency.mean():8.1f} {np.percentile(latency, 50):7.1f} "
+          f"{np.percentile(latency, 99):7.1f} {latency.max():7.1f} {latency.std():10.2f} "
+          f"{100 * np.mean(latency < TARGET_MS):8.1f}%")
+    assert len(times) == n_offline
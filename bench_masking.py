@@ -0,0 +1,64 @@
+# Benchmark: per-frame linear scan vs. merged-interval searchsorted masking (hybrid.py)
+
+import time
+import numpy as np
+
+from timeline import label_intervals, merge_intervals, in_intervals
+
+sr = 44100
+frame_length = 2048
+hop_length = 1024
+win_sec = 0.5
+MASK_LABELS = ['Speech', 'Silence']
+LABELS = ['Speech', 'Silence', 'Music', 'Explosion', 'Vehicle']
+
+# Above this many frame x interval checks the old scan is skipped
+MAX_SCAN_WORK = 2e8
+
+
+def synthetic_timeline(seconds, seed=0):
+    rng = np.random.default_rng(seed)
+    n = int(seconds / win_sec)
+    labels = rng.choice(LABELS, size=n)
+    return [{"time": round(i * win_sec, 2), "label": str(label), "confidence": 0.5}
+            for i, label in enumerate(labels)]
+
+
+def mask_scan(times, timeline):
+    # Original hybrid.py approach
+    mask_intervals = [(e['time'], e['time'] + win_sec) for e in timeline if e['label'] in MASK_LABELS]
+
+    def is_masked(t):
+        for t0, t1 in mask_intervals:
+            if t0 <= t < t1:
+                return True
+        return False
+    return np.array([is_masked(t) for t in times], dtype=bool), len(mask_intervals)
+
+
+def mask_vectorized(times, timeline):
+    starts, ends = merge_intervals(*label_intervals(timeline, MASK_LABELS, win_sec))
+    return in_intervals(times, starts, ends)
+
+
+print(f"{'length':>8} {'frames':>9} {'intervals':>9} {'scan (s)':>10} {'vector (s)':>11} {'ns/frame':>9}")
+for minutes in (1, 5, 15, 30, 60, 120, 180):
+    seconds = minutes * 60
+    timeline = synthetic_timeline(seconds)
+    n_frames = 1 + seconds * sr // hop_length
+    times = (np.arange(n_frames) * hop_length + frame_length // 2) / sr
+
+    t0 = time.perf_counter()
+    fast = mask_vectorized(times, timeline)
+    t_vec = time.perf_counter() - t0
+
+    n_intervals = sum(e['label'] in MASK_LABELS for e in timeline)
+    if n_frames * n_intervals <= MAX_SCAN_WORK:
+        t0 = time.perf_counter()
+        slow, _ = mask_scan(times, timeline)
+        t_scan = f"{time.perf_counter() - t0:10.3f}"
+        assert np.array_equal(slow, fast)
+    else:
+        t_scan = f"{'skipped':>10}"
+
+    print(f"{minutes:>6}min {n_frames:>9} {n_intervals:>9} {t_scan} {t_vec:11.4f} {t_vec / n_frames * 1e9:9.1f}")
@@ -0,0 +1,92 @@
+# Benchmark: onset-driven transients (onsets.py) vs. one transient per hop
+# (audio_to_haptic.py) and fixed-height RMS peaks (extract_events.py).
+#
+# Synthetic mixes of percussive hits at known times over a sustained bed, at
+# several overall gains. Reports events/sec, runtime (feature pass included)
+# and how well the transients line up with the true hits.
+
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import scipy.signal
+import soundfile as sf
+
+from features import load_features
+from onsets import onset_events, ONSET_HOP
+
+sr = 44100
+frame_length = 2048
+seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 120.0
+GAINS = (0.05, 0.3, 1.0)   # quiet, typical and loud mixes
+TOLERANCE = 0.025          # seconds; a hit counts as matched within this distance
+
+
+def synthetic_mix(seconds, gain, seed=0):
+    # Decaying noise/tone hits at random times over a slowly swelling pad
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sr)
+    t = np.arange(n) / sr
+    y = 0.15 * (1 + 0.5 * np.sin(2 * np.pi * t / 9.0)) * np.sin(2 * np.pi * 110 * t)
+    hits = np.sort(rng.uniform(0.5, seconds - 0.5, size=int(seconds * 2)))
+    hits = hits[np.concatenate([[True], np.diff(hits) > 0.12])]
+    decay = np.exp(-np.arange(int(0.15 * sr)) / (0.03 * sr))
+    for h, level in zip(hits, rng.uniform(0.3, 1.0, size=len(hits))):
+        i = int(h * sr)
+        seg = level * decay * (rng.standard_normal(len(decay)) + np.sin(2 * np.pi * 180 * t[:len(decay)]))
+        y[i:i + len(seg)] += seg[:n - i]
+    return (gain * y / np.abs(y).max()).astype(np.float32), hits
+
+
+def score(times, hits):
+    # (recall, precision, mean |error| in ms over matched hits)
+    if len(times) == 0:
+        return 0.0, 0.0, float('nan')
+    idx = np.clip(np.searchsorted(times, hits), 1, len(times) - 1)
+    err = np.minimum(np.abs(times[idx] - hits), np.abs(times[idx - 1] - hits))
+    matched = err <= TOLERANCE
+    idx = np.clip(np.searchsorted(hits, times), 1, len(hits) - 1)
+    near = np.minimum(np.abs(hits[idx] - times), np.abs(hits[idx - 1] - times)) <= TOLERANCE
+    return matched.mean(), near.mean(), 1000 * err[matched].mean() if matched.any() else float('nan')
+
+
+def per_hop(path):
+    feats = load_features(path, sr, frame_length, 1024, cache_dir=None)
+    return np.arange(len(feats['rms'])) * 1024 / sr
+
+
+def rms_peaks(path):
+    rms = load_features(path, sr, frame_length, 512, cache_dir=None)['rms']
+    peaks, _ = scipy.signal.find_peaks(rms, height=0.17, distance=10)
+    return peaks * 512 / sr
+
+
+def onsets(path):
+    feats = load_features(path, sr, frame_length, ONSET_HOP, cache_dir=None)
+    return onset_events(feats, sr=sr, hop_length=ONSET_HOP).time
+
+
+METHODS = (('per hop (audio_to_haptic)', per_hop),
+           ('RMS peaks h=0.17 (extract_events)', rms_peaks),
+           ('onsets', onsets))
+
+print(f"{seconds:.0f} s synthetic mixes, match tolerance {1000 * TOLERANCE:.0f} ms")
+print(f"{'gain':>5} {'method':<34} {'events/s':>9} {'time (s)':>9} {'recall':>7} {'precision':>10} {'error ms':>9}")
+with tempfile.TemporaryDirectory() as tmp:
+    # Warm up librosa / scipy so the first timed method does not pay for it
+    warm = os.path.join(tmp, 'warm.wav')
+    sf.write(warm, synthetic_mix(2.0, 1.0)[0], sr, subtype='FLOAT')
+    for _, method in METHODS:
+        method(warm)
+    for gain in GAINS:
+        y, hits = synthetic_mix(seconds, gain)
+        path = os.path.join(tmp, f'mix_{gain}.wav')
+        sf.write(path, y, sr, subtype='FLOAT')
+        for name, method in METHODS:
+            t0 = time.perf_counter()
+            times = method(path)
+            elapsed = time.perf_counter() - t0
+            recall, precision, error = score(np.asarray(times), hits)
+            print(f"{gain:5.2f} {name:<34} {len(times) / seconds:9.1f} {elapsed:9.2f} "
+                  f"{recall:7.2f} {precision:10.2f} {error:9.1f}")
@@ -0,0 +1,95 @@
+# Benchmark: category expansion over a long timeline (yamnet_to_ahap.py).
+# Per-window dict builders (previous make_rumble / make_inflate style) vs.
+# Template.at() per window vs. patterns.expand() over the whole timeline,
+# building the pattern and then writing it with write_ahap.
+
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+from ahap_writer import write_ahap
+from patterns import library, expand
+
+hours = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+win_sec = 0.5
+CATEGORIES = ("explosion", "gunfire", "rumble", "inflate", "whoosh", None)
+TEMPLATES = library(None)
+
+
+def old_transient(t, intensity, sharpness):
+    return {"Event": {"Time": t, "EventType": "HapticTransient", "EventParameters": [
+        {"ParameterID": "HapticIntensity", "ParameterValue": intensity},
+        {"ParameterID": "HapticSharpness", "ParameterValue": sharpness}]}}
+
+
+def old_builder(category, t):
+    # Nested dicts rebuilt on every call, as the per-script builders did
+    if category == "explosion":
+        return [old_transient(t, 1.0, 1.0)]
+    if category == "gunfire":
+        return [old_transient(t, 0.8, 1.0)]
+    if category == "whoosh":
+        return [old_transient(t, 0.7, 0.5)]
+    if category == "rumble":
+        base = [old_transient(round(t + i * 0.04, 3), 1.0, 0.1) for i in range(25)]
+        base.insert(0, {"ParameterCurve": {"ParameterID": "HapticIntensityControl", "Time": t,
+                                           "ParameterCurveControlPoints": [
+                                               {"Time": 0.0, "ParameterValue": 0.3},
+                                               {"Time": 0.1, "ParameterValue": 1.0},
+                                               {"Time": 0.8, "ParameterValue": 1.0},
+                                               {"Time": 1.0, "ParameterValue": 0.0}]}})
+        return base
+    if category == "inflate":
+        return [
+            {"Event": {"Time": t, "EventType": "HapticContinuous", "EventDuration": 1.5, "EventParameters": [
+                {"ParameterID": "HapticIntensity", "ParameterValue": 1.0},
+                {"ParameterID": "HapticSharpness", "ParameterValue": 0.5}]}},
+            {"ParameterCurve": {"ParameterID": "HapticIntensityControl", "Time": t, "ParameterCurveControlPoints": [
+                {"Time": 0.0, "ParameterValue": 0.0}, {"Time": 1.1, "ParameterValue": 0.5},
+                {"Time": 1.5, "ParameterValue": 0.0}]}},
+            {"ParameterCurve": {"ParameterID": "HapticSharpnessControl", "Time": t, "ParameterCurveControlPoints": [
+                {"Time": 0.0, "ParameterValue": -0.8}, {"Time": 1.5, "ParameterValue": 0.8}]}},
+        ]
+    return []
+
+
+rng = np.random.default_rng(0)
+n = int(hours * 3600 / win_sec)
+categories = rng.choice(len(CATEGORIES), size=n)
+times = (np.arange(n) * win_sec).round(2).tolist()
+placements = [(TEMPLATES[CATEGORIES[c]], t) for c, t in zip(categories.tolist(), times) if CATEGORIES[c]]
+
+
+def per_window_dicts():
+    pattern = []
+    for c, t in zip(categories.tolist(), times):
+        pattern.extend(old_builder(CATEGORIES[c], t))
+    return pattern
+
+
+def per_window_at():
+    pattern = []
+    for template, t in placements:
+        pattern.extend(template.at(t))
+    return pattern
+
+
+def whole_timeline():
+    return expand(placements)
+
+
+print(f"{hours:.0f} h timeline, {n} windows")
+print(f"{'method':<24} {'build (s)':>10} {'write (s)':>10} {'bytes':>12}")
+with tempfile.TemporaryDirectory() as tmp:
+    for name, build in (("per-window dicts", per_window_dicts), ("Template.at per window", per_window_at),
+                        ("expand (vectorized)", whole_timeline)):
+        t0 = time.perf_counter()
+        pattern = build()
+        t_build = time.perf_counter() - t0
+        path = os.path.join(tmp, name.split()[0] + '.ahap')
+        t0 = time.perf_counter()
+        n_bytes = write_ahap(path, pattern)
+        t_write = time.perf_counter() - t0
+        print(f"{name:<24} {t_build:10.2f} {t_write:10.2f} {n_bytes:12d}")
@@ -0,0 +1,201 @@
+# Load test for service.py: concurrent clients over a mix of files and
+# mapping configs, reporting p50 / p99 latency and throughput, split by
+# feature-cache hits and misses. Starts its own service unless --url or
+# --socket points at a running one. --baseline also times one cold
+# `batch.py --pipe` run on a single video, what a request costs without the
+# service.
+#
+#   python bench_service.py                       # 200 requests, 8 clients, 2 workers
+#   python bench_service.py -n 1000 -c 32 -j 4
+#   python bench_service.py --url http://127.0.0.1:8765 clips/*.mp4
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import soundfile as sf
+
+import service
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+CONFIGS = [
+    {},
+    {"mask_classes": ["Speech", "Silence", "Music"]},
+    {"feature_threshold": 0.2, "max_event_rate": 20.0},
+    {"event_categories": {"Explosion": "Whoosh"}, "minify": True},
+]
+
+
+def make_clips(directory, count, seconds, sr=44100):
+    # Noise bursts over a tone; every other clip wrapped in an mp4 with ffmpeg
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        t = np.arange(int(seconds * sr)) / sr
+        y = 0.2 * np.sin(2 * np.pi * (80 + 20 * i) * t)
+        for start in rng.uniform(0, seconds - 0.2, int(seconds)):
+            n = int(start * sr)
+            y[n:n + sr // 10] += rng.normal(0, 0.5, sr // 10) * np.linspace(1, 0, sr // 10)
+        path = os.path.join(directory, f'clip{i}.wav')
+        sf.write(path, y.astype(np.float32), sr)
+        if i % 2 and shutil.which('ffmpeg'):
+            video = path[:-4] + '.mp4'
+            subprocess.run(['ffmpeg', '-v', 'error', '-y', '-nostdin', '-f', 'lavfi',
+                            '-i', f'color=size=64x64:rate=25:duration={seconds}', '-i', path,
+                            '-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'aac', '-shortest', video],
+                           check=True)
+            os.remove(path)
+            path = video
+        paths.append(path)
+    return paths
+
+
+class Client:
+    # One keep-alive HTTP/1.1 connection
+    def __init__(self, host=None, port=None, socket_path=None):
+        self.host, self.port, self.socket_path = host, port, socket_path
+        self.reader = self.writer = None
+
+    async def connect(self):
+        if self.socket_path:
+            self.reader, self.writer = await asyncio.open_unix_connection(self.socket_path)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method, target, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else b''
+        self.writer.write(f"{method} {target} HTTP/1.1\r\nHost: hapticx\r\n"
+                          f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while (line := await self.reader.readline()).strip():
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return status, headers, await self.reader.readexactly(int(headers['content-length']))
+
+    def close(self):
+        self.writer.close()
+
+
+async def wait_ready(client, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            await client.connect()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def load_test(files, n, concurrency, address, seed=0):
+    # [(latency seconds, cache, status)] for n requests from `concurrency` clients
+    rng = random.Random(seed)
+    jobs = [{"path": rng.choice(files), "config": rng.choice(CONFIGS)} for _ in range(n)]
+    queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+    results = []
+
+    async def worker():
+        client = Client(**address)
+        await client.connect()
+        try:
+            while not queue.empty():
+                job = queue.get_nowait()
+                t0 = time.perf_counter()
+                status, headers, _ = await client.request("POST", "/generate", job)
+                results.append((time.perf_counter() - t0, headers.get('x-cache'), status))
+        finally:
+            client.close()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+def summary(name, latencies):
+    ms = np.array(latencies) * 1000
+    if not len(ms):
+        return f"{name:<10}{0:8d}"
+    return (f"{name:<10}{len(ms):8d}{np.percentile(ms, 50):10.1f}{np.percentile(ms, 99):10.1f}"
+            f"{ms.mean():10.1f}{ms.max():10.1f}")
+
+
+def cold_run(video, directory):
+    # One-off pipeline run (model load included) on a single video
+    manifest = os.path.join(directory, 'baseline.txt')
+    with open(manifest, 'w') as f:
+        f.write(video + '\n')
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(here, 'batch.py'), manifest, '-o', os.path.join(directory, 'baseline'),
+                    '-j', '1', '--pipe'], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - t0
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        files = [os.path.abspath(f) for f in args.files] or make_clips(tmp, args.clips, args.seconds)
+        proc = None
+        if args.url:
+            host, _, port = args.url.split('//')[-1].rstrip('/').partition(':')
+            address = {"host": host, "port": int(port or service.DEFAULT_PORT)}
+        elif args.socket:
+            address = {"socket_path": args.socket}
+        else:
+            address = {"socket_path": os.path.join(tmp, 'service.sock')}
+            t0 = time.perf_counter()
+            proc = subprocess.Popen([sys.executable, os.path.join(here, 'service.py'), '--socket', address["socket_path"],
+                                     '-j', str(args.workers), '--tf-threads', str(args.tf_threads)])
+        try:
+            probe = Client(**address)
+            await wait_ready(probe, timeout=300)
+            if proc:
+                print(f"service with {args.workers} workers started in {time.perf_counter() - t0:.1f} s")
+            print(f"{len(files)} files x {len(CONFIGS)} configs, {args.requests} requests, "
+                  f"{args.concurrency} concurrent clients")
+
+            t0 = time.perf_counter()
+            results = await load_test(files, args.requests, args.concurrency, address)
+            wall = time.perf_counter() - t0
+            ok = [(s, cache) for s, cache, status in results if status == 200]
+            print(f"{len(ok)}/{len(results)} ok, {len(ok) / wall:.1f} requests/s")
+            print(f"{'':<10}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}{'max ms':>10}")
+            print(summary('all', [s for s, _ in ok]))
+            for cache in ('miss', 'hit'):
+                print(summary(cache, [s for s, c in ok if c == cache]))
+            _, _, body = await probe.request("GET", "/stats")
+            print("service:", json.loads(body))
+            probe.close()
+        finally:
+            if proc:
+                proc.terminate()
+                proc.wait()
+
+        videos = [f for f in files if not f.endswith('.wav')]
+        if args.baseline and videos:
+            print(f"cold batch.py run ({os.path.basename(videos[0])}): {cold_run(videos[0], tmp) * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load-test the generation service.")
+    parser.add_argument('files', nargs='*', help="audio / video files (default: synthetic clips)")
+    parser.add_argument('-n', '--requests', type=int, default=200)
+    parser.add_argument('-c', '--concurrency', type=int, default=8)
+    parser.add_argument('-j', '--workers', type=int, default=2)
+    parser.add_argument('--tf-threads', type=int, default=1)
+    parser.add_argument('--clips', type=int, default=6)
+    parser.add_argument('--seconds', type=float, default=10.0, help="length of the synthetic clips")
+    parser.add_argument('--url', help="use a running service at http://host:port")
+    parser.add_argument('--socket', help="use a running service on this Unix socket")
+    parser.add_argument('--baseline', action='store_true', help="also time a cold batch.py run on one video")
+    asyncio.run(main(parser.parse_args()))
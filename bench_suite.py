@@ -0,0 +1,227 @@
+# Regression and performance suite for the generator scripts.
+#
+# Synthesizes deterministic fixtures (audio.wav cycling through clicks, tones,
+# noise bursts and silence, plus a matching yamnet_timeline.json) at each
+# requested length. Every generator then runs in its own process from a
+# scratch directory, with a cold feature cache and no incremental state.
+# The suite records wall time, peak RSS (from the instrument report) and
+# output size, and compares outputs against the golden files in
+# bench_golden/ for the lengths that have them.
+#
+#   python bench_suite.py                        # 10 s, 20 s, 60 s, 600 s
+#   python bench_suite.py --lengths 10 7200      # up to 2 h
+#   python bench_suite.py --update-golden        # rewrite goldens after an intended change
+#
+# Exits non-zero if any output differs from its golden file.
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import soundfile as sf
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_DIR = os.path.join(REPO, 'bench_golden')
+GOLDEN_LENGTHS = (10, 20)
+TOLERANCE = 1e-6
+
+sr = 44100
+SEGMENT_SEC = 2.5
+SEGMENT_KINDS = ('clicks', 'tone', 'noise', 'silence')
+# Timeline labels per segment kind, alternating between consecutive segments of that kind
+# (20 s reaches the second of each). "Dog" is neither an effect nor masked, so
+# test.py maps those windows from the audio features.
+SEGMENT_LABELS = {
+    'clicks': ('Gunshot, gunfire', 'Explosion'),
+    'tone': ('Music', 'Vehicle'),
+    'noise': ('Dog', 'Wind'),
+    'silence': ('Silence', 'Speech'),
+}
+
+# (script, output file), in run order: extract_events writes the
+# haptic_events.json that json_to_ahap reads
+GENERATORS = (
+    ('audio_to_haptic', 'pattern_generated.ahap'),
+    ('extract_events', 'haptic_events.json'),
+    ('json_to_ahap', 'engine_gemini_test.ahap'),
+    ('hybrid', 'hybrid.ahap'),
+    ('test', 'pattern_hybrid.ahap'),
+    ('yamnet_to_ahap', 'pattern.ahap'),
+)
+
+
+def segment_kind(index):
+    return SEGMENT_KINDS[index % len(SEGMENT_KINDS)]
+
+
+def synth_segment(index):
+    # One SEGMENT_SEC block of audio; depends only on its index
+    rng = np.random.default_rng(index)
+    n = int(SEGMENT_SEC * sr)
+    t = np.arange(n) / sr
+    kind = segment_kind(index)
+    level = 0.3 + 0.5 * rng.random()
+    if kind == 'clicks':
+        y = np.zeros(n)
+        click = np.exp(-np.arange(int(0.005 * sr)) / (0.001 * sr)) * rng.standard_normal(int(0.005 * sr))
+        for start in range(0, n - len(click), int(0.25 * sr)):
+            y[start:start + len(click)] += click * (0.5 + 0.5 * rng.random())
+    elif kind == 'tone':
+        freq = 110.0 * (1 + index % 3)
+        y = np.sin(2 * np.pi * freq * t) * (0.6 + 0.4 * np.sin(2 * np.pi * t / SEGMENT_SEC))
+    elif kind == 'noise':
+        y = rng.standard_normal(n) * ((t % 0.6) < 0.3)
+    else:
+        y = np.zeros(n)
+    return (level * y / max(np.abs(y).max(), 1e-9)).astype(np.float32)
+
+
+def write_audio(path, seconds):
+    # Streamed segment by segment, so 2 h fixtures do not need 2 h in memory
+    n_total = int(seconds * sr)
+    with sf.SoundFile(path, 'w', samplerate=sr, channels=1, subtype='PCM_16') as f:
+        written, index = 0, 0
+        while written < n_total:
+            block = synth_segment(index)[:n_total - written]
+            f.write(block)
+            written += len(block)
+            index += 1
+
+
+def synthetic_timeline(seconds, window=1.0, hop=0.5):
+    # Same window grid as yamnet_to_json.py, labels following the audio segments
+    timeline = []
+    for start in np.arange(0, max(seconds - window, 0), hop):
+        index = int(start / SEGMENT_SEC)
+        kind = segment_kind(index)
+        labels = SEGMENT_LABELS[kind]
+        timeline.append({
+            "time": round(float(start), 2),
+            "label": labels[(index // len(SEGMENT_KINDS)) % len(labels)],
+            "confidence": round(0.5 + 0.4 * ((index * 7919) % 100) / 100, 4)
+        })
+    return timeline
+
+
+def run_generator(script, workdir):
+    # Fresh process with a cold feature cache and no incremental state
+    shutil.rmtree(os.path.join(workdir, '.feature_cache'), ignore_errors=True)
+    for name in os.listdir(workdir):
+        if '.state.json' in name:
+            os.remove(os.path.join(workdir, name))
+    report_path = os.path.join(workdir, f'{script}.report.json')
+    env = dict(os.environ, PYTHONPATH=REPO + os.pathsep + os.environ.get('PYTHONPATH', ''),
+               HAPTICX_REPORT=report_path)
+    env.pop('HAPTICX_PROFILE', None)
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, os.path.join(REPO, f'{script}.py')], cwd=workdir, env=env,
+                          capture_output=True, text=True)
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise RuntimeError(f"{script}.py failed:\n{proc.stderr[-2000:]}")
+    with open(report_path) as f:
+        report = json.load(f)
+    return wall, report
+
+
+def diff(a, b, path='$'):
+    # First difference between two JSON values (floats within TOLERANCE), or None
+    if isinstance(a, dict) and isinstance(b, dict):
+        if list(a) != list(b):
+            return f"{path}: keys {list(a)} != {list(b)}"
+        for key in a:
+            d = diff(a[key], b[key], f"{path}.{key}")
+            if d:
+                return d
+        return None
+    if isinstance(a, list) and isinstance(b, list):
+        if len(a) != len(b):
+            return f"{path}: length {len(a)} != {len(b)}"
+        for i, (x, y) in enumerate(zip(a, b)):
+            d = diff(x, y, f"{path}[{i}]")
+            if d:
+                return d
+        return None
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)) and not isinstance(a, bool):
+        return None if abs(a - b) <= TOLERANCE else f"{path}: {a!r} != {b!r}"
+    return None if a == b else f"{path}: {a!r} != {b!r}"
+
+
+def golden_path(script, seconds):
+    return os.path.join(GOLDEN_DIR, f"{script}_{seconds:g}s.json")
+
+
+def count_entries(output):
+    return len(output["Pattern"]) if isinstance(output, dict) else len(output)
+
+
+def run_suite(lengths, update_golden=False):
+    results, failures = [], []
+    for seconds in lengths:
+        with tempfile.TemporaryDirectory() as workdir:
+            t0 = time.perf_counter()
+            write_audio(os.path.join(workdir, 'audio.wav'), seconds)
+            with open(os.path.join(workdir, 'yamnet_timeline.json'), 'w') as f:
+                json.dump(synthetic_timeline(seconds), f, indent=2)
+            print(f"--- {seconds:g} s fixture ({time.perf_counter() - t0:.1f} s to synthesize)")
+
+            for script, output_name in GENERATORS:
+                wall, report = run_generator(script, workdir)
+                output_path = os.path.join(workdir, output_name)
+                with open(output_path) as f:
+                    output = json.load(f)
+
+                golden = 'n/a'
+                if seconds in GOLDEN_LENGTHS:
+                    path = golden_path(script, seconds)
+                    if update_golden:
+                        os.makedirs(GOLDEN_DIR, exist_ok=True)
+                        with open(path, 'w') as f:
+                            json.dump(output, f, separators=(',', ':'))
+                        golden = 'updated'
+                    elif not os.path.exists(path):
+                        golden = 'missing'
+                    else:
+                        with open(path) as f:
+                            d = diff(json.load(f), output)
+                        golden = 'ok' if d is None else 'DIFF'
+                        if d is not None:
+                            failures.append(f"{script} {seconds:g} s: {d}")
+
+                result = {
+                    "generator": script,
+                    "seconds": seconds,
+                    "wall_seconds": wall,
+                    "peak_rss_bytes": report["peak_rss_bytes"],
+                    "output_bytes": os.path.getsize(output_path),
+                    "entries": count_entries(output),
+                    "golden": golden,
+                    "stages": report["stages"],
+                }
+                results.append(result)
+                print(f"{script:<16} {wall:8.2f} s {report['peak_rss_bytes'] / 2**20:8.0f} MB "
+                      f"{result['output_bytes'] / 1e3:10.1f} kB {result['entries']:9d} entries   golden {golden}")
+    return results, failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run every generator on synthetic fixtures.")
+    parser.add_argument('--lengths', type=float, nargs='+', default=[10, 20, 60, 600],
+                        help="fixture lengths in seconds (10 s to 7200 s)")
+    parser.add_argument('--update-golden', action='store_true', help="rewrite bench_golden/ from this run")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    results, failures = run_suite([int(s) if float(s).is_integer() else s for s in args.lengths],
+                                  args.update_golden)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"results": results, "failures": failures}, f, indent=2)
+    for failure in failures:
+        print(f"GOLDEN MISMATCH {failure}")
+    sys.exit(1 if failures else 0)
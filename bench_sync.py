@@ -0,0 +1,95 @@
+# Benchmark: A/V alignment (sync.py) on a synthetic video with known timing.
+#
+# The fixture is built with ffmpeg: clicks every CLICK_PERIOD s on an AAC
+# track muxed AUDIO_DELAY s after the video start (plus the encoder's
+# priming), a GAP s hole in the audio timestamps two thirds in, and video
+# at 25 fps for the first half and 24 fps after (VFR). The clicks are found
+# in the extracted audio.wav the way the generators see them, then mapped
+# to the video with and without alignment and compared with where they were
+# muxed. Also times align_times() alone over a million events.
+#
+#   python bench_sync.py          # 120 s fixture
+#   python bench_sync.py 1800
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import soundfile as sf
+
+import sync
+from extract_audio import extract_audio
+
+seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 120.0
+sr = 44100
+CLICK_PERIOD = 0.77
+AUDIO_DELAY = 0.5
+GAP = 0.2
+
+
+def make_fixture(path, seconds):
+    # Returns the presentation time of every click as muxed
+    half, gap_at = int(seconds / 2 * 25), int(seconds * 2 / 3)
+    tmp = path + '.nogap.mp4'
+    subprocess.run(['ffmpeg', '-v', 'error', '-y', '-nostdin',
+                    '-f', 'lavfi', '-i', f'testsrc=rate=25:size=160x120:duration={seconds}',
+                    '-itsoffset', str(AUDIO_DELAY),
+                    '-f', 'lavfi', '-i', f"aevalsrc='if(lt(mod(t,{CLICK_PERIOD}),0.005),0.9,0)':s={sr}:d={seconds}",
+                    # 1/600 s ticks: 24 per frame at 25 fps, 25 at 24 fps
+                    '-vf', f"settb=1/600,setpts='if(lt(N,{half}),N*24,{half * 24}+(N-{half})*25)'",
+                    '-fps_mode', 'vfr', '-video_track_timescale', '600',
+                    '-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'aac', '-shortest', tmp], check=True)
+    # The gap is put into the packet timestamps only (no re-encode)
+    subprocess.run(['ffmpeg', '-v', 'error', '-y', '-nostdin', '-i', tmp, '-c', 'copy',
+                    '-bsf:a', f"setts=ts='if(gte(PTS,{gap_at * sr}),PTS+{int(GAP * sr)},PTS)'", path], check=True)
+    os.remove(tmp)
+    clicks = np.arange(0, seconds - AUDIO_DELAY - GAP, CLICK_PERIOD)
+    presented = clicks + AUDIO_DELAY
+    return presented + GAP * (presented >= gap_at)
+
+
+def detect_clicks(audio_file):
+    y, _ = sf.read(audio_file)
+    loud = np.flatnonzero(np.abs(y) > 0.3)
+    return loud[np.diff(loud, prepend=-sr) > sr // 10] / sr
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp:
+        video, audio = os.path.join(tmp, 'fixture.mp4'), os.path.join(tmp, 'audio.wav')
+        truth = make_fixture(video, seconds)
+        extract_audio(video, audio, quiet=True)
+        found = detect_clicks(audio)
+        n = min(len(found), len(truth))
+        found, truth = found[:n], truth[:n]
+
+        t0 = time.perf_counter()
+        timing = sync.probe_timing(video)
+        t_probe = time.perf_counter() - t0
+        print(f"{seconds:.0f} s fixture, {n} clicks; timing via {timing['source']} in {t_probe:.2f} s")
+        print(f"  measured: audio starts at {timing['audio_start'] * 1000:.1f} ms "
+              f"(muxed {AUDIO_DELAY * 1000:.0f} ms, incl. priming), "
+              f"{len(timing['segment_start']) - 1} gap(s) of "
+              f"{(timing['segment_offset'][-1] - timing['segment_offset'][0]) * 1000:.1f} ms "
+              f"(muxed {GAP * 1000:.0f} ms), {len(timing['frame_times'])} frames")
+
+        print(f"{'':<28}{'mean error':>12}{'max error':>12}")
+        rows = [
+            ('audio.wav times', found),
+            ('+ start offset only', found + timing['audio_start']),
+            ('aligned', sync.align_times(found, timing)[0]),
+            ('aligned, frame-snapped', sync.align_times(found, timing, snap=True)[0]),
+        ]
+        for name, times in rows:
+            error = np.abs(times - truth) * 1000
+            print(f"{name:<28}{error.mean():10.1f}ms{error.max():10.1f}ms")
+        report = sync.align_times(found, timing)[1]
+        print(f"  a nominal-rate frame grid is up to {report['cfr_frames_off_max']} frames off "
+              f"({report['frames']} frames, {report['mean_fps']:.3f} fps mean)")
+
+        events = np.sort(np.random.default_rng(0).uniform(0, seconds, 1_000_000))
+        t0 = time.perf_counter()
+        sync.align_times(events, timing, snap=True)
+        print(f"  align_times: 1M events in {time.perf_counter() - t0:.3f} s")
@@ -0,0 +1,35 @@
+# Benchmark: per-window YAMNet loop vs. batched inference in yamnet_to_json.py
+
+import sys
+import time
+import numpy as np
+import librosa
+
+import yamnet_to_json as ytj
+
+audio_file = sys.argv[1] if len(sys.argv) > 1 else ytj.audio_file
+
+class_map = ytj.load_class_map()
+model = ytj.load_model()
+wav, sr = librosa.load(audio_file, sr=16000, mono=True)
+print(f"{audio_file}: {len(wav) / sr:.1f} s of audio")
+
+# Warm up the graph so neither path pays for tracing
+model(wav[:sr])
+
+t0 = time.perf_counter()
+starts_loop, scores_loop = ytj.window_scores_loop(model, wav, sr)
+t_loop = time.perf_counter() - t0
+
+t0 = time.perf_counter()
+starts_batch, scores_batch = ytj.window_scores_batched(model, wav, sr)
+t_batch = time.perf_counter() - t0
+
+timeline_loop = ytj.build_timeline(starts_loop, scores_loop, class_map, sr)
+timeline_batch = ytj.build_timeline(starts_batch, scores_batch, class_map, sr)
+agree = np.mean([a["label"] == b["label"] for a, b in zip(timeline_loop, timeline_batch)])
+
+print(f"loop:    {t_loop:8.2f} s  ({len(timeline_loop)} windows)")
+print(f"batched: {t_batch:8.2f} s  ({len(timeline_batch)} windows)")
+print(f"speedup: {t_loop / t_batch:8.1f}x")
+print(f"label agreement: {agree * 100:.1f}%")
@@ -0,0 +1,204 @@
+# Post-processing compaction for generated AHAP patterns.
+#
+# Runs of closely spaced HapticTransient events (one every 23 ms from
+# audio_to_haptic.py, every 40 ms from the rumble template) are collapsed into one
+# HapticContinuous event whose intensity/sharpness follow HapticIntensityControl /
+# HapticSharpnessControl curves. Curves are simplified (Ramer-Douglas-Peucker)
+# so no original transient deviates by more than `tolerance` in intensity or
+# sharpness. Control point times are relative to their curve's Time.
+#
+# Core Haptics applies a ParameterCurve to every event playing while it runs,
+# so a run is only collapsed when nothing else (continuous events, curves,
+# other entries) overlaps its span; otherwise its transients are kept.
+
+import json
+import os
+import numpy as np
+
+from ahap_writer import write_ahap
+from hpat import PatternFile, write_hpat
+from instrument import stage
+from limits import MAX_DURATION, MAX_CURVE_POINTS
+
+PATTERN_FILES = ['pattern_generated.ahap', 'hybrid.ahap', 'pattern_hybrid.ahap', 'pattern.ahap']
+
+TOLERANCE = 0.05          # max deviation in intensity / sharpness units
+MAX_GAP = 0.05            # seconds between transients that still count as one run
+MIN_RUN = 3               # shorter runs are left as transients
+
+
+def _event_params(event):
+    params = {p["ParameterID"]: p["ParameterValue"] for p in event.get("EventParameters", [])}
+    return params.get("HapticIntensity", 1.0), params.get("HapticSharpness", 0.5)
+
+
+def _simplify(t, v, tol):
+    # Indices of a Ramer-Douglas-Peucker simplification of the polyline (t, v)
+    keep = np.zeros(len(t), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(t) - 1)]
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        seg_t = t[a + 1:b]
+        line = v[a] + (v[b] - v[a]) * (seg_t - t[a]) / (t[b] - t[a])
+        err = np.abs(v[a + 1:b] - line)
+        i = int(np.argmax(err))
+        if err[i] > tol:
+            k = a + 1 + i
+            keep[k] = True
+            stack.extend([(a, k), (k, b)])
+    return np.flatnonzero(keep)
+
+
+def _curves(parameter_id, t, values):
+    # One or more ParameterCurve entries, each within the control point limit
+    curves = []
+    step = MAX_CURVE_POINTS - 1
+    for start in range(0, len(t) - 1, step):
+        seg_t, seg_v = t[start:start + step + 1], values[start:start + step + 1]
+        curves.append({
+            "ParameterCurve": {
+                "ParameterID": parameter_id,
+                "Time": round(float(seg_t[0]), 3),
+                "ParameterCurveControlPoints": [
+                    {"Time": round(float(ti - seg_t[0]), 3), "ParameterValue": round(float(vi), 4)}
+                    for ti, vi in zip(seg_t, seg_v)
+                ]
+            }
+        })
+    return curves
+
+
+def _collapse_run(t, inten, sharp, tolerance):
+    hop = float(np.median(np.diff(t)))
+    entries = []
+
+    if inten.max() - inten.min() <= 2 * tolerance:
+        base_inten = (inten.max() + inten.min()) / 2
+    else:
+        base_inten = inten.max()
+        keep = _simplify(t, inten, tolerance)
+        entries.extend(_curves("HapticIntensityControl", t[keep], inten[keep] / base_inten))
+
+    if sharp.max() - sharp.min() <= 2 * tolerance:
+        base_sharp = (sharp.max() + sharp.min()) / 2
+    else:
+        base_sharp = float(np.clip(sharp.mean(), 0.0, 1.0))
+        keep = _simplify(t, sharp, tolerance)
+        entries.extend(_curves("HapticSharpnessControl", t[keep], np.clip(sharp[keep] - base_sharp, -1.0, 1.0)))
+
+    event = {
+        "Event": {
+            "Time": round(float(t[0]), 3),
+            "EventType": "HapticContinuous",
+            "EventDuration": round(float(t[-1] - t[0] + hop), 3),
+            "EventParameters": [
+                {"ParameterID": "HapticIntensity", "ParameterValue": round(float(base_inten), 4)},
+                {"ParameterID": "HapticSharpness", "ParameterValue": round(float(base_sharp), 4)}
+            ]
+        }
+    }
+    return [event] + entries
+
+
+def _entry_time(entry):
+    body = entry.get("Event") or entry.get("ParameterCurve") or {}
+    return body.get("Time", 0.0)
+
+
+def _entry_span(entry):
+    # (start, end) of a non-transient entry: EventDuration for events, the last
+    # control point for curves
+    body = entry.get("Event") or entry.get("ParameterCurve") or next(
+        (b for b in entry.values() if isinstance(b, dict)), {})
+    start = float(body.get("Time", 0.0))
+    if "ParameterCurve" in entry:
+        points = body.get("ParameterCurveControlPoints") or [{"Time": 0.0}]
+        return start, start + float(points[-1]["Time"])
+    return start, start + float(body.get("EventDuration", 0.0))
+
+
+def compact_pattern(pattern, tolerance=TOLERANCE, max_gap=MAX_GAP, min_run=MIN_RUN):
+    # New pattern list with transient runs replaced by continuous events + curves
+    transients = [e["Event"] for e in pattern
+                  if "Event" in e and e["Event"].get("EventType") == "HapticTransient"]
+    others = [e for e in pattern
+              if not ("Event" in e and e["Event"].get("EventType") == "HapticTransient")]
+    if not transients:
+        return list(pattern)
+
+    transients.sort(key=lambda e: e["Time"])
+    t = np.array([e["Time"] for e in transients], dtype=float)
+    params = np.array([_event_params(e) for e in transients], dtype=float)
+    inten, sharp = params[:, 0], params[:, 1]
+
+    # Split into runs at large gaps, then cap each run's duration
+    run_id = np.concatenate([[0], np.cumsum(np.diff(t) > max_gap)])
+    bounds = np.flatnonzero(np.diff(run_id)) + 1
+    runs = []
+    for start, stop in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(t)]])):
+        while start < stop:
+            end = start + np.searchsorted(t[start:stop], t[start] + MAX_DURATION - max_gap, side='right')
+            runs.append((start, end))
+            start = end
+
+    # Running maximum of the other entries' ends, in start order: a run [a, b)
+    # overlaps one of them iff the max end over those starting before b is past a
+    spans = np.array([_entry_span(e) for e in others], dtype=float).reshape(-1, 2)
+    spans = spans[np.argsort(spans[:, 0], kind='stable')]
+    other_starts = spans[:, 0]
+    other_max_end = np.maximum.accumulate(np.maximum(spans[:, 1], spans[:, 0] + 1e-9)) if len(spans) else spans[:, 1]
+
+    def overlapped(a, b):
+        i = int(np.searchsorted(other_starts, b, side='left'))
+        return i > 0 and other_max_end[i - 1] > a
+
+    compacted = list(others)
+    for start, stop in runs:
+        hop = float(np.median(np.diff(t[start:stop]))) if stop - start > 1 else 0.0
+        if (stop - start < min_run or inten[start:stop].max() <= 0
+                or overlapped(t[start], t[stop - 1] + hop)):
+            compacted.extend({"Event": e} for e in transients[start:stop])
+        else:
+            compacted.extend(_collapse_run(t[start:stop], inten[start:stop], sharp[start:stop], tolerance))
+
+    compacted.sort(key=_entry_time)
+    return compacted
+
+
+def compact_file(in_path, out_path, tolerance=TOLERANCE, max_gap=MAX_GAP, min_run=MIN_RUN, minify=False):
+    # .ahap or .hpat in, .ahap or .hpat out (by extension)
+    if in_path.endswith('.hpat'):
+        pf = PatternFile(in_path)
+        ahap = {"Version": pf.version, "Pattern": pf.entries()}
+    else:
+        with open(in_path) as f:
+            ahap = json.load(f)
+    with stage('compact', tolerance=tolerance) as timer:
+        pattern = compact_pattern(ahap["Pattern"], tolerance, max_gap, min_run)
+        timer.items = len(ahap["Pattern"])
+    if out_path.endswith('.hpat'):
+        n_bytes = write_hpat(out_path, pattern, version=ahap.get("Version", 1))
+    else:
+        n_bytes = write_ahap(out_path, pattern, minify=minify, version=ahap.get("Version", 1))
+    return {
+        "events_before": len(ahap["Pattern"]),
+        "events_after": len(pattern),
+        "bytes_before": os.path.getsize(in_path),
+        "bytes_after": n_bytes,
+    }
+
+
+if __name__ == '__main__':
+    for path in PATTERN_FILES:
+        if not os.path.exists(path):
+            continue
+        out_path = path.replace('.ahap', '_compact.ahap').replace('.hpat', '_compact.hpat')
+        stats = compact_file(path, out_path)
+        print(f"{path} -> {out_path}: "
+              f"{stats['events_before']} -> {stats['events_after']} events "
+              f"({100 * (1 - stats['events_after'] / max(stats['events_before'], 1)):.1f}% fewer), "
+              f"{stats['bytes_before']} -> {stats['bytes_after']} bytes "
+              f"({100 * (1 - stats['bytes_after'] / max(stats['bytes_before'], 1)):.1f}% smaller)")
@@ -0,0 +1,59 @@
+# Array-backed haptic event table.
+#
+# Generators fill the columns in bulk (thresholding and masking are plain
+# array operations) and the table is only turned into AHAP dicts when the
+# pattern is written out.
+
+import numpy as np
+
+TRANSIENT = 0
+CONTINUOUS = 1
+EVENT_TYPES = ("HapticTransient", "HapticContinuous")
+
+
+class EventTable:
+    def __init__(self, time, intensity, sharpness, event_type=TRANSIENT, duration=0.0):
+        self.time = np.asarray(time, dtype=float)
+        n = len(self.time)
+        self.intensity = np.broadcast_to(np.asarray(intensity, dtype=float), (n,)).copy()
+        self.sharpness = np.broadcast_to(np.asarray(sharpness, dtype=float), (n,)).copy()
+        self.event_type = np.broadcast_to(np.asarray(event_type, dtype=np.int8), (n,)).copy()
+        self.duration = np.broadcast_to(np.asarray(duration, dtype=float), (n,)).copy()
+
+    def __len__(self):
+        return len(self.time)
+
+    def select(self, keep):
+        # Rows where `keep` is true (boolean mask or index array)
+        return EventTable(self.time[keep], self.intensity[keep], self.sharpness[keep],
+                          self.event_type[keep], self.duration[keep])
+
+    def sorted(self):
+        return self.select(np.argsort(self.time, kind='stable'))
+
+    @staticmethod
+    def concat(tables):
+        tables = list(tables)
+        if not tables:
+            return EventTable([], [], [])
+        return EventTable(np.concatenate([t.time for t in tables]),
+                          np.concatenate([t.intensity for t in tables]),
+                          np.concatenate([t.sharpness for t in tables]),
+                          np.concatenate([t.event_type for t in tables]),
+                          np.concatenate([t.duration for t in tables]))
+
+    def to_ahap_events(self, decimals=3):
+        # AHAP "Event" entries, one per row
+        events = []
+        columns = zip(self.time.tolist(), self.event_type.tolist(), self.duration.tolist(),
+                      self.intensity.tolist(), self.sharpness.tolist())
+        for t, event_type, duration, inten, sharp in columns:
+            event = {"Time": round(t, decimals), "EventType": EVENT_TYPES[event_type]}
+            if event_type == CONTINUOUS or duration > 0:
+                event["EventDuration"] = duration
+            event["EventParameters"] = [
+                {"ParameterID": "HapticIntensity", "ParameterValue": inten},
+                {"ParameterID": "HapticSharpness", "ParameterValue": sharp}
+            ]
+            events.append({"Event": event})
+        return events
@@ -1,17 +1,79 @@
 # Code to extract audio from a video file
 
+import subprocess
+import threading
+import numpy as np
 import ffmpeg
 
+from features import features_from_blocks
+from instrument import stage
+
 video_file = "input.mp4"
 audio_file = "audio.wav"
 
-# Extract audio using ffmpeg
-(
-    ffmpeg
-    .input(video_file)
-    .output(audio_file, acodec='pcm_s16le', ac=1, ar='44100')  # mono, 44.1kHz
-    .overwrite_output()
-    .run()
-)
+YAMNET_SR = 16000
+
+
+def extract_audio(video_file, audio_file, quiet=False):
+    # Extract audio using ffmpeg
+    with stage('extract_audio'):
+        (
+            ffmpeg
+            .input(video_file)
+            .output(audio_file, acodec='pcm_s16le', ac=1, ar='44100')  # mono, 44.1kHz
+            .overwrite_output()
+            .run(quiet=quiet)
+        )
+
+
+def pipe_audio(video_file, frame_params=((2048, 1024),), sr=44100, yamnet_sr=YAMNET_SR, block_samples=1 << 20):
+    # Decode once with ffmpeg and read raw float32 PCM from a pipe instead of writing audio.wav.
+    # The mono `sr` stream goes straight into the feature pass (one track per
+    # (frame_length, hop_length) in frame_params) and, block by block, through
+    # the same soxr resampler librosa.load uses, so YAMNet gets the input it
+    # gets on the WAV path (less the WAV's 16-bit quantization).
+    # Returns ({(frame_length, hop_length): feature dict}, yamnet waveform).
+    import soxr
+    from librosa.util import fix_length
+
+    with stage('pipe_decode') as timer:
+        args = (ffmpeg.input(video_file).audio
+                .output('pipe:1', format='f32le', acodec='pcm_f32le', ac=1, ar=sr)
+                .global_args('-nostdin', '-loglevel', 'error').compile())
+        proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        # stderr is drained on a thread so ffmpeg never blocks on it
+        stderr = []
+        reader = threading.Thread(target=lambda: stderr.append(proc.stderr.read()))
+        reader.start()
+
+        # librosa.resample's default (res_type='soxr_hq'), streamed
+        resampler = soxr.ResampleStream(sr, yamnet_sr, 1, dtype='float32', quality='HQ')
+        low_chunks, n_samples = [], 0
+
+        def high_blocks():
+            nonlocal n_samples
+            for chunk in iter(lambda: proc.stdout.read(block_samples * 4), b''):
+                block = np.frombuffer(chunk, dtype='<f4')
+                n_samples += len(block)
+                low_chunks.append(resampler.resample_chunk(block))
+                yield block
+
+        try:
+            feats = features_from_blocks(high_blocks(), sr, frame_params)
+        finally:
+            proc.stdout.close()
+            reader.join()
+            proc.wait()
+        if proc.returncode != 0:
+            raise ffmpeg.Error('ffmpeg', None, stderr[0] if stderr else b'')
+
+        low_chunks.append(resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True))
+        wav = fix_length(np.concatenate(low_chunks), size=int(np.ceil(n_samples * yamnet_sr / sr)))
+        timer.items = len(wav)
+    return feats, wav
+
 
-print(f"Audio extracted and saved to {audio_file}")
+if __name__ == '__main__':
+    extract_audio(video_file, audio_file)
+    print(f"Audio extracted and saved to {audio_file}")
@@ -5,30 +5,52 @@ import librosa
 import scipy.signal
 import json
 
-# Load the audio
+from features import load_features
+from onsets import onset_attacks, ONSET_HOP
+
 audio_path = "audio.wav"
-y, sr = librosa.load(audio_path, sr=44100)
+output_json = "haptic_events.json"
+sr = 44100
 frame_length = 2048
-hop_length = 512
-rms = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=hop_length)[0]
-times = librosa.times_like(rms, sr=sr, hop_length=hop_length)
-
-# Detect peaks in the energy signal
-# You can adjust 'height' and 'distance' to be more/less sensitive
-peaks, _ = scipy.signal.find_peaks(rms, height=0.17, distance=10)  # Play with height value if needed
-
-# Prepare haptic events
-haptic_events = []
-for peak in peaks:
-    event = {
-        "time": float(times[peak]),
-        "type": "transient",      # Short, strong pulse for now
-        "intensity": float(rms[peak])  # We'll map this to haptic intensity later
-    }
-    haptic_events.append(event)
-
-# Save to JSON
-with open("haptic_events.json", "w") as f:
-    json.dump(haptic_events, f, indent=2)
-
-print(f"Detected {len(haptic_events)} haptic events. Saved to haptic_events.json")
+
+# 'peaks': RMS peaks above a fixed height
+# 'onsets': spectral-flux onsets with an adaptive threshold (works on quiet and loud mixes)
+mode = 'peaks'
+
+def extract_events(audio_path=audio_path, mode=mode):
+    haptic_events = []
+    if mode == 'onsets':
+        feats = load_features(audio_path, sr=sr, frame_length=frame_length, hop_length=ONSET_HOP)
+        # Absolute attack RMS, like the peak heights below: json_to_ahap.py scales it
+        peaks, attack_rms = onset_attacks(feats, sr=sr, hop_length=ONSET_HOP)
+        times = peaks * ONSET_HOP / sr
+        for t, intensity in zip(times.tolist(), attack_rms.tolist()):
+            haptic_events.append({"time": t, "type": "transient", "intensity": intensity})
+    else:
+        # Load the audio features (streamed block by block, cached per audio file)
+        hop_length = 512
+        rms = load_features(audio_path, sr=sr, frame_length=frame_length, hop_length=hop_length)['rms']
+        times = librosa.times_like(rms, sr=sr, hop_length=hop_length)
+
+        # Detect peaks in the energy signal
+        # You can adjust 'height' and 'distance' to be more/less sensitive
+        peaks, _ = scipy.signal.find_peaks(rms, height=0.17, distance=10)  # Play with height value if needed
+
+        # Prepare haptic events
+        for peak in peaks:
+            event = {
+                "time": float(times[peak]),
+                "type": "transient",      # Short, strong pulse for now
+                "intensity": float(rms[peak])  # We'll map this to haptic intensity later
+            }
+            haptic_events.append(event)
+    return haptic_events
+
+if __name__ == '__main__':
+    haptic_events = extract_events()
+
+    # Save to JSON
+    with open(output_json, "w") as f:
+        json.dump(haptic_events, f, indent=2)
+
+    print(f"Detected {len(haptic_events)} haptic events. Saved to {output_json}")
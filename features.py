@@ -0,0 +1,210 @@
+# Block-wise audio feature extraction shared by the generators.
+#
+# Reads the audio in fixed-size blocks instead of librosa.load-ing the whole
+# file, so memory stays bounded by the block size. Frames are cut exactly as
+# librosa's centered (zero-padded) framing would cut them, so the RMS and
+# spectral centroid match librosa.feature.rms / spectral_centroid on the full array.
+#
+# With bands, the same STFT also yields per-band energy and flux for the
+# multi-band mapping (bands.py); with stereo, every channel is analysed in
+# the same (multichannel) STFT call instead of being downmixed first.
+#
+# Results are cached on disk as .npz, keyed by the audio content hash and the
+# frame parameters, so re-running a mapping does not re-analyze the audio.
+
+import hashlib
+import os
+import tempfile
+import numpy as np
+import soundfile as sf
+import librosa
+
+from instrument import stage
+
+FEATURE_CACHE_DIR = '.feature_cache'
+FEATURE_VERSION = 1  # bump when the feature definitions change
+FEATURE_NAMES = ('rms', 'centroid', 'onset')
+BAND_FEATURE_NAMES = ('band_energy', 'band_flux')
+
+# Filterbank for the multi-band mapping: (name, low Hz, high Hz or None for Nyquist)
+BANDS = (
+    ('sub', 20.0, 60.0),
+    ('bass', 60.0, 250.0),
+    ('mid', 250.0, 4000.0),
+    ('high', 4000.0, None),
+)
+
+
+def _read_mono(f, n):
+    block = f.read(n, dtype='float32', always_2d=True)
+    return block.mean(axis=1, dtype=np.float32) if block.shape[1] > 1 else block[:, 0]
+
+
+def _read_channels(f, n):
+    return np.ascontiguousarray(f.read(n, dtype='float32', always_2d=True).T)
+
+
+def band_bins(sr, n_fft, bands=BANDS):
+    # (start, stop) STFT bin range of every band; each band gets at least one bin
+    freqs = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
+    bins = []
+    for _, lo, hi in bands:
+        start = min(int(np.searchsorted(freqs, lo)), len(freqs) - 1)
+        stop = len(freqs) if hi is None else int(np.searchsorted(freqs, hi))
+        bins.append((start, max(stop, start + 1)))
+    return bins
+
+
+def _features(y, sr, frame_length, hop_length, prev_mag=None, center=True, bands=None):
+    # RMS, spectral centroid and spectral-flux onset strength from one STFT;
+    # with bands, also per-band energy (root of the summed power) and mean flux.
+    # y is (n,) or (channels, n); tracks keep the channel axis in front.
+    # Returns (tracks, last log-magnitude column to continue the flux from).
+    rms = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=hop_length, center=center)[..., 0, :]
+    S = np.abs(librosa.stft(y, n_fft=frame_length, hop_length=hop_length, center=center))
+    cent = librosa.feature.spectral_centroid(S=S, sr=sr, n_fft=frame_length)[..., 0, :]
+
+    log_mag = np.log1p(S)
+    if prev_mag is None:
+        prev_mag = log_mag[..., :1]
+    flux = np.maximum(np.diff(log_mag, axis=-1, prepend=prev_mag), 0.0)
+    tracks = (rms, cent, flux.mean(axis=-2))
+    if bands is not None:
+        power = S ** 2
+        bins = band_bins(sr, frame_length, bands)
+        tracks += (np.stack([np.sqrt(power[..., lo:hi, :].sum(axis=-2)) for lo, hi in bins], axis=-2),
+                   np.stack([flux[..., lo:hi, :].mean(axis=-2) for lo, hi in bins], axis=-2))
+    return tracks, log_mag[..., -1:]
+
+
+class Framer:
+    # Centered, zero-padded framing over a stream of blocks, mono (n,) or with
+    # `channels` (channels, n); push() returns the feature tracks (rms, centroid,
+    # onset, plus band_energy and band_flux with bands) for every frame
+    # completed by the block, or None
+    def __init__(self, sr=44100, frame_length=2048, hop_length=1024, bands=None, channels=None):
+        self.sr, self.frame_length, self.hop_length = sr, frame_length, hop_length
+        self.bands = bands
+        shape = (frame_length // 2,) if channels is None else (channels, frame_length // 2)
+        self.pad = np.zeros(shape, dtype=np.float32)
+        self.buf = self.pad
+        self.prev_mag = None
+
+    def push(self, block, final=False):
+        if final:
+            block = np.concatenate([block, self.pad], axis=-1)
+        self.buf = np.concatenate([self.buf, block], axis=-1)
+        if self.buf.shape[-1] < self.frame_length:
+            return None
+        n_frames = 1 + (self.buf.shape[-1] - self.frame_length) // self.hop_length
+        tracks, self.prev_mag = _features(
+            self.buf[..., :(n_frames - 1) * self.hop_length + self.frame_length], self.sr,
+            self.frame_length, self.hop_length, self.prev_mag, center=False, bands=self.bands)
+        self.buf = self.buf[..., n_frames * self.hop_length:]
+        return tracks
+
+
+def stream_features(audio_file, sr=44100, frame_length=2048, hop_length=1024, block_frames=2048,
+                    bands=None, stereo=False):
+    # Yields feature track tuples (see Framer) for consecutive runs of frames;
+    # with stereo, every track has a leading channel axis
+    with sf.SoundFile(audio_file) as f:
+        if f.samplerate != sr:
+            # Resampling is not done block-wise; fall back to the full-array path
+            y, _ = librosa.load(audio_file, sr=sr, mono=not stereo)
+            if stereo:
+                y = np.atleast_2d(y)
+            yield _features(y, sr, frame_length, hop_length, bands=bands)[0]
+            return
+
+        framer = Framer(sr, frame_length, hop_length, bands, f.channels if stereo else None)
+        read = _read_channels if stereo else _read_mono
+        eof = False
+        while not eof:
+            block = read(f, block_frames * hop_length)
+            eof = block.shape[-1] < block_frames * hop_length
+            frames = framer.push(block, final=eof)
+            if frames is not None:
+                yield frames
+
+
+def features_from_blocks(blocks, sr=44100, frame_params=((2048, 1024),)):
+    # One pass over an iterable of mono float32 blocks (e.g. a decoder pipe),
+    # computing the feature tracks for every (frame_length, hop_length) pair.
+    # Returns {(frame_length, hop_length): {'rms': ..., 'centroid': ..., 'onset': ...}}
+    framers = {params: Framer(sr, *params) for params in frame_params}
+    tracks = {params: {name: [] for name in FEATURE_NAMES} for params in frame_params}
+
+    def collect(params, frames):
+        if frames is not None:
+            for name, values in zip(FEATURE_NAMES, frames):
+                tracks[params][name].append(values)
+
+    for block in blocks:
+        for params, framer in framers.items():
+            collect(params, framer.push(block))
+    for params, framer in framers.items():
+        collect(params, framer.push(np.zeros(0, dtype=np.float32), final=True))
+    return {params: {name: np.concatenate(values) for name, values in t.items()}
+            for params, t in tracks.items()}
+
+
+def audio_hash(audio_file, chunk_size=1 << 20):
+    h = hashlib.sha1()
+    with open(audio_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_path(audio_file, sr, frame_length, hop_length, cache_dir=FEATURE_CACHE_DIR, bands=None, stereo=False):
+    key = f"{audio_hash(audio_file)}_v{FEATURE_VERSION}_{sr}_{frame_length}_{hop_length}"
+    if bands is not None:
+        key += '_b' + hashlib.sha1(repr(tuple(bands)).encode()).hexdigest()[:12]
+    if stereo:
+        key += '_stereo'
+    return os.path.join(cache_dir, key + '.npz')
+
+
+def _save_npz(path, **arrays):
+    # Write a cache file atomically. The temp name is unique, so processes
+    # writing the same entry (batch or service workers) never share one.
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp.npz')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def load_features(audio_file, sr=44100, frame_length=2048, hop_length=1024, block_frames=2048,
+                  cache_dir=FEATURE_CACHE_DIR, bands=None, stereo=False):
+    # Full feature tracks as a dict of arrays ('rms', 'centroid', 'onset', and
+    # with bands 'band_energy' / 'band_flux' of shape (n_bands, n_frames)).
+    # With stereo, each array gets a leading channel axis.
+    # Loaded from the cache when present; pass cache_dir=None to always recompute.
+    names = FEATURE_NAMES + (BAND_FEATURE_NAMES if bands is not None else ())
+    path = None
+    if cache_dir is not None:
+        with stage('features_cache_lookup', frame_length=frame_length, hop_length=hop_length):
+            path = cache_path(audio_file, sr, frame_length, hop_length, cache_dir, bands, stereo)
+            if os.path.exists(path):
+                with np.load(path) as cached:
+                    return {name: cached[name] for name in names}
+
+    with stage('features', frame_length=frame_length, hop_length=hop_length,
+               bands=bands is not None, stereo=stereo) as timer:
+        tracks = {name: [] for name in names}
+        for block in stream_features(audio_file, sr, frame_length, hop_length, block_frames, bands, stereo):
+            for name, values in zip(names, block):
+                tracks[name].append(values)
+        feats = {name: np.concatenate(values, axis=-1) for name, values in tracks.items()}
+        timer.items = feats['rms'].shape[-1]
+
+    if path is not None:
+        _save_npz(path, **feats)
+    return feats
+
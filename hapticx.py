@@ -0,0 +1,317 @@
+# Single command line for the whole pipeline.
+#
+# Every subcommand imports its module (and with it librosa, scipy, TensorFlow
+# or matplotlib) only when it runs, so the JSON-only steps - json2ahap,
+# yamnet2ahap, relabel, schedule, compact, convert, stats - start without
+# paying for the audio and ML stacks. The scripts themselves keep working as
+# before; their defaults are the defaults here.
+#
+#   python hapticx.py extract input.mp4 -o audio.wav
+#   python hapticx.py classify audio.wav -o yamnet_timeline.json
+#   python hapticx.py generate audio.wav yamnet_timeline.json -o pattern_hybrid.ahap
+#   python hapticx.py json2ahap haptic_events.json -o engine_gemini_test.ahap
+#   python hapticx.py serve --port 8765 -j 4
+#   python hapticx.py <command> -h
+
+import argparse
+import json
+import sys
+
+
+def cmd_extract(args):
+    from extract_audio import extract_audio
+    extract_audio(args.video, args.output)
+    print(f"Audio extracted and saved to {args.output}")
+
+
+def cmd_classify(args):
+    import yamnet_to_json
+    from scores import scores_path
+    class_map = yamnet_to_json.load_class_map()
+    model = yamnet_to_json.load_model(args.model_dir or yamnet_to_json.model_dir)
+    timeline = yamnet_to_json.audio_timeline(model, args.audio, class_map, batched=not args.per_window,
+                                             scores_file=scores_path(args.output))
+    with open(args.output, 'w') as f:
+        json.dump(timeline, f, indent=2)
+    print(f"Saved {args.output} and {scores_path(args.output)}")
+
+
+def cmd_relabel(args):
+    from scores import scores_path, load_scores, relabel
+    from timeline import label_segments
+    smoothing = None if args.smoothing == 'none' else args.smoothing
+    timeline = relabel(load_scores(scores_path(args.timeline)), smoothing=smoothing,
+                       min_confidence=args.min_confidence)
+    with open(args.output, 'w') as f:
+        json.dump(timeline, f, indent=2)
+    print(f"Saved {args.output} ({len(timeline)} windows)")
+    if args.segments:
+        segments = label_segments(timeline)
+        with open(args.segments, 'w') as f:
+            json.dump(segments, f, indent=2)
+        print(f"Saved {args.segments} ({len(segments)} segments)")
+
+
+def cmd_audio2ahap(args):
+    import audio_to_haptic
+    n_events, n_bytes = audio_to_haptic.generate(args.audio, args.output, args.mode, args.minify, args.decimals,
+                                                 args.stereo)
+    print(f"Generated {args.output} with {n_events} events ({n_bytes} bytes).")
+
+
+def cmd_events(args):
+    from extract_events import extract_events
+    haptic_events = extract_events(args.audio, args.mode)
+    with open(args.output, 'w') as f:
+        json.dump(haptic_events, f, indent=2)
+    print(f"Detected {len(haptic_events)} haptic events. Saved to {args.output}")
+
+
+def cmd_json2ahap(args):
+    from json_to_ahap import convert
+    convert(args.events, args.output)
+
+
+def cmd_hybrid(args):
+    import hybrid
+    n_events, n_bytes = hybrid.generate(args.audio, args.timeline, args.output, args.mask or hybrid.MASK_LABELS,
+                                        args.threshold, args.minify, args.decimals)
+    print(f"Generated {args.output} with {n_events} haptic events ({n_bytes} bytes).")
+
+
+def cmd_generate(args):
+    from test import generate
+    n_events, n_bytes = generate(args.audio, args.timeline, args.output, incremental=args.incremental)
+    print(f"Generated {args.output} with {n_events} events ({n_bytes} bytes).")
+
+
+def cmd_yamnet2ahap(args):
+    from yamnet_to_ahap import generate
+    n = generate(args.timeline, args.output, incremental=args.incremental)
+    print(f"Generated {args.output} with {n} events/patterns.")
+
+
+def cmd_schedule(args):
+    from limits import MAX_RATE, MAX_CONTINUOUS
+    from schedule import schedule
+    from ahap_writer import write_ahap
+    with open(args.input) as f:
+        ahap = json.load(f)
+    pattern, report = schedule(ahap["Pattern"], max_rate=args.max_rate or MAX_RATE,
+                               max_continuous=args.max_continuous or MAX_CONTINUOUS)
+    write_ahap(args.output, pattern, version=ahap.get("Version", 1))
+    print(f"{args.input} -> {args.output}: {report['entries_in']} -> {report['entries_out']} entries "
+          f"({report['dropped']} dropped, {report['merged']} merged, {report['trimmed']} trimmed, "
+          f"{report['curves_dropped']} curves dropped)")
+
+
+def cmd_compact(args):
+    from compact import compact_file, TOLERANCE
+    output = args.output or args.input.replace('.ahap', '_compact.ahap').replace('.hpat', '_compact.hpat')
+    stats = compact_file(args.input, output, tolerance=args.tolerance or TOLERANCE, minify=args.minify)
+    print(f"{args.input} -> {output}: {stats['events_before']} -> {stats['events_after']} events, "
+          f"{stats['bytes_before']} -> {stats['bytes_after']} bytes")
+
+
+def cmd_convert(args):
+    from hpat import ahap_to_hpat, hpat_to_ahap
+    if args.output.endswith('.hpat'):
+        n_bytes = ahap_to_hpat(args.input, args.output)
+    else:
+        n_bytes = hpat_to_ahap(args.input, args.output)
+    print(f"{args.input} -> {args.output} ({n_bytes} bytes)")
+
+
+def cmd_sync(args):
+    from sync import align_file
+    report = align_file(args.video, args.ahap, args.output, snap=args.snap)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(f"{args.ahap} -> {args.output}: audio starts {report['audio_start'] * 1000:.1f} ms in, "
+          f"{report['audio_gaps']} gaps, offsets {report['offset_min'] * 1000:.1f} .. "
+          f"{report['offset_max'] * 1000:.1f} ms ({report['source']})")
+
+
+def cmd_stats(args):
+    from ahap_stats import analyse
+    report = analyse(args.ahap, args.window)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(f"{args.ahap}: {report['events']} events, {report['duration']:.1f} s, "
+          f"{report['active_seconds']:.1f} s active, {report['max_events_per_second']} events/s max, "
+          f"{'valid' if report['valid'] else 'INVALID'} ({sum(report['issue_counts'].values())} issues)")
+    return 0 if report['valid'] else 1
+
+
+def cmd_plot(args):
+    from visualise import plot
+    plot(args.audio, args.output, args.timeline, args.ahap, args.start, args.end, args.width)
+
+
+def cmd_live(args):
+    import asyncio
+    import live
+    asyncio.run(live.main())
+
+
+def cmd_serve(args):
+    import asyncio
+    import service
+    try:
+        asyncio.run(service.serve(args.port, args.socket, args.workers, args.tf_threads, args.cache_entries,
+                                  args.host))
+    except KeyboardInterrupt:
+        pass
+
+
+def cmd_batch(args, rest):
+    import batch
+    batch.main(rest)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='hapticx', description="Audio / video to Core Haptics (AHAP) pipeline.")
+    sub = parser.add_subparsers(dest='command', required=True, metavar='command')
+
+    p = sub.add_parser('extract', help="video -> audio.wav (ffmpeg)")
+    p.add_argument('video')
+    p.add_argument('-o', '--output', default='audio.wav')
+    p.set_defaults(func=cmd_extract)
+
+    p = sub.add_parser('classify', help="audio -> YAMNet label timeline (+ stored scores)")
+    p.add_argument('audio')
+    p.add_argument('-o', '--output', default='yamnet_timeline.json')
+    p.add_argument('--model-dir', default=None,
+                   help="local YAMNet SavedModel (default: $HAPTICX_YAMNET_MODEL or ~/.cache/hapticx/yamnet)")
+    p.add_argument('--per-window', action='store_true', help="one model call per window instead of batched")
+    p.set_defaults(func=cmd_classify)
+
+    p = sub.add_parser('relabel', help="rebuild a timeline from its stored scores")
+    p.add_argument('timeline', nargs='?', default='yamnet_timeline.json')
+    p.add_argument('-o', '--output', default='yamnet_relabelled.json',
+                   help="relabelled timeline (pass the input timeline to replace it)")
+    p.add_argument('--smoothing', choices=('hmm', 'mode', 'none'), default='hmm')
+    p.add_argument('--min-confidence', type=float, default=0.0)
+    p.add_argument('--segments', help="also write merged label segments here")
+    p.set_defaults(func=cmd_relabel)
+
+    p = sub.add_parser('audio2ahap', help="audio features -> transients per frame or onset, or multi-band")
+    p.add_argument('audio', nargs='?', default='audio.wav')
+    p.add_argument('-o', '--output', default='pattern_generated.ahap')
+    p.add_argument('--mode', choices=('frames', 'onsets', 'bands'), default='frames')
+    p.add_argument('--stereo', action='store_true', help="bands mode: analyse each channel separately")
+    p.add_argument('--minify', action='store_true', help="no whitespace in the output")
+    p.add_argument('--decimals', type=int, help="cap float precision in the output")
+    p.set_defaults(func=cmd_audio2ahap)
+
+    p = sub.add_parser('events', help="audio -> haptic_events.json")
+    p.add_argument('audio', nargs='?', default='audio.wav')
+    p.add_argument('-o', '--output', default='haptic_events.json')
+    p.add_argument('--mode', choices=('peaks', 'onsets'), default='peaks')
+    p.set_defaults(func=cmd_events)
+
+    p = sub.add_parser('json2ahap', help="haptic_events.json -> AHAP")
+    p.add_argument('events', nargs='?', default='haptic_events.json')
+    p.add_argument('-o', '--output', default='engine_gemini_test.ahap')
+    p.set_defaults(func=cmd_json2ahap)
+
+    p = sub.add_parser('hybrid', help="audio features masked by YAMNet labels -> AHAP")
+    p.add_argument('audio', nargs='?', default='audio.wav')
+    p.add_argument('timeline', nargs='?', default='yamnet_timeline.json')
+    p.add_argument('-o', '--output', default='hybrid.ahap')
+    p.add_argument('--mask', nargs='+', help="labels to mask (default: Speech Silence)")
+    p.add_argument('--threshold', type=float, default=0.07)
+    p.add_argument('--minify', action='store_true', help="no whitespace in the output")
+    p.add_argument('--decimals', type=int, help="cap float precision in the output")
+    p.set_defaults(func=cmd_hybrid)
+
+    p = sub.add_parser('generate', help="features + YAMNet effects, scheduled -> AHAP (test.py)")
+    p.add_argument('audio', nargs='?', default='audio.wav')
+    p.add_argument('timeline', nargs='?', default='yamnet_timeline.json')
+    p.add_argument('-o', '--output', default='pattern_hybrid.ahap')
+    p.add_argument('--incremental', action='store_true',
+                   help="rebuild only windows whose label changed since the last run (keeps a .state.json)")
+    p.set_defaults(func=cmd_generate)
+
+    p = sub.add_parser('yamnet2ahap', help="YAMNet labels -> effect templates")
+    p.add_argument('timeline', nargs='?', default='yamnet_timeline.json')
+    p.add_argument('-o', '--output', default='pattern.ahap')
+    p.add_argument('--incremental', action='store_true',
+                   help="rebuild only windows whose label changed since the last run (keeps a .state.json)")
+    p.set_defaults(func=cmd_yamnet2ahap)
+
+    p = sub.add_parser('schedule', help="enforce event rate and concurrency limits on an AHAP")
+    p.add_argument('input')
+    p.add_argument('output')
+    p.add_argument('--max-rate', type=float, help="transients per second")
+    p.add_argument('--max-continuous', type=int, help="continuous events playing at once")
+    p.set_defaults(func=cmd_schedule)
+
+    p = sub.add_parser('compact', help="merge transient runs into continuous events + curves")
+    p.add_argument('input')
+    p.add_argument('output', nargs='?')
+    p.add_argument('--tolerance', type=float)
+    p.add_argument('--minify', action='store_true', help="no whitespace in the output")
+    p.set_defaults(func=cmd_compact)
+
+    p = sub.add_parser('convert', help="AHAP <-> .hpat (by output extension)")
+    p.add_argument('input')
+    p.add_argument('output')
+    p.set_defaults(func=cmd_convert)
+
+    p = sub.add_parser('sync', help="align an AHAP to the source video's frame timing and audio start")
+    p.add_argument('video')
+    p.add_argument('ahap', nargs='?', default='pattern_hybrid.ahap')
+    p.add_argument('-o', '--output', default='pattern_synced.ahap')
+    p.add_argument('--snap', action='store_true', help="also snap event times to the nearest video frame")
+    p.add_argument('--json', help="write the report here")
+    p.set_defaults(func=cmd_sync)
+
+    p = sub.add_parser('stats', help="validate an AHAP and report event rates, peaks and active time")
+    p.add_argument('ahap')
+    p.add_argument('--window', type=float, default=1.0, help="seconds per peak density window")
+    p.add_argument('--json', help="write the full report here")
+    p.set_defaults(func=cmd_stats)
+
+    p = sub.add_parser('plot', help="waveform, features, YAMNet labels and haptic events")
+    p.add_argument('audio', nargs='?', default='audio.wav')
+    p.add_argument('--timeline', default='yamnet_timeline.json')
+    p.add_argument('--ahap', help=".ahap or .hpat pattern to overlay")
+    p.add_argument('--start', type=float, help="seconds")
+    p.add_argument('--end', type=float, help="seconds")
+    p.add_argument('--width', type=int, default=2000, help="pixel columns")
+    p.add_argument('-o', '--output', help=".png / .svg / .html to write instead of opening a window")
+    p.set_defaults(func=cmd_plot)
+
+    p = sub.add_parser('live', help="f32le mono 44.1 kHz on stdin -> JSON-lines events on stdout")
+    p.set_defaults(func=cmd_live)
+
+    p = sub.add_parser('serve', help="HTTP / Unix socket service with warm models and feature caches")
+    p.add_argument('--port', type=int, default=8765)
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--socket', help="listen on this Unix socket instead of TCP")
+    p.add_argument('-j', '--workers', type=int, default=2)
+    p.add_argument('--tf-threads', type=int, default=1, help="TensorFlow threads per worker (0 = TF default)")
+    p.add_argument('--cache-entries', type=int, default=32, help="files cached per worker")
+    p.set_defaults(func=cmd_serve)
+
+    # Options are batch.py's own and passed through
+    p = sub.add_parser('batch', help="full pipeline over many videos (hapticx batch -h)", add_help=False)
+    p.set_defaults(func=cmd_batch)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args, rest = parser.parse_known_args(argv)
+    if args.func is cmd_batch:
+        return cmd_batch(args, rest)
+    if rest:
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,343 @@
+# Columnar binary pattern format (.hpat).
+#
+# Struct-of-arrays storage for AHAP patterns so post-processing tools and
+# players do not have to parse megabytes of JSON:
+#
+#   magic 'HPAT', format version (u32), header length (u64), JSON header,
+#   then one 64-byte aligned little-endian array per column.
+#
+# Plain intensity/sharpness events are stored as event_* columns, parameter
+# curves as curve_* columns plus their control points (CSR offsets in
+# curve_start), and any other entry (extra event parameters, dynamic
+# parameters, audio events) verbatim in the header. entry_kind / entry_rank
+# keep the original Pattern order, and time_order / time_sorted index every
+# entry by Time so a reader can seek to a time range with a binary search; a
+# running maximum of the entry ends, built on the first seek, also finds the
+# continuous events and curves that started earlier and are still playing.
+# Arrays are memory-mapped, so opening a file reads only the header.
+#
+# Round trips are lossless: converting back gives the same pattern (integer
+# parameter values come back as floats).
+#
+#   python hpat.py pattern_generated.ahap pattern_generated.hpat
+#   python hpat.py pattern_generated.hpat roundtrip.ahap
+
+import json
+import struct
+import sys
+import numpy as np
+
+from event_table import EventTable, EVENT_TYPES, CONTINUOUS
+from ahap_writer import write_ahap
+from instrument import stage
+
+MAGIC = b'HPAT'
+FORMAT_VERSION = 1
+ALIGN = 64
+
+ENTRY_EVENT, ENTRY_CURVE, ENTRY_RAW = 0, 1, 2
+FLAG_HAS_DURATION = 1   # EventDuration written although the table would drop it
+FLAG_SHARPNESS_FIRST = 2
+FLAG_UNROUNDED = 4      # Time has more than 3 decimals (the table writer rounds to 3)
+
+COLUMNS = {
+    "entry_kind": '<u1', "entry_rank": '<i8', "entry_time": '<f8', "time_order": '<i8',
+    "time_sorted": '<f8',
+    "event_time": '<f8', "event_type": '<u1', "event_duration": '<f8',
+    "event_intensity": '<f8', "event_sharpness": '<f8', "event_flags": '<u1',
+    "curve_time": '<f8', "curve_param": '<u2', "curve_start": '<i8',
+    "point_time": '<f8', "point_value": '<f8',
+}
+
+
+def _event_row(event):
+    # Column values and flags for a plain intensity/sharpness event, else None
+    if event.get("EventType") not in EVENT_TYPES:
+        return None
+    if set(event) - {"Time", "EventType", "EventDuration", "EventParameters"}:
+        return None
+    params = event.get("EventParameters", [])
+    ids = [p.get("ParameterID") for p in params]
+    if sorted(ids) != ["HapticIntensity", "HapticSharpness"] or any(set(p) != {"ParameterID", "ParameterValue"}
+                                                                   for p in params):
+        return None
+    values = {p["ParameterID"]: p["ParameterValue"] for p in params}
+    event_type = EVENT_TYPES.index(event["EventType"])
+    duration = event.get("EventDuration", 0.0)
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool)
+               for v in (event["Time"], duration, *values.values())):
+        return None
+    flags = 0
+    if "EventDuration" in event and not (event_type == CONTINUOUS or duration > 0):
+        flags |= FLAG_HAS_DURATION
+    if "EventDuration" not in event and (event_type == CONTINUOUS or duration > 0):
+        return None
+    if ids[0] == "HapticSharpness":
+        flags |= FLAG_SHARPNESS_FIRST
+    if round(event["Time"], 3) != event["Time"]:
+        flags |= FLAG_UNROUNDED
+    return (float(event["Time"]), event_type, float(duration),
+            float(values["HapticIntensity"]), float(values["HapticSharpness"]), flags)
+
+
+def _curve(body):
+    points = body.get("ParameterCurveControlPoints", [])
+    if set(body) != {"ParameterID", "Time", "ParameterCurveControlPoints"} or any(
+            set(p) != {"Time", "ParameterValue"} for p in points):
+        return None
+    values = [body["Time"]] + [v for p in points for v in (p["Time"], p["ParameterValue"])]
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        return None
+    return body["ParameterID"], float(body["Time"]), points
+
+
+def _entry_time(entry):
+    for body in entry.values():
+        if isinstance(body, dict) and isinstance(body.get("Time"), (int, float)):
+            return float(body["Time"])
+    return 0.0
+
+
+def write_hpat(path, pattern, version=1, extra=None):
+    # pattern: an EventTable, or an iterable of AHAP pattern entries (dicts) and/or EventTables.
+    # extra: other top-level AHAP keys (e.g. Metadata) to keep. Returns bytes written.
+    with stage('write_hpat') as timer:
+        kinds, times = [], []
+        rows, tables, curves, raw = [], [], [], []
+        names = []
+        point_time, point_value, curve_start = [], [], [0]
+
+        def flush_rows():
+            # Dict events gathered so far become one block of columns
+            if rows:
+                tables.append(np.array(rows, dtype=float).reshape(-1, 6))
+                rows.clear()
+
+        if isinstance(pattern, EventTable):
+            pattern = [pattern]
+        for entry in pattern:
+            if isinstance(entry, EventTable):
+                # Columns straight from the table, times rounded as write_ahap would
+                flush_rows()
+                t = [round(x, 3) for x in entry.time.tolist()]
+                tables.append(np.column_stack([t, entry.event_type, entry.duration, entry.intensity,
+                                               entry.sharpness, np.zeros(len(entry))]))
+                kinds.append(np.full(len(entry), ENTRY_EVENT))
+                times.append(t)
+                continue
+            row = _event_row(entry["Event"]) if set(entry) == {"Event"} else None
+            body = _curve(entry["ParameterCurve"]) if row is None and set(entry) == {"ParameterCurve"} else None
+            if row is not None:
+                kinds.append([ENTRY_EVENT])
+                times.append([row[0]])
+                rows.append(row)
+            elif body is not None:
+                parameter_id, t, points = body
+                if parameter_id not in names:
+                    names.append(parameter_id)
+                kinds.append([ENTRY_CURVE])
+                times.append([t])
+                curves.append((t, names.index(parameter_id)))
+                point_time.extend(p["Time"] for p in points)
+                point_value.extend(p["ParameterValue"] for p in points)
+                curve_start.append(len(point_time))
+            else:
+                kinds.append([ENTRY_RAW])
+                times.append([_entry_time(entry)])
+                raw.append(entry)
+        flush_rows()
+
+        kinds = np.concatenate(kinds) if kinds else np.zeros(0, dtype=int)
+        times = np.concatenate(times) if times else np.zeros(0)
+        # Position of each entry within its own section
+        ranks = np.zeros(len(kinds), dtype=np.int64)
+        for kind in (ENTRY_EVENT, ENTRY_CURVE, ENTRY_RAW):
+            ranks[kinds == kind] = np.arange(np.count_nonzero(kinds == kind))
+        rows = np.concatenate(tables) if tables else np.zeros((0, 6))
+        curves = np.array(curves, dtype=float).reshape(-1, 2)
+        time_order = np.argsort(times, kind='stable')
+        arrays = {
+            "entry_kind": kinds, "entry_rank": ranks, "entry_time": times,
+            "time_order": time_order, "time_sorted": times[time_order],
+            "event_time": rows[:, 0], "event_type": rows[:, 1], "event_duration": rows[:, 2],
+            "event_intensity": rows[:, 3], "event_sharpness": rows[:, 4], "event_flags": rows[:, 5],
+            "curve_time": curves[:, 0], "curve_param": curves[:, 1], "curve_start": curve_start,
+            "point_time": point_time, "point_value": point_value,
+        }
+        arrays = {name: np.asarray(values).astype(COLUMNS[name]) for name, values in arrays.items()}
+
+        layout, offset = {}, 0
+        for name, a in arrays.items():
+            layout[name] = [len(a), offset]
+            offset += -(-a.nbytes // ALIGN) * ALIGN
+        header = json.dumps({"version": version, "extra": extra or {}, "parameters": names,
+                             "raw": raw, "columns": layout}).encode()
+        prefix = 16 + len(header)
+        data_start = -(-prefix // ALIGN) * ALIGN
+
+        with open(path, 'wb') as f:
+            f.write(MAGIC + struct.pack('<IQ', FORMAT_VERSION, len(header)) + header)
+            f.write(b'\0' * (data_start - prefix))
+            for name, a in arrays.items():
+                f.write(a.tobytes())
+                f.write(b'\0' * (-a.nbytes % ALIGN))
+            written = f.tell()
+        timer.items = len(kinds)
+        timer.info['bytes'] = written
+    return written
+
+
+class PatternFile:
+    # Memory-mapped reader for .hpat files
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            prefix = f.read(16)
+            if prefix[:4] != MAGIC:
+                raise ValueError(f"{path} is not an .hpat file")
+            fmt, header_len = struct.unpack('<IQ', prefix[4:])
+            if fmt != FORMAT_VERSION:
+                raise ValueError(f"{path}: unsupported .hpat format version {fmt}")
+            header = json.loads(f.read(header_len))
+        self.path = path
+        self.version = header["version"]
+        self.extra = header["extra"]
+        self.parameters = header["parameters"]
+        self.raw = header["raw"]
+        self._max_end_sorted = None
+        data_start = -(-(16 + header_len) // ALIGN) * ALIGN
+        self._mmap = np.memmap(path, dtype=np.uint8, mode='r')
+        for name, (n, offset) in header["columns"].items():
+            dtype = np.dtype(COLUMNS[name])
+            start = data_start + offset
+            setattr(self, name, self._mmap[start:start + n * dtype.itemsize].view(dtype))
+
+    def __len__(self):
+        return len(self.entry_kind)
+
+    def events(self):
+        # Every plain event as an EventTable (in pattern order)
+        return EventTable(self.event_time, self.event_intensity, self.event_sharpness,
+                          self.event_type, self.event_duration)
+
+    def _event(self, i):
+        t, event_type, duration = float(self.event_time[i]), int(self.event_type[i]), float(self.event_duration[i])
+        flags = int(self.event_flags[i])
+        event = {"Time": t, "EventType": EVENT_TYPES[event_type]}
+        if event_type == CONTINUOUS or duration > 0 or flags & FLAG_HAS_DURATION:
+            event["EventDuration"] = duration
+        params = [{"ParameterID": "HapticIntensity", "ParameterValue": float(self.event_intensity[i])},
+                  {"ParameterID": "HapticSharpness", "ParameterValue": float(self.event_sharpness[i])}]
+        event["EventParameters"] = params[::-1] if flags & FLAG_SHARPNESS_FIRST else params
+        return {"Event": event}
+
+    def _curve(self, i):
+        start, stop = int(self.curve_start[i]), int(self.curve_start[i + 1])
+        return {
+            "ParameterCurve": {
+                "ParameterID": self.parameters[int(self.curve_param[i])],
+                "Time": float(self.curve_time[i]),
+                "ParameterCurveControlPoints": [
+                    {"Time": t, "ParameterValue": v}
+                    for t, v in zip(self.point_time[start:stop].tolist(), self.point_value[start:stop].tolist())
+                ]
+            }
+        }
+
+    def entry(self, i):
+        kind, rank = int(self.entry_kind[i]), int(self.entry_rank[i])
+        if kind == ENTRY_EVENT:
+            return self._event(rank)
+        if kind == ENTRY_CURVE:
+            return self._curve(rank)
+        return self.raw[rank]
+
+    def entry_ends(self, index=None):
+        # Time each entry stops playing: Time + EventDuration, or Time + the last
+        # control point for curves (entries in `index`, default all)
+        index = np.arange(len(self)) if index is None else np.asarray(index, dtype=np.int64)
+        kinds, ranks = self.entry_kind[index], self.entry_rank[index]
+        ends = self.entry_time[index].astype(float)
+        events = kinds == ENTRY_EVENT
+        ends[events] += self.event_duration[ranks[events]]
+        curves = kinds == ENTRY_CURVE
+        starts, stops = self.curve_start[ranks[curves]], self.curve_start[ranks[curves] + 1]
+        has_points = stops > starts
+        last = np.zeros(len(starts))
+        last[has_points] = self.point_time[stops[has_points] - 1]
+        ends[curves] += last
+        for i in np.flatnonzero(kinds == ENTRY_RAW).tolist():
+            body = next((b for b in self.raw[ranks[i]].values() if isinstance(b, dict)), {})
+            duration = body.get("EventDuration", 0.0)
+            if isinstance(duration, (int, float)) and not isinstance(duration, bool):
+                ends[i] += duration
+        return ends
+
+    def _max_end(self):
+        # Running maximum of the entry ends in time order: the entries still
+        # playing at t all lie after the first position where it exceeds t
+        if self._max_end_sorted is None:
+            self._max_end_sorted = np.maximum.accumulate(self.entry_ends(self.time_order))
+        return self._max_end_sorted
+
+    def entries(self, start=None, end=None):
+        # Pattern entries playing in [start, end), in pattern order: those with
+        # start <= Time < end plus those that began earlier and end after start
+        # (continuous events, curves). Only the matching range of the time
+        # index is touched once the max-end index is built.
+        if start is None and end is None:
+            index = range(len(self))
+        else:
+            times = self.time_sorted
+            lo = 0 if start is None else int(np.searchsorted(times, start, side='left'))
+            hi = len(times) if end is None else int(np.searchsorted(times, end, side='left'))
+            index = self.time_order[lo:hi]
+            if lo > 0:
+                first = int(np.searchsorted(self._max_end(), start, side='right'))
+                earlier = self.time_order[first:lo]
+                earlier = earlier[self.entry_ends(earlier) > start]
+                index = np.concatenate([earlier, index])
+            index = np.sort(index).tolist()
+        return [self.entry(i) for i in index]
+
+    def pattern(self):
+        # Whole pattern for write_ahap: runs of table-safe events as EventTables,
+        # everything else as dicts
+        kinds, ranks = np.asarray(self.entry_kind), np.asarray(self.entry_rank)
+        simple = kinds == ENTRY_EVENT
+        simple[simple] = self.event_flags[ranks[simple]] == 0
+        table = self.events()
+        out, start = [], 0
+        for i in np.flatnonzero(~simple).tolist() + [len(kinds)]:
+            if i > start:
+                out.append(table.select(slice(int(ranks[start]), int(ranks[i - 1]) + 1)))
+            if i < len(kinds):
+                out.append(self.entry(i))
+            start = i + 1
+        return out
+
+
+def ahap_to_hpat(ahap_path, hpat_path):
+    with open(ahap_path) as f:
+        ahap = json.load(f)
+    extra = {k: v for k, v in ahap.items() if k not in ("Version", "Pattern")}
+    return write_hpat(hpat_path, ahap["Pattern"], version=ahap.get("Version", 1), extra=extra)
+
+
+def hpat_to_ahap(hpat_path, ahap_path, minify=False):
+    pf = PatternFile(hpat_path)
+    if pf.extra:
+        # Extra top-level keys are not streamed by write_ahap; write the full tree
+        ahap = {"Version": pf.version, **pf.extra, "Pattern": pf.entries()}
+        with open(ahap_path, 'w') as f:
+            text = json.dumps(ahap, separators=(",", ":")) if minify else json.dumps(ahap, indent=2)
+            return f.write(text)
+    return write_ahap(ahap_path, pf.pattern(), minify=minify, version=pf.version)
+
+
+if __name__ == '__main__':
+    src, dst = sys.argv[1], sys.argv[2]
+    if dst.endswith('.hpat'):
+        n_bytes = ahap_to_hpat(src, dst)
+    else:
+        n_bytes = hpat_to_ahap(src, dst)
+    print(f"{src} -> {dst} ({n_bytes} bytes)")
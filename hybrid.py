@@ -2,8 +2,15 @@ import librosa
 import numpy as np
 import json
 
+from features import load_features
+from event_table import EventTable
+from ahap_writer import write_ahap
+from instrument import stage
+from timeline import window_seconds, label_intervals, merge_intervals, in_intervals
+
 # ---- CONFIG ----
 audio_file = 'audio.wav'
+sr = 44100
 yamnet_file = 'yamnet_timeline.json'
 output_ahap = 'hybrid.ahap'
 
@@ -11,61 +18,48 @@ frame_length = 2048    # ~50ms at 44.1kHz
 hop_length = 1024      # ~25ms
 
 MASK_LABELS = ['Speech', 'Silence']  # Mask these
+THRESHOLD = 0.07       # minimum normalized intensity for an event
+
+minify = False         # compact AHAP without whitespace
+float_decimals = None  # e.g. 4 to cap float precision in the output
 
-# ---- 1. Load audio and extract features ----
-y, sr = librosa.load(audio_file, sr=44100, mono=True)
 
-rms = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=hop_length)[0]
-cent = librosa.feature.spectral_centroid(y=y, sr=sr, n_fft=frame_length, hop_length=hop_length)[0]
-times = librosa.frames_to_time(np.arange(len(rms)), sr=sr, hop_length=hop_length, n_fft=frame_length)
+def hybrid_events(audio_file=audio_file, yamnet_file=yamnet_file, mask_labels=MASK_LABELS, threshold=THRESHOLD):
+    # ---- 1. Load audio and extract features ----
+    feats = load_features(audio_file, sr=sr, frame_length=frame_length, hop_length=hop_length)
+    rms, cent = feats['rms'], feats['centroid']
+    times = librosa.frames_to_time(np.arange(len(rms)), sr=sr, hop_length=hop_length, n_fft=frame_length)
 
-# Normalize to [0, 1]
-intensity = (rms - rms.min()) / (rms.max() - rms.min() + 1e-6)
-sharpness = (cent - cent.min()) / (cent.max() - cent.min() + 1e-6)
+    # Normalize to [0, 1]
+    intensity = (rms - rms.min()) / (rms.max() - rms.min() + 1e-6)
+    sharpness = (cent - cent.min()) / (cent.max() - cent.min() + 1e-6)
 
-# ---- 2. Load YAMNet label timeline ----
-with open(yamnet_file) as f:
-    yamnet = json.load(f)
+    # ---- 2. Load YAMNet label timeline ----
+    with open(yamnet_file) as f:
+        yamnet = json.load(f)
 
-# Build a lookup of all intervals to mask (Speech, Music, Silence, etc.)
-mask_intervals = []
-win_sec = yamnet[1]['time'] - yamnet[0]['time'] if len(yamnet) > 1 else 1.0
-for entry in yamnet:
-    if entry['label'] in MASK_LABELS:
-        t0 = entry['time']
-        t1 = t0 + win_sec
-        mask_intervals.append((t0, t1))
+    # Merged, sorted intervals to mask (Speech, Music, Silence, etc.),
+    # applied to every frame time at once
+    win_sec = window_seconds(yamnet)
+    mask_starts, mask_ends = merge_intervals(*label_intervals(yamnet, mask_labels, win_sec))
+    masked = in_intervals(times, mask_starts, mask_ends)
 
-def is_masked(t):
-    # Is time t inside any masked interval?
-    for t0, t1 in mask_intervals:
-        if t0 <= t < t1:
-            return True
-    return False
+    # ---- 3. Create haptics only for non-masked frames above the threshold ----
+    with stage('events') as timer:
+        keep = ~masked & (intensity > threshold)
+        events = EventTable(times, intensity, sharpness).select(keep)
+        timer.items = len(events)
+    return events
 
-# ---- 3. Create haptics only for non-masked frames ----
-ahap_events = []
-for t, inten, sharp in zip(times, intensity, sharpness):
-    if is_masked(t):
-        continue  # skip masked labels
-    if inten > 0.07:
-        ahap_events.append({
-            "Event": {
-                "Time": round(float(t), 3),
-                "EventType": "HapticTransient",
-                "EventParameters": [
-                    {"ParameterID": "HapticIntensity", "ParameterValue": float(inten)},
-                    {"ParameterID": "HapticSharpness", "ParameterValue": float(sharp)}
-                ]
-            }
-        })
 
-ahap = {
-    "Version": 1,
-    "Pattern": ahap_events
-}
+def generate(audio_file=audio_file, yamnet_file=yamnet_file, output_ahap=output_ahap,
+             mask_labels=MASK_LABELS, threshold=THRESHOLD, minify=minify, decimals=float_decimals):
+    # Returns (n_events, n_bytes)
+    events = hybrid_events(audio_file, yamnet_file, mask_labels, threshold)
+    n_bytes = write_ahap(output_ahap, events, minify=minify, decimals=decimals)
+    return len(events), n_bytes
 
-with open(output_ahap, "w") as f:
-    json.dump(ahap, f, indent=2)
 
-print(f"Generated {output_ahap} with {len(ahap_events)} haptic events.")
+if __name__ == '__main__':
+    n_events, n_bytes = generate()
+    print(f"Generated {output_ahap} with {n_events} haptic events ({n_bytes} bytes).")
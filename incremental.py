@@ -0,0 +1,114 @@
+# Incremental re-generation after edits to yamnet_timeline.json (opt-in:
+# incremental=True in test.py / yamnet_to_ahap.py, or --incremental).
+#
+# Generators emit their pattern window by window, in timeline order, so the
+# entries of any window are one contiguous slice of the AHAP "Pattern" list -
+# including spill-over past the window's end (the 1.5 s inflate template
+# curves), which stays attached to the window that produced it. A state file
+# next to the output remembers the timeline and how many entries each window
+# produced; on the next run only windows whose label changed are regenerated
+# and spliced into the previous pattern. When the written output is
+# post-processed (scheduling), the per-window pattern is kept in an .hpat
+# beside the state and spliced from there instead.
+#
+# Anything that could change the other windows (different audio, features or
+# config, a different window grid, an AHAP edited or compacted since) falls
+# back to a full rebuild, so the result always matches one.
+
+import hashlib
+import json
+import os
+
+from hpat import PatternFile, write_hpat
+
+STATE_SUFFIX = '.state.json'
+STATE_VERSION = 2
+
+
+def state_path(output_ahap):
+    return output_ahap + STATE_SUFFIX
+
+
+def file_digest(path, chunk_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def array_digest(*arrays):
+    # Content hash of feature arrays (None entries are skipped)
+    h = hashlib.sha1()
+    for a in arrays:
+        if a is not None:
+            h.update(str(a.dtype).encode())
+            h.update(a.tobytes())
+    return h.hexdigest()
+
+
+def load_state(output_ahap):
+    # Previous run's state, or None if there is none usable
+    try:
+        with open(state_path(output_ahap)) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return state if state.get("version") == STATE_VERSION else None
+
+
+def save_state(output_ahap, timeline, counts, fingerprint, extra=None, pattern=None):
+    # pattern: the per-window pattern when a later pass (e.g. schedule.py)
+    # rewrites the output; it is kept next to the state for the next splice
+    state = {
+        "version": STATE_VERSION,
+        "fingerprint": fingerprint,
+        "output": file_digest(output_ahap),
+        "source": None,
+        "timeline": [{"time": entry['time'], "label": entry['label']} for entry in timeline],
+        "counts": list(counts),
+        "extra": extra or {},
+    }
+    if pattern is not None:
+        state["source"] = state_path(output_ahap) + '.hpat'
+        write_hpat(state["source"], pattern)
+    with open(state_path(output_ahap), 'w') as f:
+        json.dump(state, f)
+
+
+def dirty_windows(state, output_ahap, timeline, fingerprint):
+    # Set of window indices to regenerate, or None when a full rebuild is needed
+    if state is None or state["fingerprint"] != fingerprint or not os.path.exists(output_ahap):
+        return None
+    if state["source"] is not None and not os.path.exists(state["source"]):
+        return None
+    old = state["timeline"]
+    if len(old) != len(timeline) or any(o['time'] != n['time'] for o, n in zip(old, timeline)):
+        return None
+    if file_digest(output_ahap) != state["output"]:
+        return None
+    return {i for i, (o, n) in enumerate(zip(old, timeline)) if o['label'] != n['label']}
+
+
+def splice(output_ahap, state, new_entries):
+    # Previous per-window pattern with the entries of the windows in new_entries
+    # ({window: [entries]}) replaced; returns (pattern, per-window counts)
+    if state["source"] is not None:
+        old_pattern = PatternFile(state["source"]).entries()
+    else:
+        with open(output_ahap) as f:
+            old_pattern = json.load(f)["Pattern"]
+    counts = state["counts"]
+    if sum(counts) != len(old_pattern):
+        raise ValueError(f"{output_ahap} does not match its state file")
+    pattern, new_counts = [], []
+    offset = 0
+    for i, count in enumerate(counts):
+        if i in new_entries:
+            pattern.extend(new_entries[i])
+            new_counts.append(len(new_entries[i]))
+        else:
+            pattern.extend(old_pattern[offset:offset + count])
+            new_counts.append(count)
+        offset += count
+    return pattern, new_counts
@@ -0,0 +1,142 @@
+# Lightweight per-stage instrumentation.
+#
+# Library functions report into a process-wide list of stages:
+#
+#     with stage('features', items=n_frames):
+#         ...
+#
+# Each stage records wall time, CPU time, peak RSS and the number of items it
+# processed (frames, windows, events). Set HAPTICX_REPORT to a file path (or an
+# existing directory) to get a JSON report when the process exits, and
+# HAPTICX_PROFILE to also dump a cProfile of the whole run. Only the last
+# MAX_STAGES records are kept; long-running processes call reset() per job.
+
+import atexit
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+from collections import deque
+
+REPORT_ENV = 'HAPTICX_REPORT'
+PROFILE_ENV = 'HAPTICX_PROFILE'
+MAX_STAGES = 10000
+
+_stages = deque(maxlen=MAX_STAGES)
+_active = []
+_run_start = time.time()
+_profiler = None
+
+
+def _rss_peak():
+    # Peak RSS in bytes since the last reset (Linux), else since process start
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _reset_rss_peak():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+class stage:
+    # Context manager (or start()/stop() pair) timing one pipeline stage
+    def __init__(self, name, items=None, **info):
+        self.name = name
+        self.items = items
+        self.info = info
+
+    def start(self):
+        # Fold the current peak into enclosing stages before resetting the counter
+        peak = _rss_peak()
+        for outer in _active:
+            outer._peak = max(outer._peak, peak)
+        _reset_rss_peak()
+        self._peak = 0
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        _active.append(self)
+        return self
+
+    def stop(self, items=None):
+        if items is not None:
+            self.items = items
+        _active.remove(self)
+        record = {
+            "stage": self.name,
+            "wall_seconds": time.perf_counter() - self._wall,
+            "cpu_seconds": time.process_time() - self._cpu,
+            "peak_rss_bytes": max(self._peak, _rss_peak()),
+            "items": self.items,
+            "depth": len(_active),
+        }
+        record.update(self.info)
+        _stages.append(record)
+        return record
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+def stages():
+    return list(_stages)
+
+
+def reset():
+    # Drop the recorded stages (open ones still record when they stop)
+    _stages.clear()
+
+
+def report():
+    return {
+        "script": os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else None,
+        "argv": sys.argv[1:],
+        "pid": os.getpid(),
+        "started": _run_start,
+        "wall_seconds": time.time() - _run_start,
+        "cpu_seconds": time.process_time(),
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024),
+        "stages": stages(),
+    }
+
+
+def _output_path(path, suffix):
+    if os.path.isdir(path):
+        script = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0]
+        return os.path.join(path, f"{script}-{os.getpid()}-{int(_run_start)}{suffix}")
+    return path
+
+
+def write_report(path):
+    with open(_output_path(path, '.json'), 'w') as f:
+        json.dump(report(), f, indent=2)
+
+
+def _at_exit():
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(_output_path(os.environ[PROFILE_ENV], '.prof'))
+    if os.environ.get(REPORT_ENV):
+        write_report(os.environ[REPORT_ENV])
+
+
+if os.environ.get(PROFILE_ENV):
+    _profiler = cProfile.Profile()
+    _profiler.enable()
+atexit.register(_at_exit)
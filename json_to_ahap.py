@@ -2,7 +2,12 @@
 
 import json
 
-def make_ahap(haptic_events, output_file="engine_gemini_test.ahap"):
+from ahap_writer import write_ahap
+
+events_file = "haptic_events.json"
+output_ahap = "engine_gemini_test.ahap"
+
+def make_ahap(haptic_events, output_file=output_ahap):
     pattern = {
         "Pattern": [
             {
@@ -18,15 +23,15 @@ def make_ahap(haptic_events, output_file="engine_gemini_test.ahap"):
             } for event in haptic_events
         ]
     }
-    ahap = {
-        "Version": 1,
-        "Pattern": pattern["Pattern"]
-    }
-    with open(output_file, "w") as f:
-        json.dump(ahap, f, indent=2)
+    write_ahap(output_file, pattern["Pattern"])
     print(f"Saved .ahap file as {output_file}")
 
+def convert(events_file=events_file, output_file=output_ahap):
+    with open(events_file) as f:
+        haptic_events = json.load(f)
+    make_ahap(haptic_events, output_file)
+    return len(haptic_events)
+
 # Usage:
-with open("haptic_events.json") as f:
-    haptic_events = json.load(f)
-make_ahap(haptic_events)
+if __name__ == '__main__':
+    convert()
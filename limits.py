@@ -0,0 +1,8 @@
+# Core Haptics device limits shared by the post-processing passes
+# (compact.py, schedule.py) and the validator (ahap_stats.py). Kept free of
+# imports so reading them does not pull in the writers.
+
+MAX_DURATION = 30.0     # seconds a continuous event may last
+MAX_CURVE_POINTS = 16   # control points per parameter curve
+MAX_RATE = 40.0         # transients per second the actuator renders distinctly
+MAX_CONTINUOUS = 2      # continuous events playing at once
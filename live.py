@@ -0,0 +1,116 @@
+# Low-latency haptics for live audio.
+#
+# The RMS / spectral-centroid mapping of audio_to_haptic.py, driven by an async
+# stream of mono float32 blocks instead of a finished file. Frames are cut by
+# features.Framer exactly as in the offline pass; only the normalization
+# differs: the global rms.min()/max() is not known live, so each feature is
+# scaled by a running range that follows new peaks immediately and relaxes
+# back over `release` seconds.
+#
+# A frame is complete frame_length // 2 samples after its centre (~23 ms at
+# 44.1 kHz), so with small blocks an event is out well under 50 ms after the
+# sound it represents.
+#
+#   ffmpeg -i input.mp4 -f f32le -ac 1 -ar 44100 - | python live.py > events.jsonl
+
+import asyncio
+import json
+import sys
+import time
+import numpy as np
+
+from features import Framer
+from event_table import EventTable
+
+sr = 44100
+frame_length = 2048  # ~50ms
+hop_length = 1024    # ~25ms
+block_size = 256     # samples per read, ~6ms
+release = 10.0       # seconds for the running range to relax after a peak
+
+
+class RunningRange:
+    # Running min/max normalization: jumps to new extremes, relaxes towards
+    # the current value with time constant `release`
+    def __init__(self, rate, release=release):
+        self.alpha = min(1.0, 1.0 / (rate * release))
+        self.lo = self.hi = None
+
+    def __call__(self, values):
+        out = np.empty(len(values))
+        for i, x in enumerate(values):
+            if self.lo is None:
+                self.lo = self.hi = x
+            self.lo = min(x, self.lo + (x - self.lo) * self.alpha)
+            self.hi = max(x, self.hi + (x - self.hi) * self.alpha)
+            out[i] = (x - self.lo) / (self.hi - self.lo + 1e-6)
+        return out
+
+
+async def stream_haptics(blocks, sr=sr, frame_length=frame_length, hop_length=hop_length, release=release):
+    # Async generator of AHAP "Event" entries, one per frame, as soon as each
+    # frame is complete. `blocks` is an async iterable of mono float32 arrays.
+    framer = Framer(sr, frame_length, hop_length)
+    rate = sr / hop_length
+    norm_rms, norm_cent = RunningRange(rate, release), RunningRange(rate, release)
+    n_frames = 0
+
+    def events(frames):
+        nonlocal n_frames
+        if frames is None:
+            return []
+        rms, cent, _ = frames
+        times = (n_frames + np.arange(len(rms))) * hop_length / sr
+        n_frames += len(rms)
+        return EventTable(times, norm_rms(rms), norm_cent(cent)).to_ahap_events()
+
+    async for block in blocks:
+        for event in events(framer.push(block)):
+            yield event
+    for event in events(framer.push(np.zeros(0, dtype=np.float32), final=True)):
+        yield event
+
+
+async def reader_blocks(reader, block_size=block_size):
+    # Mono float32 blocks from an asyncio.StreamReader carrying raw f32le PCM
+    # (a pipe or socket)
+    pending = b''
+    while True:
+        data = await reader.read(block_size * 4)
+        if not data:
+            break
+        data = pending + data
+        usable = len(data) - len(data) % 4
+        pending = data[usable:]
+        if usable:
+            yield np.frombuffer(data[:usable], dtype='<f4')
+
+
+async def simulated_blocks(y, sr=sr, block_size=block_size, start=None):
+    # Real-time stand-in for a live source: each block is released once its
+    # last sample would have been captured
+    start = time.perf_counter() if start is None else start
+    for i in range(0, len(y), block_size):
+        block = y[i:i + block_size]
+        delay = start + (i + len(block)) / sr - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        yield block
+
+
+async def _stdin_reader():
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin.buffer)
+    return reader
+
+
+async def main():
+    reader = await _stdin_reader()
+    async for event in stream_haptics(reader_blocks(reader)):
+        sys.stdout.write(json.dumps(event) + '\n')
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,293 @@
+# Haptic effect templates shared by the generators.
+#
+# Each effect (explosion, gunfire, whoosh, inflate, rumble, pulse) is a short
+# AHAP snippet with times relative to the effect start. It is compiled once
+# into a Template: plain intensity/sharpness events become EventTable columns,
+# parameter curves become arrays, and anything else is kept as-is. Placing an
+# effect is then an offset (and optional stretch / intensity scale) applied to
+# those arrays:
+#
+#     TEMPLATES = library()
+#     TEMPLATES['explosion'].at(12.5)                # entries for one window
+#     expand([(TEMPLATES['rumble'], t) for t in ts])  # whole timeline at once
+#
+# Snippets can also come from .ahap files: every <name>.ahap in TEMPLATE_DIR
+# adds or replaces the template of that name. As in AHAP, curve control point
+# times are relative to their curve's Time.
+
+import copy
+import hashlib
+import json
+import os
+import numpy as np
+
+from event_table import EventTable, EVENT_TYPES, CONTINUOUS
+
+TEMPLATE_DIR = 'haptic_templates'
+
+PARAMETERS = ("HapticIntensity", "HapticSharpness")
+
+
+def transient(time, intensity, sharpness):
+    return {
+        "Event": {
+            "Time": time,
+            "EventType": "HapticTransient",
+            "EventParameters": [
+                {"ParameterID": "HapticIntensity", "ParameterValue": intensity},
+                {"ParameterID": "HapticSharpness", "ParameterValue": sharpness}
+            ]
+        }
+    }
+
+
+def continuous(time, duration, intensity, sharpness):
+    return {
+        "Event": {
+            "Time": time,
+            "EventType": "HapticContinuous",
+            "EventDuration": duration,
+            "EventParameters": [
+                {"ParameterID": "HapticIntensity", "ParameterValue": intensity},
+                {"ParameterID": "HapticSharpness", "ParameterValue": sharpness}
+            ]
+        }
+    }
+
+
+def curve(parameter_id, time, points):
+    return {
+        "ParameterCurve": {
+            "ParameterID": parameter_id,
+            "Time": time,
+            "ParameterCurveControlPoints": [{"Time": t, "ParameterValue": v} for t, v in points]
+        }
+    }
+
+
+BUILTIN = {
+    "explosion": [transient(0.0, 1.0, 1.0)],
+    "gunfire": [transient(0.0, 0.8, 1.0)],
+    "whoosh": [transient(0.0, 0.7, 0.5)],
+    # Swell and fade over the effect, sharpness sweeping from dull to crisp
+    "inflate": [
+        continuous(0.0, 1.5, 1.0, 0.5),
+        curve("HapticIntensityControl", 0.0, [(0.0, 0.0), (1.1, 0.5), (1.5, 0.0)]),
+        curve("HapticSharpnessControl", 0.0, [(0.0, -0.8), (1.5, 0.8)]),
+    ],
+    # Dull transients every 40 ms under a fade-in / fade-out envelope
+    "rumble": [curve("HapticIntensityControl", 0.0, [(0.0, 0.3), (0.1, 1.0), (0.8, 1.0), (1.0, 0.0)])]
+              + [transient(i * 0.04, 1.0, 0.1) for i in range(25)],
+    # Dull transients every 100 ms
+    "pulse": [transient(i * 0.1, 1.0, 0.1) for i in range(10)],
+}
+
+
+# Bumped when placement (Template.at) changes its output, so incremental state
+# built with the old placement is not reused
+PLACEMENT_VERSION = 2
+
+
+def event_columns(entry):
+    # (time, type, duration, intensity, sharpness) for a plain intensity/sharpness event, else None
+    event = entry.get("Event")
+    if event is None or event.get("EventType") not in EVENT_TYPES:
+        return None
+    if set(event) - {"Time", "EventType", "EventDuration", "EventParameters"}:
+        return None
+    params = {p["ParameterID"]: p["ParameterValue"] for p in event.get("EventParameters", [])}
+    if set(params) != set(PARAMETERS):
+        return None
+    return (float(event["Time"]), EVENT_TYPES.index(event["EventType"]), float(event.get("EventDuration", 0.0)),
+            float(params["HapticIntensity"]), float(params["HapticSharpness"]))
+
+
+def _extent(entries):
+    end = 0.0
+    for entry in entries:
+        if "Event" in entry:
+            end = max(end, entry["Event"]["Time"] + entry["Event"].get("EventDuration", 0.0))
+        elif "ParameterCurve" in entry:
+            c = entry["ParameterCurve"]
+            end = max(end, c["Time"] + max((p["Time"] for p in c["ParameterCurveControlPoints"]), default=0.0))
+    return end
+
+
+class Template:
+    # One effect compiled for placement: entries are in the snippet's order,
+    # times relative to the effect start, `duration` the nominal length
+    def __init__(self, entries, duration=None, name=None):
+        self.source = list(entries)
+        self.name = name
+        self.duration = _extent(self.source) if duration is None else duration
+        self.layout = []   # per entry: ('row' | 'curve' | 'raw', index)
+        rows, self.curves, self.raw = [], [], []
+        for entry in self.source:
+            row = event_columns(entry)
+            if row is not None:
+                self.layout.append(('row', len(rows)))
+                rows.append(row)
+            elif "ParameterCurve" in entry:
+                c = entry["ParameterCurve"]
+                points = c["ParameterCurveControlPoints"]
+                self.layout.append(('curve', len(self.curves)))
+                self.curves.append((c["ParameterID"], float(c["Time"]),
+                                    np.array([p["Time"] for p in points], dtype=float),
+                                    np.array([p["ParameterValue"] for p in points], dtype=float)))
+            else:
+                self.layout.append(('raw', len(self.raw)))
+                self.raw.append(entry)
+        columns = list(zip(*rows)) if rows else [[], [], [], [], []]
+        self.rows = EventTable(columns[0], columns[3], columns[4], columns[1], columns[2])
+        self.row_pos = np.array([pos for pos, (kind, _) in enumerate(self.layout) if kind == 'row'], dtype=int)
+
+    def __len__(self):
+        return len(self.layout)
+
+    def _rows(self, duration, scale):
+        # Row columns stretched to `duration`: event ends that coincide with the
+        # template's end move with it, everything else keeps its offset
+        rows = self.rows
+        if duration is None and scale == 1.0:
+            return rows
+        rows = rows.select(slice(None))
+        if duration is not None and duration != self.duration:
+            at_end = np.isclose(rows.time + rows.duration, self.duration) & (rows.duration > 0)
+            rows.duration[at_end] = duration - rows.time[at_end]
+        if scale != 1.0:
+            rows.intensity *= scale
+        return rows
+
+    def _curve(self, k, offset, duration):
+        parameter_id, time, times, values = self.curves[k]
+        if duration is not None and duration != self.duration:
+            # A curve ending with the template is scaled to end with the stretched
+            # effect; any other keeps its offsets, cut off at the new end
+            span = self.duration - time
+            if len(times) and span > 0 and np.isclose(time + times[-1], self.duration):
+                times = times * (max(duration - time, 0.0) / span)
+            else:
+                times = np.minimum(times, max(duration - time, 0.0))
+        return {
+            "ParameterCurve": {
+                "ParameterID": parameter_id,
+                "Time": round(offset + time, 3),
+                "ParameterCurveControlPoints": [
+                    {"Time": round(t, 3), "ParameterValue": v}
+                    for t, v in zip(times.tolist(), values.tolist())
+                ]
+            }
+        }
+
+    def _raw(self, k, offset):
+        entry = copy.deepcopy(self.raw[k])
+        for body in entry.values():
+            if isinstance(body, dict) and "Time" in body:
+                body["Time"] = round(offset + body["Time"], 3)
+        return entry
+
+    def at(self, offset, duration=None, scale=1.0):
+        # Pattern entries for one placement starting at `offset` seconds
+        rows = self._rows(duration, scale)
+        events = []
+        columns = zip(rows.time.tolist(), rows.event_type.tolist(), rows.duration.tolist(),
+                      rows.intensity.tolist(), rows.sharpness.tolist())
+        for t, event_type, event_duration, inten, sharp in columns:
+            event = {"Time": round(offset + t, 3), "EventType": EVENT_TYPES[event_type]}
+            if event_type == CONTINUOUS or event_duration > 0:
+                event["EventDuration"] = event_duration
+            event["EventParameters"] = [
+                {"ParameterID": "HapticIntensity", "ParameterValue": inten},
+                {"ParameterID": "HapticSharpness", "ParameterValue": sharp}
+            ]
+            events.append({"Event": event})
+        entries = []
+        for kind, k in self.layout:
+            if kind == 'row':
+                entries.append(events[k])
+            elif kind == 'curve':
+                entries.append(self._curve(k, offset, duration))
+            else:
+                entries.append(self._raw(k, offset))
+        return entries
+
+
+def expand(placements):
+    # Pattern entries for [(template, offset), ...], in placement order.
+    # Event rows are offset with one array operation per template and emitted
+    # as EventTable runs; only curves and raw entries are built one by one.
+    groups = {}
+    for p, (template, offset) in enumerate(placements):
+        group = groups.setdefault(id(template), (template, [], []))
+        group[1].append(p)
+        group[2].append(offset)
+    width = max((len(t) for t, _, _ in groups.values()), default=0) + 1
+
+    keys, tables, others = [], [], []
+    for template, index, offsets in groups.values():
+        index, offsets = np.array(index), np.array(offsets, dtype=float)
+        rows = template.rows
+        if len(rows):
+            n = len(index)
+            keys.append((index[:, None] * width + template.row_pos[None, :]).ravel())
+            tables.append(EventTable((offsets[:, None] + rows.time[None, :]).ravel(),
+                                     np.tile(rows.intensity, n), np.tile(rows.sharpness, n),
+                                     np.tile(rows.event_type, n), np.tile(rows.duration, n)))
+        for pos, (kind, k) in enumerate(template.layout):
+            if kind == 'row':
+                continue
+            for p, offset in zip(index.tolist(), offsets.tolist()):
+                entry = template._curve(k, offset, None) if kind == 'curve' else template._raw(k, offset)
+                others.append((p * width + pos, entry))
+
+    if tables:
+        keys = np.concatenate(keys)
+        order = np.argsort(keys, kind='stable')
+        keys, table = keys[order], EventTable.concat(tables).select(order)
+    else:
+        keys, table = np.zeros(0, dtype=int), EventTable([], [], [])
+
+    entries, start = [], 0
+    for key, entry in sorted(others, key=lambda item: item[0]):
+        stop = int(np.searchsorted(keys, key))
+        if stop > start:
+            entries.append(table.select(slice(start, stop)))
+        entries.append(entry)
+        start = stop
+    if start < len(keys):
+        entries.append(table.select(slice(start, None)))
+    return entries
+
+
+def load_template(path, name=None):
+    # Template from an .ahap snippet; times are made relative to its first entry
+    with open(path) as f:
+        pattern = json.load(f)["Pattern"]
+    start = min((body["Time"] for entry in pattern for body in entry.values()
+                 if isinstance(body, dict) and "Time" in body), default=0.0)
+    if start:
+        pattern = copy.deepcopy(pattern)
+        for entry in pattern:
+            for body in entry.values():
+                if isinstance(body, dict) and "Time" in body:
+                    body["Time"] = body["Time"] - start
+    return Template(pattern, name=name or os.path.splitext(os.path.basename(path))[0])
+
+
+def library(template_dir=TEMPLATE_DIR):
+    # Built-in templates, plus / overridden by <template_dir>/<name>.ahap
+    templates = {name: Template(entries, name=name) for name, entries in BUILTIN.items()}
+    if template_dir and os.path.isdir(template_dir):
+        for file_name in sorted(os.listdir(template_dir)):
+            if file_name.lower().endswith('.ahap'):
+                template = load_template(os.path.join(template_dir, file_name))
+                templates[template.name] = template
+    return templates
+
+
+def library_digest(templates):
+    # Content hash of a template library (for the incremental state fingerprint)
+    h = hashlib.sha1(f"placement {PLACEMENT_VERSION}".encode())
+    for name in sorted(templates):
+        h.update(json.dumps([name, templates[name].source, templates[name].duration]).encode())
+    return h.hexdigest()
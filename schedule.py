@@ -0,0 +1,175 @@
+# Device-aware scheduling pass.
+#
+# Generators place effects window by window and happily stack a feature
+# transient, an engine rumble and an explosion on the same timestamp, or let
+# 1.5 s continuous events overlap. Devices drop or smear events past their
+# limits, so this pass decides what to keep before the pattern is written:
+#
+# - transients closer than 1 / max_rate keep only the higher-priority one;
+#   equal-priority neighbours are merged into the earlier kept event, which
+#   takes the louder intensity
+# - at most max_continuous continuous events play at once; a higher-priority
+#   event cuts the lowest-priority active one short, anything else is dropped
+# - parameter curves are dropped with the last event of their group
+#
+# Work is O(n log n): one sort, then a slot grid for the rate limit and a
+# short active list for the concurrency limit.
+#
+#   python schedule.py pattern.ahap scheduled.ahap     (every entry at equal priority)
+
+import json
+import sys
+import numpy as np
+
+from event_table import EventTable, CONTINUOUS
+from patterns import event_columns
+from ahap_writer import write_ahap
+from instrument import stage
+from limits import MAX_RATE, MAX_CONTINUOUS
+
+
+def _entry_time(entry):
+    for body in entry.values():
+        if isinstance(body, dict) and "Time" in body:
+            return float(body["Time"])
+    return 0.0
+
+
+def limit_rate(time, priority, intensity, max_rate=MAX_RATE):
+    # Keep mask for transients at most one per 1 / max_rate seconds, higher
+    # priority first. Returns (keep, intensity, dropped, merged).
+    keep = np.zeros(len(time), dtype=bool)
+    intensity = intensity.copy()
+    if max_rate is None or len(time) == 0:
+        keep[:] = True
+        return keep, intensity, 0, 0
+    min_gap = 1.0 / max_rate
+    slot = np.floor(time / min_gap).astype(np.int64).tolist()
+    times, priorities = time.tolist(), priority.tolist()
+    taken = {}  # slot -> kept index; two kept transients never share a slot
+    dropped = merged = 0
+    for i in np.lexsort((time, -priority)).tolist():
+        s, t = slot[i], times[i]
+        conflict = None
+        for j in (taken.get(s), taken.get(s - 1), taken.get(s + 1)):
+            if j is not None and abs(times[j] - t) < min_gap - 1e-9:
+                if conflict is None or abs(times[j] - t) < abs(times[conflict] - t):
+                    conflict = j
+        if conflict is None:
+            taken[s] = i
+            keep[i] = True
+        elif priorities[conflict] == priorities[i]:
+            intensity[conflict] = max(intensity[conflict], intensity[i])
+            merged += 1
+        else:
+            dropped += 1
+    return keep, intensity, dropped, merged
+
+
+def limit_concurrency(time, duration, priority, max_continuous=MAX_CONTINUOUS):
+    # Keep mask and trimmed durations for continuous events, at most
+    # max_continuous overlapping. Returns (keep, duration, dropped, trimmed).
+    keep = np.ones(len(time), dtype=bool)
+    duration = duration.copy()
+    if max_continuous is None:
+        return keep, duration, 0, 0
+    dropped = trimmed = 0
+    active = []
+    for i in np.lexsort((-priority, time)).tolist():
+        t = time[i]
+        active = [j for j in active if time[j] + duration[j] > t + 1e-9]
+        if len(active) < max_continuous:
+            active.append(i)
+            continue
+        weakest = min(active, key=lambda j: (priority[j], -time[j]))
+        if priority[i] > priority[weakest]:
+            duration[weakest] = t - time[weakest]
+            if duration[weakest] <= 0:
+                keep[weakest] = False
+                dropped += 1
+            else:
+                trimmed += 1
+            active.remove(weakest)
+            active.append(i)
+        else:
+            keep[i] = False
+            dropped += 1
+    return keep, duration, dropped, trimmed
+
+
+def schedule(entries, priority=None, group=None, max_rate=MAX_RATE, max_continuous=MAX_CONTINUOUS):
+    # Time-sorted pattern (EventTable runs and dicts) plus a report dict.
+    # priority / group: one value per entry; curves are kept while any event
+    # of their group survives.
+    entries = list(entries)
+    n = len(entries)
+    priority = np.zeros(n) if priority is None else np.asarray(priority, dtype=float)
+    group = np.arange(n) if group is None else np.asarray(group)
+
+    with stage('schedule', items=n) as timer:
+        rows = [event_columns(entry) for entry in entries]
+        is_event = np.array([row is not None for row in rows], dtype=bool)
+        columns = np.array([row for row in rows if row is not None], dtype=float).reshape(-1, 5)
+        time, event_type, duration, intensity, sharpness = columns.T
+        ev_priority = priority[is_event]
+        continuous = event_type == CONTINUOUS
+
+        keep = np.ones(len(time), dtype=bool)
+        t_keep, t_intensity, t_dropped, merged = limit_rate(
+            time[~continuous], ev_priority[~continuous], intensity[~continuous], max_rate)
+        keep[~continuous] = t_keep
+        intensity[~continuous] = t_intensity
+        c_keep, c_duration, c_dropped, trimmed = limit_concurrency(
+            time[continuous], duration[continuous], ev_priority[continuous], max_continuous)
+        keep[continuous] = c_keep
+        duration[continuous] = c_duration
+
+        # Curves and other entries go when their group lost every event
+        ev_group = group[is_event]
+        live_groups = set(ev_group[keep].tolist())
+        event_groups = set(ev_group.tolist())
+        other_index = np.flatnonzero(~is_event)
+        other_keep = [group[i] in live_groups or group[i] not in event_groups for i in other_index.tolist()]
+        others = [(i, entries[i]) for i, k in zip(other_index.tolist(), other_keep) if k]
+
+        # Merge kept events and other entries by time (pattern order breaks ties)
+        event_index = np.flatnonzero(is_event)[keep]
+        table = EventTable(time[keep], intensity[keep], sharpness[keep], event_type[keep], duration[keep])
+        index = np.concatenate([event_index, [i for i, _ in others]]).astype(np.int64)
+        times = np.concatenate([time[keep], [_entry_time(e) for _, e in others]])
+        order = np.lexsort((index, times))
+        n_events = len(event_index)
+        pattern, run = [], []
+        other_by_pos = {n_events + k: entry for k, (_, entry) in enumerate(others)}
+        for pos in order.tolist():
+            if pos < n_events:
+                run.append(pos)
+                continue
+            if run:
+                pattern.append(table.select(np.array(run)))
+                run = []
+            pattern.append(other_by_pos[pos])
+        if run:
+            pattern.append(table.select(np.array(run)))
+
+        report = {
+            "entries_in": n,
+            "entries_out": n_events + len(others),
+            "dropped": t_dropped + c_dropped,
+            "merged": merged,
+            "trimmed": trimmed,
+            "curves_dropped": len(other_index) - len(others),
+        }
+        timer.info.update(report)
+    return pattern, report
+
+
+if __name__ == '__main__':
+    src, dst = sys.argv[1], sys.argv[2]
+    with open(src) as f:
+        ahap = json.load(f)
+    pattern, report = schedule(ahap["Pattern"])
+    write_ahap(dst, pattern, version=ahap.get("Version", 1))
+    print(f"{src} -> {dst}: {report['entries_in']} -> {report['entries_out']} entries "
+          f"({report['dropped']} dropped, {report['merged']} merged, {report['trimmed']} trimmed, "
+          f"{report['curves_dropped']} curves dropped)")
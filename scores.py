@@ -0,0 +1,135 @@
+# Per-window YAMNet scores kept next to the label timeline.
+#
+# yamnet_to_json.py saves the top-k class scores of every window to
+# <timeline>.scores.npz. Relabelling from that file (different smoothing,
+# confidence threshold, class list) takes milliseconds and never loads the
+# model again:
+#
+#     python scores.py      # yamnet_timeline.scores.npz -> yamnet_relabelled.json + yamnet_segments.json
+#
+# The relabelled timeline goes to its own file: yamnet_timeline.json may
+# carry hand corrections, and is only replaced when asked to (-o).
+#
+# Smoothing removes single-window flicker (Music -> Speech -> Music), either
+# with a sliding mode filter or with an HMM-style Viterbi pass that charges a
+# fixed cost for every label switch.
+
+import json
+import os
+import numpy as np
+
+from timeline import label_segments
+
+timeline_json = 'yamnet_timeline.json'
+relabelled_json = 'yamnet_relabelled.json'
+segments_json = 'yamnet_segments.json'
+
+TOP_K = 10              # classes kept per window
+smoothing = 'hmm'       # 'hmm', 'mode' or None
+switch_prob = 0.05      # hmm: prior probability of a label change between windows
+mode_width = 3          # mode: windows in the sliding majority vote (odd)
+min_confidence = 0.0    # windows below this get fallback_label
+fallback_label = 'Unknown'
+
+
+def scores_path(timeline_path):
+    return os.path.splitext(timeline_path)[0] + '.scores.npz'
+
+
+def save_scores(path, starts, window_scores, class_map, sr=16000, k=TOP_K):
+    # Top-k (index, score) pairs per window, best first
+    k = min(k, window_scores.shape[1])
+    index = np.argsort(-window_scores, axis=1, kind='stable')[:, :k]
+    np.savez_compressed(path,
+                        starts=np.asarray(starts, dtype=np.int64),
+                        sr=np.int64(sr),
+                        index=index.astype(np.uint16),
+                        scores=np.take_along_axis(window_scores, index, axis=1).astype(np.float32),
+                        classes=np.asarray(class_map))
+
+
+def load_scores(path):
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def candidate_scores(store):
+    # (class indices, n_windows x n_candidates score matrix) over every class
+    # that makes some window's top-k. Scores missing from a window's top-k are
+    # bounded by its k-th score, which is used in their place.
+    candidates, columns = np.unique(store['index'], return_inverse=True)
+    columns = columns.reshape(store['index'].shape)
+    rows = np.arange(len(columns))[:, None]
+    matrix = np.repeat(store['scores'][:, -1:], len(candidates), axis=1)
+    matrix[rows, columns] = store['scores']
+    return candidates, matrix
+
+
+def viterbi(matrix, switch_prob=switch_prob):
+    # Most likely column per row when each row switches column with probability switch_prob
+    log_emit = np.log(np.maximum(matrix, 1e-6))
+    stay, switch = np.log1p(-switch_prob), np.log(switch_prob)
+    n, m = matrix.shape
+    back = np.zeros((n, m), dtype=np.int32)
+    delta = log_emit[0].copy()
+    for i in range(1, n):
+        best = int(delta.argmax())
+        from_best = delta[best] + switch
+        stay_score = delta + stay
+        back[i] = np.where(stay_score >= from_best, np.arange(m), best)
+        delta = np.maximum(stay_score, from_best) + log_emit[i]
+    path = np.empty(n, dtype=np.int32)
+    path[-1] = int(delta.argmax())
+    for i in range(n - 1, 0, -1):
+        path[i - 1] = back[i, path[i]]
+    return path
+
+
+def mode_filter(labels, width=mode_width):
+    # Sliding majority vote over integer labels (ties keep the centre label)
+    half = width // 2
+    padded = np.pad(labels, half, mode='edge')
+    windows = np.lib.stride_tricks.sliding_window_view(padded, width)
+    out = labels.copy()
+    for i, window in enumerate(windows):
+        values, counts = np.unique(window, return_counts=True)
+        if counts.max() > np.sum(window == labels[i]):
+            out[i] = values[counts.argmax()]
+    return out
+
+
+def relabel(store, smoothing=smoothing, switch_prob=switch_prob, width=mode_width,
+            min_confidence=min_confidence, fallback=fallback_label):
+    # Label timeline (same shape as yamnet_timeline.json) from stored scores
+    candidates, matrix = candidate_scores(store)
+    if len(matrix) == 0:
+        return []
+    if smoothing == 'hmm':
+        choice = viterbi(matrix, switch_prob)
+    elif smoothing == 'mode':
+        choice = mode_filter(matrix.argmax(axis=1), width)
+    elif smoothing is None:
+        choice = matrix.argmax(axis=1)
+    else:
+        raise ValueError(f"unknown smoothing {smoothing!r}")
+
+    classes, sr = store['classes'], int(store['sr'])
+    confidence = matrix[np.arange(len(matrix)), choice]
+    timeline = []
+    for start, c, conf in zip(store['starts'].tolist(), choice.tolist(), confidence.tolist()):
+        timeline.append({
+            "time": round(start / sr, 2),
+            "label": str(classes[candidates[c]]) if conf >= min_confidence else fallback,
+            "confidence": conf
+        })
+    return timeline
+
+
+if __name__ == '__main__':
+    timeline = relabel(load_scores(scores_path(timeline_json)))
+    segments = label_segments(timeline)
+    with open(relabelled_json, 'w') as f:
+        json.dump(timeline, f, indent=2)
+    with open(segments_json, 'w') as f:
+        json.dump(segments, f, indent=2)
+    print(f"Saved {relabelled_json} ({len(timeline)} windows) and {segments_json} ({len(segments)} segments)")
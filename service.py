@@ -0,0 +1,361 @@
+# Long-running generation service.
+#
+# One-off runs pay for importing TensorFlow, loading YAMNet and decoding the
+# audio every time, which dominates the latency on short clips. Here a pool
+# of worker processes loads YAMNet once (and traces its graph and warms the
+# feature code on a dummy input), and each worker keeps the decoded features
+# and label timeline of recent files in an LRU cache keyed by their content
+# hash. A request re-runs only the mapping (test.py's hybrid pass), with its
+# own config, on cached input. Requests for a file go to the same worker so
+# its cache is hit, unless that worker is backed up.
+#
+# The front end is a small asyncio HTTP/1.1 server on a TCP port or a Unix
+# socket:
+#   POST /generate  {"path": "clip.mp4", "config": {...}}  ->  the AHAP
+#   GET  /health, GET /stats
+# Config keys (all optional) override test.py's settings for that request:
+#   mask_classes       ["Speech", "Silence"]
+#   event_categories   {"Wind": null, "Rain": "Whoosh"}   merged into EVENT_CATEGORIES, null removes
+#   feature_threshold  0.1       max_event_rate 40.0       max_continuous 2
+#   schedule           true      minify false               decimals null
+#   sync               false     align to the video's frame timing (sync.py)
+#
+#   python service.py --port 8765 -j 4
+#   python service.py --socket /tmp/hapticx.sock
+#   curl -s localhost:8765/generate -d '{"path": "/abs/clip.mp4"}' > clip.ahap
+
+import argparse
+import asyncio
+import io
+import json
+import multiprocessing as mp
+import os
+import time
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+DEFAULT_PORT = 8765
+CACHE_ENTRIES = 32      # files whose features each worker keeps in memory
+AFFINITY_BACKLOG = 2    # jobs queued on a file's worker before it goes to the least busy one
+MAX_BODY = 1 << 20      # bytes of request body
+LATENCY_WINDOW = 10000  # requests kept for the /stats percentiles
+
+# Request config key -> test.py setting it overrides
+CONFIG_KEYS = {
+    "mask_classes": "MASK_CLASSES",
+    "event_categories": "EVENT_CATEGORIES",
+    "feature_threshold": "FEATURE_THRESHOLD",
+    "max_event_rate": "max_event_rate",
+    "max_continuous": "max_continuous",
+    "schedule": "schedule_events",
+    "minify": "minify",
+    "decimals": "float_decimals",
+}
+# Scalar config values: (accepted types, may be null, lowest allowed value)
+CONFIG_TYPES = {
+    "feature_threshold": ((int, float), False, 0),
+    "max_event_rate": ((int, float), True, 1e-3),   # null: no rate limit
+    "max_continuous": ((int,), True, 0),            # null: no concurrency limit
+    "schedule": ((bool,), False, None),
+    "minify": ((bool,), False, None),
+    "decimals": ((int,), True, 0),                  # null: full precision
+}
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class RequestError(ValueError):
+    # Bad request (answered with 400); raised in the workers as well
+    status = 400
+
+
+# --- Worker side (one request at a time per process) ---
+
+_cache = None     # content hash -> {"timeline", "feats", "engine_feats", "timing"}
+_cache_entries = CACHE_ENTRIES
+_hashes = {}      # (path, size, mtime) -> content hash, so unchanged files are not re-hashed
+
+
+def _init_worker(tf_threads, cache_entries):
+    global _cache, _cache_entries
+    import numpy as np
+    import batch
+    import features
+    import yamnet_to_json
+    batch._init_worker(tf_threads)
+    _cache, _cache_entries = OrderedDict(), cache_entries
+    # The first calls trace YAMNet's graph and compile librosa's kernels: do them now
+    yamnet_to_json.wav_scores(batch._model, np.zeros(16000, dtype=np.float32))
+    features._features(np.zeros(8192, dtype=np.float32), 44100, 2048, 1024)
+
+
+def _ping():
+    return os.getpid()
+
+
+def _file_hash(path):
+    from features import audio_hash
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    if key not in _hashes:
+        if len(_hashes) > 16 * _cache_entries:
+            _hashes.clear()
+        _hashes[key] = audio_hash(path)
+    return _hashes[key]
+
+
+def analysis(path):
+    # (cache entry, hit) for one audio / video file: a single ffmpeg decode
+    # feeds both feature passes and YAMNet, as in batch.py --pipe
+    import batch
+    import test
+    import yamnet_to_json
+    from extract_audio import pipe_audio
+
+    key = _file_hash(path)
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key], True
+    window_params = (int(yamnet_to_json.hop_duration * test.sr),) * 2
+    engine_params = test.engine_frame_params(test.sr)
+    tracks, wav = pipe_audio(path, (window_params, engine_params), sr=test.sr)
+    entry = {
+        "timeline": yamnet_to_json.wav_timeline(batch._model, wav, batch._class_map),
+        "feats": tracks[window_params],
+        "engine_feats": tracks[engine_params],
+        "timing": None,  # sync.probe_timing, on first use
+    }
+    _cache[key] = entry
+    while len(_cache) > _cache_entries:
+        _cache.popitem(last=False)
+    return entry, False
+
+
+def _check_type(key, value):
+    types, nullable, lowest = CONFIG_TYPES[key]
+    if value is None and nullable:
+        return
+    # JSON true / false are ints to isinstance; only accept them for bool settings
+    if not isinstance(value, types) or isinstance(value, bool) != (types == (bool,)):
+        name = {int: "an integer", float: "a number", bool: "true or false"}[types[-1]]
+        raise RequestError(f"{key} must be {name}{' or null' if nullable else ''}, not {json.dumps(value)}")
+    if lowest is not None and value < lowest:
+        raise RequestError(f"{key} must be at least {lowest}, not {json.dumps(value)}")
+
+
+@contextmanager
+def mapping_config(config):
+    # test.py settings overridden for the duration of one request
+    import test
+    unknown = set(config) - set(CONFIG_KEYS)
+    if unknown:
+        raise RequestError(f"unknown config keys: {', '.join(sorted(unknown))}")
+    saved = {name: getattr(test, name) for name in CONFIG_KEYS.values()}
+    try:
+        for key, value in config.items():
+            if key == "event_categories":
+                if not isinstance(value, dict):
+                    raise RequestError("event_categories must be an object of label -> category")
+                categories = set(test.CATEGORY_TEMPLATES) | {"Engine"}
+                bad = {c for c in value.values() if c is not None and c not in categories}
+                if bad:
+                    raise RequestError(f"unknown categories {sorted(bad)} (known: {sorted(categories)})")
+                value = {label: c for label, c in {**test.EVENT_CATEGORIES, **value}.items() if c is not None}
+            elif key == "mask_classes" and not (isinstance(value, list) and all(isinstance(v, str) for v in value)):
+                raise RequestError("mask_classes must be a list of labels")
+            elif key in CONFIG_TYPES:
+                _check_type(key, value)
+            setattr(test, CONFIG_KEYS[key], value)
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(test, name, value)
+
+
+def generate_job(path, config):
+    # AHAP text and timings for one request
+    import instrument
+    import test
+    from ahap_writer import write_ahap
+
+    instrument.reset()  # the library stages of earlier jobs are not reported anywhere
+    config = dict(config)
+    sync = config.pop("sync", False)
+    if not isinstance(sync, bool):
+        raise RequestError(f"sync must be true or false, not {json.dumps(sync)}")
+    t0 = time.perf_counter()
+    with mapping_config(config):
+        entry, hit = analysis(path)
+        t1 = time.perf_counter()
+        timeline = entry["timeline"]
+        ctx = test.prepare(timeline, None, test.sr, entry["feats"], entry["engine_feats"])
+        per_window = [test.window_entries(ctx, i) for i in range(len(timeline))]
+        pattern, n_events = test.schedule_pattern(timeline, [e for entries in per_window for e in entries],
+                                                  [len(entries) for entries in per_window])
+        if sync:
+            from sync import probe_timing, align_pattern
+            if entry["timing"] is None:
+                entry["timing"] = probe_timing(path)
+            pattern, _ = align_pattern(pattern, entry["timing"])
+        out = io.StringIO()
+        write_ahap(out, pattern, minify=test.minify, decimals=test.float_decimals)
+    return {
+        "ahap": out.getvalue(),
+        "events": n_events,
+        "cache": "hit" if hit else "miss",
+        "analysis_seconds": t1 - t0,
+        "mapping_seconds": time.perf_counter() - t1,
+        "worker": os.getpid(),
+    }
+
+
+# --- Front end ---
+
+class Service:
+    def __init__(self, workers, tf_threads=1, cache_entries=CACHE_ENTRIES):
+        # spawn: TensorFlow is not fork-safe; one single-process pool per
+        # worker, so requests can be routed to the worker holding a file
+        context = mp.get_context('spawn')
+        self.pools = [ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_init_worker,
+                                          initargs=(tf_threads, cache_entries)) for _ in range(workers)]
+        self.pending = [0] * workers
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.counts = {"requests": 0, "errors": 0, "cache_hits": 0}
+
+    async def start(self):
+        # Run the initializers (model load, warm-up) before taking requests
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(pool, _ping) for pool in self.pools))
+
+    def close(self):
+        for pool in self.pools:
+            pool.shutdown(cancel_futures=True)
+
+    def pick(self, path):
+        i = zlib.crc32(path.encode()) % len(self.pools)
+        if self.pending[i] >= AFFINITY_BACKLOG:
+            i = min(range(len(self.pools)), key=self.pending.__getitem__)
+        return i
+
+    async def generate(self, request):
+        path, config = request.get("path"), request.get("config") or {}
+        if not isinstance(path, str) or not isinstance(config, dict):
+            raise RequestError('expected {"path": "...", "config": {...}}')
+        path = os.path.abspath(path)
+        if not os.path.isfile(path):
+            error = RequestError(f"no such file: {path}")
+            error.status = 404
+            raise error
+        i = self.pick(path)
+        self.pending[i] += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pools[i], generate_job, path, config)
+        finally:
+            self.pending[i] -= 1
+
+    def stats(self):
+        import numpy as np
+        latencies = np.array(self.latencies) * 1000
+        return dict(self.counts, workers=len(self.pools), pending=sum(self.pending), **{
+            f"latency_{name}_ms": round(float(np.percentile(latencies, q)), 1) if len(latencies) else None
+            for name, q in (("p50", 50), ("p99", 99))})
+
+    async def respond(self, method, target, body):
+        # (status, body bytes, extra headers)
+        if target == "/health" and method == "GET":
+            return 200, json.dumps({"ok": True, "workers": len(self.pools)}).encode(), {}
+        if target == "/stats" and method == "GET":
+            return 200, json.dumps(self.stats()).encode(), {}
+        if target != "/generate":
+            return 404, b'{"error": "not found"}', {}
+        if method != "POST":
+            return 405, b'{"error": "POST only"}', {}
+
+        t0 = time.perf_counter()
+        self.counts["requests"] += 1
+        try:
+            result = await self.generate(json.loads(body or b'{}'))
+        except (RequestError, json.JSONDecodeError) as e:
+            self.counts["errors"] += 1
+            return getattr(e, 'status', 400), json.dumps({"error": str(e)}).encode(), {}
+        except Exception as e:
+            self.counts["errors"] += 1
+            return 500, json.dumps({"error": repr(e)}).encode(), {}
+        self.latencies.append(time.perf_counter() - t0)
+        self.counts["cache_hits"] += result["cache"] == "hit"
+        return 200, result["ahap"].encode(), {
+            "X-Events": result["events"],
+            "X-Cache": result["cache"],
+            "X-Analysis-Seconds": f"{result['analysis_seconds']:.4f}",
+            "X-Mapping-Seconds": f"{result['mapping_seconds']:.4f}",
+        }
+
+    async def handle(self, reader, writer):
+        # One connection; keep-alive until the client closes or asks to
+        try:
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                method, target = line.decode('latin-1').split()[:2]
+                headers = {}
+                while (header := await reader.readline()).strip():
+                    name, _, value = header.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY:
+                    status, body, extra = 413, b'{"error": "body too large"}', {}
+                    headers['connection'] = 'close'
+                else:
+                    status, body, extra = await self.respond(method, target, await reader.readexactly(length))
+                close = headers.get('connection', '').lower() == 'close'
+                head = [f"HTTP/1.1 {status} {REASONS[status]}",
+                        "Content-Type: application/json",
+                        f"Content-Length: {len(body)}"]
+                head += [f"{name}: {value}" for name, value in extra.items()]
+                if close:
+                    head.append("Connection: close")
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + body)
+                await writer.drain()
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(port=DEFAULT_PORT, socket_path=None, workers=2, tf_threads=1, cache_entries=CACHE_ENTRIES,
+                host='127.0.0.1'):
+    service = Service(workers, tf_threads, cache_entries)
+    try:
+        t0 = time.perf_counter()
+        await service.start()
+        if socket_path:
+            server = await asyncio.start_unix_server(service.handle, socket_path)
+            where = socket_path
+        else:
+            server = await asyncio.start_server(service.handle, host, port)
+            where = f"http://{host}:{port}"
+        print(f"{workers} workers ready in {time.perf_counter() - t0:.1f} s, listening on {where}", flush=True)
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve AHAP generation with warm models and feature caches.")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--socket', help="listen on this Unix socket instead of TCP")
+    parser.add_argument('-j', '--workers', type=int, default=2)
+    parser.add_argument('--tf-threads', type=int, default=1, help="TensorFlow threads per worker (0 = TF default)")
+    parser.add_argument('--cache-entries', type=int, default=CACHE_ENTRIES, help="files cached per worker")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.port, args.socket, args.workers, args.tf_threads, args.cache_entries, args.host))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,245 @@
+# Frame-accurate alignment of haptic event times to the source video.
+#
+# The generators time events on the decoded audio (audio.wav, or the decoder
+# pipe), whose sample 0 is not the video's time 0: the audio stream can start
+# after the first video frame, the decoder drops the codec's priming samples
+# (encoder delay), and gaps in the audio packet timestamps vanish from the
+# decoded stream, so every event after one is early by the gap. On VFR video
+# the frames are not on a 1/fps grid either, so assuming the nominal frame
+# rate drifts over a long video.
+#
+# probe_timing() reads the container timing once, with ffprobe (or, where
+# ffprobe is not installed, ffmpeg's framecrc muxer on stream copies, which
+# prints the same packet timestamps). align_times() maps audio times to
+# presentation times in one vectorized pass over the event array, optionally
+# snapping them to the nearest video frame, and reports the offsets it
+# measured. Snapping is off by default: dense transients (up to 40/s) would
+# pile up on 24-30 fps frame starts.
+#
+#   python sync.py input.mp4 pattern_hybrid.ahap -o pattern_synced.ahap
+#   python sync.py input.mp4 pattern.ahap -o pattern_synced.ahap --snap --json sync.json
+
+import argparse
+import json
+import os
+import subprocess
+from fractions import Fraction
+import numpy as np
+import ffmpeg
+
+from ahap_writer import write_ahap
+from event_table import EventTable
+from instrument import stage
+
+FFPROBE = os.environ.get('HAPTICX_FFPROBE', 'ffprobe')
+FFMPEG = 'ffmpeg'
+GAP_TOLERANCE = 0.005  # seconds; smaller audio timestamp jumps are rounding, not gaps
+ORIGIN_PACKETS = 16    # audio packets decoded to find the first output sample
+
+
+def _run(args):
+    return subprocess.run(args, check=True, capture_output=True, text=True).stdout
+
+
+def _seconds(ticks, time_base):
+    return np.asarray(ticks, dtype=np.int64) * time_base.numerator / time_base.denominator
+
+
+def _probe_ffprobe(video_file):
+    # (video time base, nominal frame rate, audio time base, video (pts, durations),
+    #  audio (pts, durations), time of the first decoded audio sample)
+    streams = ffmpeg.probe(video_file, cmd=FFPROBE)['streams']
+    video = next((s for s in streams if s['codec_type'] == 'video'
+                  and not s.get('disposition', {}).get('attached_pic')), None)
+    audio = next((s for s in streams if s['codec_type'] == 'audio'), None)
+    if video is None or audio is None:
+        raise ValueError(f"{video_file}: needs a video and an audio stream")
+    rows = _run([FFPROBE, '-v', 'error', '-show_entries', 'packet=stream_index,pts,duration',
+                 '-of', 'csv=p=0', video_file])
+    packets = {video['index']: ([], []), audio['index']: ([], [])}
+    for row in rows.splitlines():
+        index, pts, duration = (row.split(',') + ['', ''])[:3]
+        if pts not in ('', 'N/A') and int(index) in packets:
+            packets[int(index)][0].append(int(pts))
+            packets[int(index)][1].append(int(duration) if duration not in ('', 'N/A') else 0)
+
+    # The decoder applies priming / skip samples to the frame timestamps
+    frames = _run([FFPROBE, '-v', 'error', '-select_streams', str(audio['index']),
+                   '-read_intervals', f'%+#{ORIGIN_PACKETS}', '-show_entries', 'frame=pts',
+                   '-of', 'csv=p=0', video_file])
+    origin = min(int(pts) for pts in frames.split() if pts != 'N/A')
+    return (Fraction(video['time_base']), Fraction(video.get('r_frame_rate', '0/1')),
+            Fraction(audio['time_base']), packets[video['index']], packets[audio['index']],
+            _seconds(origin, Fraction(audio['time_base'])))
+
+
+def _framecrc(args):
+    # ({stream: time base}, {stream: (pts, duration)}) from ffmpeg's framecrc output
+    time_bases, packets = {}, {}
+    for line in _run([FFMPEG, '-v', 'error', '-nostdin', '-copyts'] + args + ['-f', 'framecrc', '-']).splitlines():
+        if line.startswith('#tb '):
+            stream, tb = line[4:].split(':')
+            time_bases[int(stream)] = Fraction(tb.strip())
+        elif line and not line.startswith('#'):
+            stream, _, pts, duration = (int(x) for x in line.split(',')[:4])
+            pts_list, durations = packets.setdefault(stream, ([], []))
+            pts_list.append(pts)
+            durations.append(duration)
+    return time_bases, packets
+
+
+def _probe_ffmpeg(video_file):
+    # Same as _probe_ffprobe from stream copies (packet timestamps are kept
+    # as they are) plus one decoded audio frame; no nominal frame rate
+    time_bases, packets = _framecrc(['-i', video_file, '-map', '0:v:0', '-map', '0:a:0', '-c', 'copy'])
+    decoded_tb, decoded = _framecrc(['-i', video_file, '-map', '0:a:0', '-frames:a', '1'])
+    return (time_bases[0], Fraction(0), time_bases[1], packets[0], packets[1],
+            _seconds(decoded[0][0][0], decoded_tb[0]))
+
+
+def probe_timing(video_file):
+    # Container timing of the first video and audio streams, as a dict:
+    #   frame_times       presentation time of every video frame (sorted)
+    #   nominal_fps       the stream's declared frame rate (None if unknown)
+    #   audio_start       presentation time of the first decoded audio sample
+    #   priming           seconds the decoder drops before it (encoder delay)
+    #   segment_start     audio.wav time at which each gap-free run of audio packets begins
+    #   segment_offset    presentation time minus audio.wav time within that run
+    # All times in seconds from the start of the presentation (the earlier of
+    # the first video frame and the first audio sample).
+    with stage('probe_timing') as timer:
+        try:
+            video_tb, fps, audio_tb, (video_pts, _), (audio_pts, audio_dur), origin = _probe_ffprobe(video_file)
+            source = 'ffprobe'
+        except FileNotFoundError:
+            video_tb, fps, audio_tb, (video_pts, _), (audio_pts, audio_dur), origin = _probe_ffmpeg(video_file)
+            source = 'ffmpeg'
+        frame_times = np.unique(_seconds(video_pts, video_tb))
+
+        order = np.argsort(audio_pts, kind='stable')
+        pts, dur = _seconds(audio_pts, audio_tb)[order], np.asarray(audio_dur, dtype=np.int64)[order]
+        # A packet decodes to one codec frame (the stream's usual packet
+        # duration); MP4 stores a gap as a longer duration on the packet before it
+        values, counts = np.unique(dur, return_counts=True)
+        dur = _seconds(np.minimum(dur, values[np.argmax(counts)]), audio_tb)
+        decoded = np.concatenate([[0.0], np.cumsum(dur[:-1])])  # packet starts in decoded time
+        step = pts[1:] - (pts[:-1] + dur[:-1])
+        starts = np.concatenate([[0], np.flatnonzero(np.abs(step) > GAP_TOLERANCE) + 1])
+        # audio.wav time 0 is the first decoded sample, at `origin`
+        segment_start = decoded[starts] + pts[0] - origin
+        segment_offset = pts[starts] - decoded[starts] - pts[0] + origin
+
+        zero = min(frame_times[0], origin)
+        timer.items = len(frame_times) + len(pts)
+    return {
+        "source": source,
+        "frame_times": frame_times - zero,
+        "nominal_fps": float(fps) if fps else None,
+        "audio_start": float(origin - zero),
+        "priming": float(origin - pts[0]),
+        "segment_start": segment_start,
+        "segment_offset": segment_offset - zero,
+    }
+
+
+def align_times(times, timing, snap=False):
+    # Presentation times for an array of audio.wav times, with snap=True
+    # snapped to the nearest video frame start; returns (times, report)
+    times = np.asarray(times, dtype=float)
+    segment = np.maximum(np.searchsorted(timing["segment_start"], times, side='right') - 1, 0)
+    presented = np.maximum(times + timing["segment_offset"][segment], 0.0)
+
+    frames = timing["frame_times"]
+    i = np.clip(np.searchsorted(frames, presented), 1, len(frames) - 1) if len(frames) > 1 \
+        else np.zeros(len(presented), dtype=np.int64)
+    nearest = frames[i]
+    if len(frames) > 1:
+        i -= presented - frames[i - 1] < frames[i] - presented  # nearer neighbour
+        # Past the last frame (audio running longer than the video) there is nothing to snap to
+        nearest = np.where(presented > 2 * frames[-1] - frames[-2], presented, frames[i])
+    shown = np.maximum(np.searchsorted(frames, presented, side='right') - 1, 0)  # frame on screen
+    aligned = nearest if snap else presented
+
+    offset = presented - times
+    frame_durations = np.diff(frames)
+    fps = timing["nominal_fps"] or (1.0 / np.median(frame_durations) if len(frames) > 1 else None)
+    report = {
+        "source": timing["source"],
+        "events": len(times),
+        "audio_start": round(timing["audio_start"], 6),
+        "priming": round(timing["priming"], 6),
+        "audio_gaps": len(timing["segment_start"]) - 1,
+        "audio_gap_seconds": round(float(timing["segment_offset"][-1] - timing["segment_offset"][0]), 6),
+        "video_start": round(float(frames[0]), 6) if len(frames) else None,
+        "frames": len(frames),
+        "nominal_fps": timing["nominal_fps"],
+        "mean_fps": float(len(frame_durations) / (frames[-1] - frames[0])) if len(frames) > 1 else None,
+        "variable_frame_rate": bool(len(frame_durations)
+                                    and np.ptp(frame_durations) > 0.01 * np.median(frame_durations)),
+        "offset_min": round(float(offset.min()), 6) if len(times) else 0.0,
+        "offset_max": round(float(offset.max()), 6) if len(times) else 0.0,
+        "snapped": snap,
+        "snap_mean_ms": round(float(np.abs(nearest - presented).mean() * 1000), 3) if len(times) else 0.0,
+        "snap_max_ms": round(float(np.abs(nearest - presented).max() * 1000), 3) if len(times) else 0.0,
+        # Frame numbers a fixed 1/fps grid gives the events, against the real ones
+        "cfr_frames_off_max": int(np.abs(np.floor(presented * fps) - shown).max()) if len(times) and fps else 0,
+    }
+    return aligned, report
+
+
+def align_pattern(pattern, timing, snap=False):
+    # align_times over every entry of a pattern (dicts and/or EventTables, as
+    # write_ahap takes it) in one call; curve control points are relative to
+    # their curve and move with it. Returns (pattern, report).
+    pattern = [pattern] if isinstance(pattern, EventTable) else list(pattern)
+    times = np.concatenate([entry.time if isinstance(entry, EventTable)
+                            else [next(iter(entry.values()))["Time"]] for entry in pattern] or [[]])
+    aligned, report = align_times(times, timing, snap)
+    out, k = [], 0
+    for entry in pattern:
+        if isinstance(entry, EventTable):
+            table = entry.select(slice(None))
+            table.time = aligned[k:k + len(table)]
+            out.append(table)
+            k += len(table)
+        else:
+            kind, body = next(iter(entry.items()))
+            out.append({kind: dict(body, Time=round(float(aligned[k]), 3))})
+            k += 1
+    return out, report
+
+
+def align_file(video_file, ahap_in, ahap_out, snap=False):
+    # Aligned copy of an .ahap; returns the report
+    with open(ahap_in) as f:
+        ahap = json.load(f)
+    timing = probe_timing(video_file)
+    with stage('align', snap=snap) as timer:
+        pattern, report = align_pattern(ahap["Pattern"], timing, snap)
+        timer.items = len(pattern)
+    report["bytes"] = write_ahap(ahap_out, pattern, version=ahap.get("Version", 1))
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Align an AHAP generated from a video's audio to its frame timing.")
+    parser.add_argument('video')
+    parser.add_argument('ahap')
+    parser.add_argument('-o', '--output', default='pattern_synced.ahap')
+    parser.add_argument('--snap', action='store_true', help="also snap event times to the nearest video frame")
+    parser.add_argument('--json', help="write the report here")
+    args = parser.parse_args()
+
+    report = align_file(args.video, args.ahap, args.output, snap=args.snap)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(f"{args.ahap} -> {args.output}: {report['events']} entries, timing via {report['source']}")
+    print(f"  audio starts {report['audio_start'] * 1000:.1f} ms in ({report['priming'] * 1000:.1f} ms priming), "
+          f"{report['audio_gaps']} gaps ({report['audio_gap_seconds'] * 1000:.1f} ms)")
+    print(f"  offsets {report['offset_min'] * 1000:.1f} .. {report['offset_max'] * 1000:.1f} ms, "
+          f"{'snapped' if report['snapped'] else 'nearest frame'} {report['snap_mean_ms']:.1f} ms mean / "
+          f"{report['snap_max_ms']:.1f} ms max")
+    print(f"  {report['frames']} frames, {report['mean_fps']:.3f} fps mean"
+          f"{' (variable)' if report['variable_frame_rate'] else ''}, "
+          f"a nominal-rate grid is up to {report['cfr_frames_off_max']} frames off")
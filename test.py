@@ -2,14 +2,32 @@ import librosa
 import numpy as np
 import json
 
+from features import load_features
+from incremental import array_digest, load_state, dirty_windows, splice, save_state
+from event_table import EventTable
+from ahap_writer import write_ahap
+from patterns import library, library_digest
+from schedule import schedule
+from instrument import stage
+
 # --- Config ---
 audio_file = 'audio.wav'
 yamnet_file = 'yamnet_timeline.json'
 output_ahap = 'pattern_hybrid.ahap'
+sr = 44100
 
 frame_length = 2048     # ~50ms (can be longer for YAMNet alignment, e.g. 1s)
 hop_length = 1024       # ~25ms (or 0.5s if matching YAMNet hop)
 
+minify = False          # compact AHAP without whitespace
+float_decimals = None   # e.g. 4 to cap float precision in the output
+incremental = False     # True: only rebuild windows whose label changed since the last run
+
+# --- Scheduling (schedule.py) ---
+schedule_events = True  # resolve overlapping events and enforce device limits
+max_event_rate = 40.0   # transients per second
+max_continuous = 2      # continuous events playing at once
+
 # --- Special Events Mapping ---
 EVENT_CATEGORIES = {
     "Explosion": "Explosion",
@@ -25,191 +43,205 @@ EVENT_CATEGORIES = {
     "Wind": "Whoosh"
 }
 MASK_CLASSES = ["Speech", "Silence", "Water", "Crowd"]
+FEATURE_THRESHOLD = 0.1  # normalized intensity below which unlabelled windows stay silent
+
+# Which effect wins when events collide; "feature" is the audio-feature mapping
+PRIORITY = {
+    "Explosion": 5,
+    "Gunfire": 4,
+    "Engine": 3,
+    "Whoosh": 2,
+    "Music": 2,
+    "feature": 1,
+}
+
+# Effect template per category (patterns.py); Engine uses the audio-driven rumble below
+CATEGORY_TEMPLATES = {
+    "Explosion": "explosion",
+    "Gunfire": "gunfire",
+    "Music": "inflate",
+    "Whoosh": "whoosh",
+}
+TEMPLATES = library()
 
 # --- Helper Functions for Event Patterns ---
-def make_explosion(time):
-    return [{
-        "Event": {
-            "Time": round(time, 3),
-            "EventType": "HapticTransient",
-            "EventParameters": [
-                {"ParameterID": "HapticIntensity", "ParameterValue": 1.0},
-                {"ParameterID": "HapticSharpness", "ParameterValue": 1.0}
-            ]
-        }
-    }]
-
-def make_gunfire(time):
-    return [{
-        "Event": {
-            "Time": round(time, 3),
-            "EventType": "HapticTransient",
-            "EventParameters": [
-                {"ParameterID": "HapticIntensity", "ParameterValue": 0.8},
-                {"ParameterID": "HapticSharpness", "ParameterValue": 1.0}
-            ]
-        }
-    }]
-
-def make_music(time, duration=1.5):
-    # "Inflate"-style pattern
-    return [
-        {
-            "Event": {
-                "Time": round(time, 3),
-                "EventType": "HapticContinuous",
-                "EventDuration": duration,
-                "EventParameters": [
-                    {"ParameterID": "HapticIntensity", "ParameterValue": 1.0},
-                    {"ParameterID": "HapticSharpness", "ParameterValue": 0.5}
-                ]
-            }
-        },
-        {
-            "ParameterCurve": {
-                "ParameterID": "HapticIntensityControl",
-                "Time": round(time, 3),
-                "ParameterCurveControlPoints": [
-                    { "Time": round(time, 3), "ParameterValue": 0.0 },
-                    { "Time": round(time + 1.1, 3), "ParameterValue": 0.5 },
-                    { "Time": round(time + duration, 3), "ParameterValue": 0.0 }
-                ]
-            }
-        },
-        {
-            "ParameterCurve": {
-                "ParameterID": "HapticSharpnessControl",
-                "Time": round(time, 3),
-                "ParameterCurveControlPoints": [
-                    { "Time": round(time, 3), "ParameterValue": -0.8 },
-                    { "Time": round(time + duration, 3), "ParameterValue": 0.8 }
-                ]
-            }
-        }
-    ]
-
-def make_engine(time, duration=1.0, y=None, sr=None):
-    # Feature-driven rumble: modulate intensity/sharpness from the local engine chunk
-    events = []
-    if y is not None and sr is not None:
-        start_sample = int(time * sr)
-        end_sample = int((time + duration) * sr)
-        y_chunk = y[start_sample:end_sample]
-        chunk_frame = int(0.1 * sr)
-        chunk_hop = chunk_frame
-        rms = librosa.feature.rms(y=y_chunk, frame_length=chunk_frame, hop_length=chunk_hop)[0]
-        cent = librosa.feature.spectral_centroid(y=y_chunk, sr=sr, n_fft=chunk_frame, hop_length=chunk_hop)[0]
-        n_frames = len(rms)
-        for i in range(n_frames):
-            t = round(time + i * 0.1, 3)
-            inten = float((rms[i] - rms.min()) / (rms.max() - rms.min() + 1e-6))
-            sharp = float((cent[i] - cent.min()) / (cent.max() - cent.min() + 1e-6))
-            events.append({
-                "Event": {
-                    "Time": t,
-                    "EventType": "HapticTransient",
-                    "EventParameters": [
-                        {"ParameterID": "HapticIntensity", "ParameterValue": inten},
-                        {"ParameterID": "HapticSharpness", "ParameterValue": sharp}
-                    ]
-                }
-            })
-    else:
-        # fallback: simple rumble
-        for i in range(10):
-            t = round(time + i * 0.1, 3)
-            events.append({
-                "Event": {
-                    "Time": t,
-                    "EventType": "HapticTransient",
-                    "EventParameters": [
-                        {"ParameterID": "HapticIntensity", "ParameterValue": 1.0},
-                        {"ParameterID": "HapticSharpness", "ParameterValue": 0.1}
-                    ]
-                }
-            })
-    return events
-
-def make_whoosh(time):
-    return [{
-        "Event": {
-            "Time": round(time, 3),
-            "EventType": "HapticTransient",
-            "EventParameters": [
-                {"ParameterID": "HapticIntensity", "ParameterValue": 0.7},
-                {"ParameterID": "HapticSharpness", "ParameterValue": 0.5}
-            ]
-        }
-    }]
-
-# --- Load audio and YAMNet timeline ---
-y, sr = librosa.load(audio_file, sr=44100, mono=True)
-with open(yamnet_file) as f:
-    timeline = json.load(f)
-
-# --- Compute features (must match timeline length) ---
-# Match the number of frames with timeline windows (use their settings if possible)
-N = len(timeline)
-duration = librosa.get_duration(y=y, sr=sr)
-win_sec = timeline[1]['time'] - timeline[0]['time'] if N > 1 else 1.0  # window size
-frame_length = int(win_sec * sr)
-hop_length = frame_length  # Non-overlapping
-
-rms = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=hop_length)[0]
-cent = librosa.feature.spectral_centroid(y=y, sr=sr, n_fft=frame_length, hop_length=hop_length)[0]
-times = librosa.frames_to_time(np.arange(len(rms)), sr=sr, hop_length=hop_length, n_fft=frame_length)
-# Pad to match timeline if needed
-while len(rms) < N:
-    rms = np.append(rms, rms[-1])
-    cent = np.append(cent, cent[-1])
-    times = np.append(times, times[-1] + win_sec)
-
-# Normalize features
-intensity = (rms - rms.min()) / (rms.max() - rms.min() + 1e-6)
-sharpness = (cent - cent.min()) / (cent.max() - cent.min() + 1e-6)
-
-# --- Build hybrid haptic pattern ---
-ahap_events = []
-for i in range(N):
-    t = timeline[i]['time']
-    label = timeline[i]['label']
-    label_simple = EVENT_CATEGORIES.get(label, None)
+ENGINE_FRAME_SEC = 0.1  # rumble resolution
+
+def engine_frame_params(sr):
+    # 100 ms non-overlapping frames used for the engine rumble
+    chunk_frame = int(ENGINE_FRAME_SEC * sr)
+    return chunk_frame, chunk_frame
+
+def engine_frames(time, duration):
+    # Track frames covered by one window; consecutive windows tile without overlap
+    first = int(round(time / ENGINE_FRAME_SEC))
+    return first, first + max(int(round(duration / ENGINE_FRAME_SEC)), 1)
+
+def build_engine_track(engine_feats, timeline, win_sec):
+    # Normalize the 100 ms rumble features once, with min/max taken over every
+    # Engine-labelled window, so levels stay continuous across window boundaries
+    rms, cent = engine_feats['rms'], engine_feats['centroid']
+    in_engine = np.zeros(len(rms), dtype=bool)
+    for entry in timeline:
+        if EVENT_CATEGORIES.get(entry['label']) == "Engine":
+            first, stop = engine_frames(entry['time'], win_sec)
+            in_engine[first:stop] = True
+    if not in_engine.any():
+        in_engine[:] = True
+    rms_lo, rms_hi = rms[in_engine].min(), rms[in_engine].max()
+    cent_lo, cent_hi = cent[in_engine].min(), cent[in_engine].max()
+    return {
+        "intensity": np.clip((rms - rms_lo) / (rms_hi - rms_lo + 1e-6), 0.0, 1.0),
+        "sharpness": np.clip((cent - cent_lo) / (cent_hi - cent_lo + 1e-6), 0.0, 1.0),
+        "norm": [float(rms_lo), float(rms_hi), float(cent_lo), float(cent_hi)],
+    }
+
+def make_engine(time, duration=1.0, engine_track=None):
+    # Feature-driven rumble: slice the precomputed, globally normalized engine track
+    if engine_track is not None:
+        first, stop = engine_frames(time, duration)
+        inten = engine_track['intensity'][first:stop]
+        sharp = engine_track['sharpness'][first:stop]
+        times = time + np.arange(len(inten)) * ENGINE_FRAME_SEC
+        return EventTable(times, inten, sharp).to_ahap_events()
+    # fallback: simple rumble
+    return TEMPLATES['pulse'].at(time)
+
+def timeline_frame_params(timeline, sr):
+    # Non-overlapping frames matching the timeline windows
+    win_sec = timeline[1]['time'] - timeline[0]['time'] if len(timeline) > 1 else 1.0
+    frame_length = int(win_sec * sr)
+    return frame_length, frame_length
+
+def prepare(timeline, audio_file=None, sr=sr, feats=None, engine_feats=None):
+    # Everything window_entries() needs, computed once for the whole timeline.
+    # feats / engine_feats: precomputed window-rate and 100 ms feature dicts
+    # (e.g. from extract_audio.pipe_audio) used instead of analyzing audio_file
+    # --- Compute features (must match timeline length) ---
+    # Match the number of frames with timeline windows (use their settings if possible)
+    N = len(timeline)
+    win_sec = timeline[1]['time'] - timeline[0]['time'] if N > 1 else 1.0  # window size
+    frame_length, hop_length = timeline_frame_params(timeline, sr)  # Non-overlapping
+
+    # Streamed block by block and cached
+    if feats is None:
+        feats = load_features(audio_file, sr=sr, frame_length=frame_length, hop_length=hop_length)
+    rms, cent = feats['rms'], feats['centroid']
+    times = librosa.frames_to_time(np.arange(len(rms)), sr=sr, hop_length=hop_length, n_fft=frame_length)
+    # Pad to match timeline if needed
+    while len(rms) < N:
+        rms = np.append(rms, rms[-1])
+        cent = np.append(cent, cent[-1])
+        times = np.append(times, times[-1] + win_sec)
+
+    # Normalize features
+    intensity = (rms - rms.min()) / (rms.max() - rms.min() + 1e-6)
+    sharpness = (cent - cent.min()) / (cent.max() - cent.min() + 1e-6)
+
+    # --- Feature-based mapping for windows without a special effect (array ops) ---
+    labels = [entry['label'] for entry in timeline]
+    masked = np.array([label in MASK_CLASSES for label in labels], dtype=bool)
+    special = np.array([label in EVENT_CATEGORIES for label in labels], dtype=bool)
+    window_times = np.array([entry['time'] for entry in timeline], dtype=float)
+    feature_keep = ~masked & ~special & (intensity[:N] > FEATURE_THRESHOLD)  # skip very low intensity
+    feature_events = EventTable(window_times, intensity[:N], sharpness[:N]).select(feature_keep)
+
+    # --- Engine rumble track, computed once for the whole file ---
+    engine_track = None
+    if any(EVENT_CATEGORIES.get(label) == "Engine" for label in labels):
+        if engine_feats is None and audio_file is not None:
+            engine_frame, engine_hop = engine_frame_params(sr)
+            engine_feats = load_features(audio_file, sr=sr, frame_length=engine_frame, hop_length=engine_hop)
+        if engine_feats is not None:
+            engine_track = build_engine_track(engine_feats, timeline, win_sec)
+
+    return {
+        "timeline": timeline,
+        "win_sec": win_sec,
+        "digest": array_digest(rms, cent, *((engine_feats['rms'], engine_feats['centroid']) if engine_track else ())),
+        "masked": masked,
+        "feature_entries": dict(zip(np.flatnonzero(feature_keep).tolist(), feature_events.to_ahap_events())),
+        "engine_track": engine_track,
+    }
+
+def window_entries(ctx, i):
+    # Pattern entries produced by timeline window i
+    t = ctx["timeline"][i]['time']
+    label_simple = EVENT_CATEGORIES.get(ctx["timeline"][i]['label'], None)
+    win_sec = ctx["win_sec"]
     # Masked class: no haptics!
-    if label in MASK_CLASSES:
-        continue
+    if ctx["masked"][i]:
+        return []
     # Special effect event
-    if label_simple == "Explosion":
-        ahap_events.extend(make_explosion(t))
-    elif label_simple == "Gunfire":
-        ahap_events.extend(make_gunfire(t))
-    elif label_simple == "Music":
-        ahap_events.extend(make_music(t, duration=win_sec))
-    elif label_simple == "Engine":
-        ahap_events.extend(make_engine(t, duration=win_sec, y=y, sr=sr))
-    elif label_simple == "Whoosh":
-        ahap_events.extend(make_whoosh(t))
-    else:
-        # Feature-based mapping (skip very low intensity)
-        inten = float(intensity[i])
-        sharp = float(sharpness[i])
-        if inten > 0.1:
-            ahap_events.append({
-                "Event": {
-                    "Time": round(t, 3),
-                    "EventType": "HapticTransient",
-                    "EventParameters": [
-                        {"ParameterID": "HapticIntensity", "ParameterValue": inten},
-                        {"ParameterID": "HapticSharpness", "ParameterValue": sharp}
-                    ]
-                }
-            })
-
-ahap = {
-    "Version": 1,
-    "Pattern": ahap_events
-}
-
-with open(output_ahap, "w") as f:
-    json.dump(ahap, f, indent=2)
-
-print(f"Generated {output_ahap} with {len(ahap_events)} events.")
+    if label_simple == "Engine":
+        return make_engine(t, duration=win_sec, engine_track=ctx["engine_track"])
+    elif label_simple in CATEGORY_TEMPLATES:
+        return TEMPLATES[CATEGORY_TEMPLATES[label_simple]].at(t, duration=win_sec)
+    elif i in ctx["feature_entries"]:
+        return [ctx["feature_entries"][i]]
+    return []
+
+def build_pattern(timeline, audio_file=None, sr=sr, feats=None, engine_feats=None):
+    ctx = prepare(timeline, audio_file, sr, feats, engine_feats)
+    ahap_events = []
+    for i in range(len(timeline)):
+        ahap_events.extend(window_entries(ctx, i))
+    return ahap_events
+
+def schedule_pattern(timeline, ahap_events, counts):
+    # (pattern, number of entries) with collisions resolved by effect priority
+    # and the device limits enforced; counts is the number of entries per window
+    if not schedule_events:
+        return ahap_events, len(ahap_events)
+    window_priority = [PRIORITY.get(EVENT_CATEGORIES.get(entry['label']), PRIORITY["feature"])
+                       for entry in timeline]
+    pattern, report = schedule(ahap_events, np.repeat(window_priority, counts),
+                               np.repeat(np.arange(len(timeline)), counts),
+                               max_rate=max_event_rate, max_continuous=max_continuous)
+    return pattern, report["entries_out"]
+
+def generate(audio_file=audio_file, yamnet_file=yamnet_file, output_ahap=output_ahap,
+             feats=None, engine_feats=None, incremental=incremental):
+    # Hybrid pass for one audio file; returns (events, bytes written).
+    # With incremental=True only windows whose label changed since the last run
+    # (per the state file next to output_ahap) are rebuilt and spliced in.
+    with open(yamnet_file) as f:
+        timeline = json.load(f)
+    with stage('build_pattern') as timer:
+        ctx = prepare(timeline, audio_file, sr, feats, engine_feats)
+        fingerprint = {
+            "generator": "test.py",
+            "features": ctx["digest"],
+            "config": [EVENT_CATEGORIES, MASK_CLASSES, FEATURE_THRESHOLD, CATEGORY_TEMPLATES, sr, float_decimals],
+            "templates": library_digest(TEMPLATES),
+        }
+        extra = {"engine_norm": ctx["engine_track"]["norm"] if ctx["engine_track"] else None}
+
+        state = load_state(output_ahap) if incremental else None
+        dirty = dirty_windows(state, output_ahap, timeline, fingerprint)
+        if dirty is not None and state["extra"].get("engine_norm") != extra["engine_norm"]:
+            # Engine normalization changed: every Engine window, old or new, is affected
+            old_labels = [entry['label'] for entry in state["timeline"]]
+            dirty |= {i for i, entry in enumerate(timeline)
+                      if "Engine" in (EVENT_CATEGORIES.get(entry['label']), EVENT_CATEGORIES.get(old_labels[i]))}
+
+        if dirty is None:
+            per_window = [window_entries(ctx, i) for i in range(len(timeline))]
+            ahap_events = [entry for entries in per_window for entry in entries]
+            counts = [len(entries) for entries in per_window]
+        else:
+            ahap_events, counts = splice(output_ahap, state,
+                                         {i: window_entries(ctx, i) for i in dirty})
+        timer.items = len(ahap_events)
+        timer.info['rebuilt_windows'] = len(timeline) if dirty is None else len(dirty)
+
+    pattern, n_events = schedule_pattern(timeline, ahap_events, counts)
+    n_bytes = write_ahap(output_ahap, pattern, minify=minify, decimals=float_decimals)
+    if incremental:
+        save_state(output_ahap, timeline, counts, fingerprint, extra,
+                   pattern=ahap_events if schedule_events else None)
+    return n_events, n_bytes
+
+if __name__ == '__main__':
+    n_events, n_bytes = generate()
+    print(f"Generated {output_ahap} with {n_events} events ({n_bytes} bytes).")
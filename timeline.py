@@ -0,0 +1,58 @@
+# Helpers for working with the YAMNet label timeline (yamnet_timeline.json)
+
+import numpy as np
+
+
+def window_seconds(timeline):
+    return timeline[1]['time'] - timeline[0]['time'] if len(timeline) > 1 else 1.0
+
+
+def label_intervals(timeline, labels, win_sec=None):
+    # [start, end) intervals of every window whose label is in `labels`
+    if win_sec is None:
+        win_sec = window_seconds(timeline)
+    starts = np.array([entry['time'] for entry in timeline if entry['label'] in labels], dtype=float)
+    return starts, starts + win_sec
+
+
+def merge_intervals(starts, ends):
+    # Sort and merge overlapping or touching [start, end) intervals
+    order = np.argsort(starts, kind='stable')
+    starts, ends = np.asarray(starts, dtype=float)[order], np.asarray(ends, dtype=float)[order]
+    if len(starts) == 0:
+        return starts, ends
+    reach = np.maximum.accumulate(ends)
+    new_group = np.empty(len(starts), dtype=bool)
+    new_group[0] = True
+    new_group[1:] = starts[1:] > reach[:-1]
+    first = np.flatnonzero(new_group)
+    last = np.append(first[1:] - 1, len(starts) - 1)
+    return starts[first], reach[last]
+
+
+def in_intervals(times, starts, ends):
+    # Boolean mask: is each time inside any merged [start, end) interval?
+    times = np.asarray(times, dtype=float)
+    if len(starts) == 0:
+        return np.zeros(times.shape, dtype=bool)
+    idx = np.searchsorted(starts, times, side='right') - 1
+    return (idx >= 0) & (times < ends[np.maximum(idx, 0)])
+
+
+def label_segments(timeline, win_sec=None):
+    # Runs of consecutive windows with the same label as
+    # {"start", "end", "label", "confidence"} (mean confidence over the run)
+    if win_sec is None:
+        win_sec = window_seconds(timeline)
+    segments = []
+    for entry in timeline:
+        if segments and segments[-1]['label'] == entry['label']:
+            segment = segments[-1]
+            segment['end'] = round(entry['time'] + win_sec, 2)
+            segment['_confidence'].append(entry['confidence'])
+        else:
+            segments.append({"start": entry['time'], "end": round(entry['time'] + win_sec, 2),
+                             "label": entry['label'], "_confidence": [entry['confidence']]})
+    for segment in segments:
+        segment['confidence'] = float(np.mean(segment.pop('_confidence')))
+    return segments
@@ -1,27 +1,331 @@
+# Visual diff of audio, features, YAMNet labels and generated haptics, for QA
+# of long videos.
+#
+# Nothing is plotted per sample or per frame. The waveform is kept as a
+# min/max envelope pyramid (ENVELOPE_BASE samples per point at the finest
+# level, ENVELOPE_FACTOR times coarser per level), built block by block and
+# cached next to the audio features. Every track is then reduced to one
+# min/max pair per pixel column before it reaches matplotlib, so a 2 h file
+# renders about as fast as a 2 min one. Zooming in (--start / --end) reads
+# the finest level that still has a point per pixel, down to raw samples.
+#
+# Rows: waveform envelope; RMS and spectral centroid; YAMNet label segments;
+# haptic events (transients by intensity, coloured by sharpness, and the
+# level of continuous events); parameter curves.
+#
+#   python visualise.py                                        # opens a window
+#   python visualise.py audio.wav --ahap hybrid.ahap -o qa.png
+#   python visualise.py audio.wav --ahap pattern_hybrid.ahap --start 600 --end 660 -o qa.html
+
+import argparse
+import base64
+import html
+import io
+import json
+import os
+import tempfile
 import numpy as np
-import matplotlib.pyplot as plt
-import librosa
-import librosa.display
+import matplotlib
+import soundfile as sf
+
+from features import load_features, audio_hash, _read_mono, _save_npz, FEATURE_CACHE_DIR
+from event_table import CONTINUOUS
+from hpat import PatternFile, ahap_to_hpat
+from timeline import label_segments
+from instrument import stage
 
-# Load the audio file
 audio_path = "audio.wav"
-y, sr = librosa.load(audio_path, sr=44100)
+yamnet_file = "yamnet_timeline.json"
 
-# Compute short-term energy (root mean square - RMS)
+# Short-term energy (root mean square - RMS), shared with extract_events.py via the feature cache
+sr = 44100
 frame_length = 2048
 hop_length = 512
-rms = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=hop_length)[0]
-times = librosa.times_like(rms, sr=sr, hop_length=hop_length)
-
-# Plot audio waveform and RMS energy
-plt.figure(figsize=(14, 6))
-plt.subplot(2, 1, 1)
-librosa.display.waveshow(y, sr=sr, alpha=0.6)
-plt.title('Waveform')
-plt.subplot(2, 1, 2)
-plt.plot(times, rms, color='red')
-plt.title('Short-Term Energy (RMS)')
-plt.xlabel('Time (s)')
-plt.ylabel('Energy')
-plt.tight_layout()
-plt.show()
+
+width = 2000                # pixel columns of the plot area
+ENVELOPE_BASE = 256         # samples per point at the finest envelope level
+ENVELOPE_FACTOR = 4         # each level is this much coarser than the one below
+ENVELOPE_VERSION = 1
+MAX_LABELS = 8              # labels with their own colour; the rest are drawn as "other"
+
+
+def _reduce(x, factor, ufunc):
+    pad = -len(x) % factor
+    if pad:
+        x = np.concatenate([x, np.repeat(x[-1:], pad)])
+    return ufunc.reduce(x.reshape(-1, factor), axis=1)
+
+
+def envelope_levels(audio_file, base=ENVELOPE_BASE, factor=ENVELOPE_FACTOR, block_samples=1 << 20,
+                    cache_dir=FEATURE_CACHE_DIR):
+    # (sample rate, [(mins, maxs), ...]) min/max pyramid of the mono mix;
+    # level k has one point per base * factor**k samples
+    path = None
+    if cache_dir is not None:
+        key = f"{audio_hash(audio_file)}_envelope{ENVELOPE_VERSION}_{base}_{factor}"
+        path = os.path.join(cache_dir, key + '.npz')
+        if os.path.exists(path):
+            with np.load(path) as cached:
+                n_levels = (len(cached.files) - 1) // 2
+                return int(cached['sr']), [(cached[f'min{k}'], cached[f'max{k}']) for k in range(n_levels)]
+
+    with stage('envelope', base=base, factor=factor) as timer:
+        block_samples -= block_samples % base
+        mins, maxs = [], []
+        with sf.SoundFile(audio_file) as f:
+            file_sr = f.samplerate
+            while True:
+                y = _read_mono(f, block_samples)
+                if len(y) == 0:
+                    break
+                mins.append(_reduce(y, base, np.minimum))
+                maxs.append(_reduce(y, base, np.maximum))
+                if len(y) < block_samples:
+                    break
+        levels = [(np.concatenate(mins or [np.zeros(1, np.float32)]),
+                   np.concatenate(maxs or [np.zeros(1, np.float32)]))]
+        while len(levels[-1][0]) > factor:
+            lo, hi = levels[-1]
+            levels.append((_reduce(lo, factor, np.minimum), _reduce(hi, factor, np.maximum)))
+        timer.items = len(levels[0][0]) * base
+
+    if path is not None:
+        arrays = {f'{name}{k}': a for k, (lo, hi) in enumerate(levels) for name, a in (('min', lo), ('max', hi))}
+        _save_npz(path, sr=file_sr, **arrays)
+    return file_sr, levels
+
+
+def waveform_view(audio_file, file_sr, levels, t0, t1, width=width, base=ENVELOPE_BASE, factor=ENVELOPE_FACTOR):
+    # (times, mins, maxs) between t0 and t1 from the finest level with at
+    # least one point per pixel column; raw samples when zoomed in further
+    samples_per_pixel = (t1 - t0) * file_sr / width
+    if samples_per_pixel < base:
+        with sf.SoundFile(audio_file) as f:
+            f.seek(min(int(t0 * file_sr), f.frames))
+            y = _read_mono(f, int(np.ceil((t1 - t0) * file_sr)))
+        t = t0 + np.arange(len(y)) / file_sr
+        return t, y, y
+    k = min(int(np.log(samples_per_pixel / base) / np.log(factor)), len(levels) - 1)
+    step = base * factor ** k
+    lo, hi = levels[k]
+    a, b = int(t0 * file_sr // step), int(np.ceil(t1 * file_sr / step))
+    return (a + np.arange(len(lo[a:b]))) * step / file_sr, lo[a:b], hi[a:b]
+
+
+def pixel_bins(times, t0, t1, width=width):
+    return np.clip(((times - t0) * (width / (t1 - t0))).astype(np.int64), 0, width - 1)
+
+
+def bin_reduce(times, values, t0, t1, width, ufunc):
+    # ufunc (np.minimum, np.maximum, ...) over the time-sorted values of each
+    # pixel column in [t0, t1), starting from the last value before t0;
+    # returns (column times, reduced values)
+    lo = max(int(np.searchsorted(times, t0, side='right')) - 1, 0)
+    hi = int(np.searchsorted(times, t1, side='left'))
+    times, values = times[lo:hi], values[lo:hi]
+    if len(times) == 0:
+        return times, values
+    bins = pixel_bins(times, t0, t1, width)
+    starts = np.flatnonzero(np.concatenate([[True], bins[1:] != bins[:-1]]))
+    return t0 + bins[starts] * (t1 - t0) / width, ufunc.reduceat(values, starts)
+
+
+def envelope(times, lo, hi, t0, t1, width=width):
+    # (column times, mins, maxs) of a time-sorted min/max track (lo is hi for a plain track)
+    t, lo = bin_reduce(times, lo, t0, t1, width, np.minimum)
+    _, hi = bin_reduce(times, hi, t0, t1, width, np.maximum)
+    return t, lo, hi
+
+
+def load_pattern(path, tmp_dir):
+    # Columnar view of a .hpat, or of an .ahap converted into tmp_dir
+    if not path.endswith('.hpat'):
+        hpat_path = os.path.join(tmp_dir, os.path.basename(path) + '.hpat')
+        ahap_to_hpat(path, hpat_path)
+        path = hpat_path
+    return PatternFile(path)
+
+
+def transient_view(pattern, t0, t1, width=width):
+    # Strongest transient per pixel column: (times, intensity, sharpness)
+    time, kind = np.asarray(pattern.event_time), np.asarray(pattern.event_type)
+    keep = np.flatnonzero((kind != CONTINUOUS) & (time >= t0) & (time < t1))
+    intensity = np.asarray(pattern.event_intensity)[keep]
+    bins = pixel_bins(time[keep], t0, t1, width)
+    order = np.lexsort((intensity, bins))
+    if len(order):
+        # Last (loudest) of each column
+        order = order[np.flatnonzero(np.concatenate([bins[order][1:] != bins[order][:-1], [True]]))]
+    return time[keep][order], intensity[order], np.asarray(pattern.event_sharpness)[keep][order]
+
+
+def continuous_view(pattern, t0, t1, width=width):
+    # Highest intensity of any continuous event playing in each pixel column
+    time, kind = np.asarray(pattern.event_time), np.asarray(pattern.event_type)
+    end = time + np.asarray(pattern.event_duration)
+    keep = np.flatnonzero((kind == CONTINUOUS) & (time < t1) & (end > t0))
+    level = np.zeros(width)
+    if len(keep):
+        first = pixel_bins(np.maximum(time[keep], t0), t0, t1, width)
+        last = pixel_bins(np.minimum(end[keep], t1) - 1e-9, t0, t1, width)
+        counts = last - first + 1
+        owner = np.repeat(np.arange(len(keep)), counts)
+        column = first[owner] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        np.maximum.at(level, column, np.asarray(pattern.event_intensity)[keep][owner])
+    return t0 + np.arange(width + 1) * (t1 - t0) / width, np.append(level, level[-1])
+
+
+def curve_view(pattern, t0, t1):
+    # {ParameterID: [array of (absolute time, value) points per curve]} for curves reaching into [t0, t1)
+    starts = np.asarray(pattern.curve_start)
+    curve_time = np.asarray(pattern.curve_time)
+    point_time, point_value = np.asarray(pattern.point_time), np.asarray(pattern.point_value)
+    curves = {}
+    for i in np.flatnonzero(curve_time < t1).tolist():
+        t = curve_time[i] + point_time[starts[i]:starts[i + 1]]  # control point times are relative
+        if len(t) and t[-1] >= t0:
+            name = pattern.parameters[int(pattern.curve_param[i])]
+            curves.setdefault(name, []).append(np.column_stack([t, point_value[starts[i]:starts[i + 1]]]))
+    return curves
+
+
+def label_view(timeline, t0, t1, max_labels=MAX_LABELS):
+    # {label: [(start, length), ...]} of segments overlapping [t0, t1); labels
+    # beyond the max_labels longest are merged into "other"
+    segments = [s for s in label_segments(timeline) if s['end'] > t0 and s['start'] < t1]
+    totals = {}
+    for s in segments:
+        totals[s['label']] = totals.get(s['label'], 0.0) + s['end'] - s['start']
+    top = sorted(totals, key=totals.get, reverse=True)[:max_labels]
+    bars = {}
+    for s in segments:
+        label = s['label'] if s['label'] in top else 'other'
+        bars.setdefault(label, []).append((s['start'], s['end'] - s['start']))
+    return bars, segments
+
+
+def plot(audio_path=audio_path, output=None, yamnet_file=yamnet_file, ahap_file=None, start=None, end=None,
+         width=width):
+    # Renders the QA view of [start, end) seconds; saved to output (.png, .svg,
+    # .html, ...) when given, else shown in a window. Returns a summary dict.
+    if output is not None:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+
+    file_sr, levels = envelope_levels(audio_path)
+    duration = sf.info(audio_path).duration
+    t0 = 0.0 if start is None else float(start)
+    t1 = duration if end is None else float(end)
+    summary = {"audio": audio_path, "start": t0, "end": t1, "duration": duration}
+
+    rows = [3, 2, 1] + ([2, 1] if ahap_file else [])
+    fig, axes = plt.subplots(len(rows), 1, figsize=(max(width / 100, 8), sum(rows)), sharex=True,
+                             gridspec_kw={"height_ratios": rows}, squeeze=False, layout='constrained')
+    axes = axes[:, 0]
+
+    with stage('render', width=width) as timer:
+        # Waveform envelope
+        t, lo, hi = envelope(*waveform_view(audio_path, file_sr, levels, t0, t1, width), t0, t1, width)
+        axes[0].fill_between(t, lo, hi, step='post', color='tab:gray', linewidth=0.5)
+        axes[0].set_ylabel('Waveform')
+
+        # RMS and spectral centroid
+        feats = load_features(audio_path, sr=sr, frame_length=frame_length, hop_length=hop_length)
+        frame_times = np.arange(len(feats['rms'])) * hop_length / sr
+        t, lo, hi = envelope(frame_times, feats['rms'], feats['rms'], t0, t1, width)
+        axes[1].fill_between(t, lo, hi, step='post', color='tab:red', alpha=0.8, linewidth=0.5)
+        axes[1].set_ylabel('RMS', color='tab:red')
+        twin = axes[1].twinx()
+        t, lo, hi = envelope(frame_times, feats['centroid'], feats['centroid'], t0, t1, width)
+        twin.fill_between(t, lo, hi, step='post', color='tab:blue', alpha=0.3, linewidth=0.5)
+        twin.set_ylabel('Centroid (Hz)', color='tab:blue')
+
+        # YAMNet label segments
+        summary["segments"] = []
+        if yamnet_file and os.path.exists(yamnet_file):
+            with open(yamnet_file) as f:
+                timeline = json.load(f)
+            bars, segments = label_view(timeline, t0, t1)
+            colours = plt.get_cmap('tab10')
+            for k, (label, spans) in enumerate(sorted(bars.items(), key=lambda item: item[0] == 'other')):
+                colour = 'lightgray' if label == 'other' else colours(k % 10)
+                axes[2].broken_barh(spans, (0, 1), facecolors=colour, label=label)
+            axes[2].legend(loc='upper left', bbox_to_anchor=(1.01, 1.0), fontsize='small', frameon=False, ncol=2)
+            summary["segments"] = segments
+        axes[2].set_yticks([])
+        axes[2].set_ylabel('YAMNet')
+
+        # Haptic events and parameter curves
+        if ahap_file:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                pattern = load_pattern(ahap_file, tmp_dir)
+                ct, level = continuous_view(pattern, t0, t1, width)
+                axes[3].fill_between(ct, 0, level, step='post', color='tab:orange', alpha=0.4,
+                                     label='continuous')
+                tt, inten, sharp = transient_view(pattern, t0, t1, width)
+                axes[3].vlines(tt, 0, inten, colors=plt.get_cmap('viridis')(sharp), linewidth=1,
+                               label='transient (colour: sharpness)' if len(tt) else None)
+                axes[3].set_ylim(0, 1.05)
+                axes[3].set_ylabel('Haptics')
+                axes[3].legend(loc='upper left', bbox_to_anchor=(1.01, 1.0), fontsize='small', frameon=False)
+
+                curves = curve_view(pattern, t0, t1)
+                for k, (name, lines) in enumerate(sorted(curves.items())):
+                    axes[4].add_collection(LineCollection(lines, colors=f'C{k}', linewidths=1, label=name))
+                axes[4].set_ylim(-1.05, 1.05)
+                axes[4].set_ylabel('Curves')
+                if curves:
+                    axes[4].legend(loc='upper left', bbox_to_anchor=(1.01, 1.0), fontsize='small', frameon=False)
+                summary.update({"pattern": ahap_file, "entries": len(pattern),
+                                "curves_shown": sum(len(lines) for lines in curves.values())})
+                del pattern
+
+        axes[-1].set_xlim(t0, t1)
+        axes[-1].set_xlabel('Time (s)')
+
+        if output is None:
+            plt.show()
+        elif output.endswith('.html'):
+            buf = io.BytesIO()
+            fig.savefig(buf, format='png')
+            write_html(output, buf.getvalue(), summary)
+        else:
+            fig.savefig(output)
+        plt.close(fig)
+        timer.items = width
+    return summary
+
+
+def write_html(path, png, summary):
+    # Self-contained page: the rendered view plus the label segments in it
+    rows = "\n".join(
+        f"<tr><td>{s['start']:.2f}</td><td>{s['end']:.2f}</td><td>{html.escape(s['label'])}</td>"
+        f"<td>{s['confidence']:.2f}</td></tr>" for s in summary["segments"])
+    facts = "".join(f"<li>{html.escape(k)}: {html.escape(str(v))}</li>"
+                    for k, v in summary.items() if k != "segments")
+    with open(path, 'w') as f:
+        f.write(f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{html.escape(summary['audio'])} {summary['start']:.1f}-{summary['end']:.1f} s</title>
+<style>body {{ font-family: sans-serif; }} img {{ max-width: 100%; }} td {{ padding: 0 1em; }}</style></head>
+<body>
+<img src="data:image/png;base64,{base64.b64encode(png).decode()}">
+<ul>{facts}</ul>
+<table><tr><th>start</th><th>end</th><th>label</th><th>confidence</th></tr>
+{rows}
+</table>
+</body></html>
+""")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Plot audio features, YAMNet labels and haptic events.")
+    parser.add_argument('audio', nargs='?', default=audio_path)
+    parser.add_argument('--timeline', default=yamnet_file)
+    parser.add_argument('--ahap', help=".ahap or .hpat pattern to overlay")
+    parser.add_argument('--start', type=float, help="seconds")
+    parser.add_argument('--end', type=float, help="seconds")
+    parser.add_argument('--width', type=int, default=width, help="pixel columns")
+    parser.add_argument('-o', '--output', help=".png / .svg / .html to write instead of opening a window")
+    args = parser.parse_args()
+    plot(args.audio, args.output, args.timeline, args.ahap, args.start, args.end, args.width)
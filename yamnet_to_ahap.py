@@ -1,8 +1,12 @@
 import json
 
-# Load timeline
-with open("yamnet_timeline.json") as f:
-    timeline = json.load(f)
+from ahap_writer import write_ahap
+from patterns import library, library_digest, expand
+from incremental import load_state, dirty_windows, splice, save_state
+
+yamnet_file = "yamnet_timeline.json"
+output_ahap = "pattern.ahap"
+incremental = False     # True: only rebuild windows whose label changed since the last run
 
 # Map YAMNet label to AHAP category
 LABEL_TO_HAPTIC = {
@@ -20,127 +24,45 @@ LABEL_TO_HAPTIC = {
     # add more as needed
 }
 
-def make_rumble(start_time, duration=1.0):
-    # Clone the "Rumble" example pattern, shifting times by start_time
-    base = []
-    for i in range(0, int(duration * 25)):  # Rumble events every 0.04s
-        t = round(start_time + i * 0.04, 3)
-        base.append({
-            "Event": {
-                "Time": t,
-                "EventType": "HapticTransient",
-                "EventParameters": [
-                    {"ParameterID": "HapticIntensity", "ParameterValue": 1.0},
-                    {"ParameterID": "HapticSharpness", "ParameterValue": 0.1}
-                ]
-            }
-        })
-    # Add intensity curve for realism
-    base.insert(0, {
-        "ParameterCurve": {
-            "ParameterID": "HapticIntensityControl",
-            "Time": start_time,
-            "ParameterCurveControlPoints": [
-                { "Time": start_time, "ParameterValue": 0.3 },
-                { "Time": start_time + 0.1, "ParameterValue": 1.0 },
-                { "Time": start_time + 0.8, "ParameterValue": 1.0 },
-                { "Time": start_time + duration, "ParameterValue": 0.0 }
-            ]
-        }
-    })
-    return base
-
-def make_inflate(start_time, duration=1.7):
-    # Clone the "Inflate" pattern, shifting times by start_time
-    return [
-        {
-            "Event": {
-                "Time": start_time,
-                "EventType": "HapticContinuous",
-                "EventDuration": duration,
-                "EventParameters": [
-                    {"ParameterID": "HapticIntensity", "ParameterValue": 1.0},
-                    {"ParameterID": "HapticSharpness", "ParameterValue": 0.5}
-                ]
-            }
-        },
-        {
-            "ParameterCurve": {
-                "ParameterID": "HapticIntensityControl",
-                "Time": start_time,
-                "ParameterCurveControlPoints": [
-                    { "Time": start_time, "ParameterValue": 0.0 },
-                    { "Time": start_time + 1.1, "ParameterValue": 0.5 },
-                    { "Time": start_time + duration, "ParameterValue": 0.0 }
-                ]
-            }
-        },
-        {
-            "ParameterCurve": {
-                "ParameterID": "HapticSharpnessControl",
-                "Time": start_time,
-                "ParameterCurveControlPoints": [
-                    { "Time": start_time, "ParameterValue": -0.8 },
-                    { "Time": start_time + duration, "ParameterValue": 0.8 }
-                ]
-            }
-        }
-    ]
-
-# AHAP event patterns for each category
-def category_to_ahap(label, time):
-    if label == "Explosion":
-        return [{
-            "Event": {
-                "Time": time,
-                "EventType": "HapticTransient",
-                "EventParameters": [
-                    {"ParameterID": "HapticIntensity", "ParameterValue": 1.0},
-                    {"ParameterID": "HapticSharpness", "ParameterValue": 1.0}
-                ]
-            }
-        }]
-    elif label == "Gunfire":
-        return [{
-            "Event": {
-                "Time": time,
-                "EventType": "HapticTransient",
-                "EventParameters": [
-                    {"ParameterID": "HapticIntensity", "ParameterValue": 0.8},
-                    {"ParameterID": "HapticSharpness", "ParameterValue": 1.0}
-                ]
-            }
-        }]
-    elif label == "Rumble":
-        return make_rumble(time, duration=1.0)
-    elif label == "Music":
-        return make_inflate(time, duration=1.5)
-    elif label == "Whoosh":
-        return [{
-            "Event": {
-                "Time": time,
-                "EventType": "HapticTransient",
-                "EventParameters": [
-                    {"ParameterID": "HapticIntensity", "ParameterValue": 0.7},
-                    {"ParameterID": "HapticSharpness", "ParameterValue": 0.5}
-                ]
-            }
-        }]
-    else:
-        return []
+# Effect template per category (patterns.py)
+CATEGORY_TEMPLATES = {
+    "Explosion": "explosion",
+    "Gunfire": "gunfire",
+    "Rumble": "rumble",
+    "Music": "inflate",
+    "Whoosh": "whoosh",
+}
+TEMPLATES = library()
 
-ahap_pattern = []
-for event in timeline:
-    label = LABEL_TO_HAPTIC.get(event["label"])
-    if label:
-        ahap_pattern.extend(category_to_ahap(label, event["time"]))
+def window_template(entry):
+    label = LABEL_TO_HAPTIC.get(entry["label"])
+    return TEMPLATES[CATEGORY_TEMPLATES[label]] if label else None
 
-ahap = {
-    "Version": 1,
-    "Pattern": ahap_pattern
-}
+def window_entries(entry):
+    template = window_template(entry)
+    return template.at(entry["time"]) if template else []
 
-with open("pattern.ahap", "w") as f:
-    json.dump(ahap, f, indent=2)
+def generate(yamnet_file=yamnet_file, output_ahap=output_ahap, incremental=incremental):
+    # Returns the number of pattern entries written
+    with open(yamnet_file) as f:
+        timeline = json.load(f)
+    fingerprint = {"generator": "yamnet_to_ahap.py", "config": [LABEL_TO_HAPTIC, CATEGORY_TEMPLATES],
+                   "templates": library_digest(TEMPLATES)}
+    state = load_state(output_ahap) if incremental else None
+    dirty = dirty_windows(state, output_ahap, timeline, fingerprint)
+    if dirty is None:
+        # Whole timeline at once; entries stay in window order
+        templates = [window_template(entry) for entry in timeline]
+        ahap_pattern = expand([(template, entry["time"]) for template, entry in zip(templates, timeline) if template])
+        counts = [len(template) if template else 0 for template in templates]
+    else:
+        ahap_pattern, counts = splice(output_ahap, state,
+                                      {i: window_entries(timeline[i]) for i in dirty})
+    write_ahap(output_ahap, ahap_pattern)
+    if incremental:
+        save_state(output_ahap, timeline, counts, fingerprint)
+    return sum(counts)
 
-print(f"Generated pattern.ahap with {len(ahap_pattern)} events/patterns.")
+if __name__ == '__main__':
+    n = generate()
+    print(f"Generated {output_ahap} with {n} events/patterns.")
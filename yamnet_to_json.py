@@ -1,42 +1,158 @@
 import numpy as np
-import tensorflow as tf
-import tensorflow_hub as hub
 import librosa
 import csv
 import json
+import os
+import shutil
 
-labels_path = 'yamnet_class_map.csv'
-with open(labels_path, 'r') as f:
-    reader = csv.DictReader(f)
-    class_map = [row['display_name'] for row in reader]
+from instrument import stage
+from scores import scores_path, save_scores
 
-model = hub.load('https://tfhub.dev/google/yamnet/1')
+labels_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'yamnet_class_map.csv')
 audio_file = 'audio.wav'
-wav, sr = librosa.load(audio_file, sr=16000, mono=True)
+output_json = 'yamnet_timeline.json'
+
+# Local SavedModel copy of YAMNet; filled from TF Hub on first use, so later
+# runs (and machines it is copied to) work offline
+YAMNET_HANDLE = 'https://tfhub.dev/google/yamnet/1'
+model_dir = os.environ.get('HAPTICX_YAMNET_MODEL',
+                           os.path.join(os.path.expanduser('~'), '.cache', 'hapticx', 'yamnet'))
 
 window_duration = 1.0  # seconds
 hop_duration = 0.5     # seconds
-window_length = int(window_duration * sr)
-hop_length = int(hop_duration * sr)
-
-timeline = []
-
-for start in range(0, len(wav) - window_length, hop_length):
-    segment = wav[start:start + window_length]
-    scores, _, _ = model(segment)
-    mean_scores = np.mean(scores.numpy(), axis=0)
-    top_class = mean_scores.argmax()
-    top_label = class_map[top_class]
-    confidence = float(mean_scores[top_class])
-    event_time = round(start / sr, 2)
-    timeline.append({
-        "time": event_time,
-        "label": top_label,
-        "confidence": confidence
-    })
-
-with open("yamnet_timeline.json", "w") as f:
-    json.dump(timeline, f, indent=2)
-
-print("Saved yamnet_timeline.json")
 
+# Run YAMNet once over large chunks instead of once per window
+batched = True
+chunk_duration = 60.0  # seconds of audio per model call in batched mode
+
+# YAMNet's own framing (see yamnet/params.py)
+PATCH_WINDOW_SEC = 0.96
+PATCH_HOP_SEC = 0.48
+STFT_WINDOW_SEC = 0.025
+STFT_HOP_SEC = 0.010
+
+
+def load_class_map(path=labels_path):
+    with open(path, 'r') as f:
+        reader = csv.DictReader(f)
+        return [row['display_name'] for row in reader]
+
+
+def window_scores_loop(model, wav, sr=16000):
+    # Original approach: one model call per (overlapping) window
+    window_length = int(window_duration * sr)
+    hop_length = int(hop_duration * sr)
+    starts = []
+    window_scores = []
+    for start in range(0, len(wav) - window_length, hop_length):
+        segment = wav[start:start + window_length]
+        scores, _, _ = model(segment)
+        window_scores.append(np.mean(scores.numpy(), axis=0))
+        starts.append(start)
+    return np.array(starts), np.array(window_scores).reshape(len(starts), -1)
+
+
+def patch_scores(model, wav, sr=16000, chunk_sec=chunk_duration):
+    # Score every native YAMNet patch (0.96 s window, 0.48 s hop) of the whole waveform.
+    # Chunks start on the patch grid and carry enough tail for their last patch,
+    # so the stitched result equals a single call on the full waveform.
+    patch_hop = int(PATCH_HOP_SEC * sr)
+    patch_span = int((PATCH_WINDOW_SEC + STFT_WINDOW_SEC - STFT_HOP_SEC) * sr)
+    patches_per_chunk = max(1, int(chunk_sec / PATCH_HOP_SEC))
+
+    chunks = []
+    first_patch = 0
+    while True:
+        start = first_patch * patch_hop
+        end = start + (patches_per_chunk - 1) * patch_hop + patch_span
+        scores, _, _ = model(wav[start:end])
+        chunks.append(scores.numpy())
+        if end >= len(wav):
+            break
+        first_patch += patches_per_chunk
+    return np.concatenate(chunks, axis=0)
+
+
+def window_scores_batched(model, wav, sr=16000, chunk_sec=chunk_duration):
+    # Average the patch scores whose centre falls inside each 1.0 s / 0.5 s window
+    window_length = int(window_duration * sr)
+    hop_length = int(hop_duration * sr)
+    starts = np.arange(0, max(len(wav) - window_length, 0), hop_length)
+
+    scores = patch_scores(model, wav, sr=sr, chunk_sec=chunk_sec)
+    cumsum = np.vstack([np.zeros((1, scores.shape[1])), np.cumsum(scores, axis=0)])
+
+    centres = PATCH_WINDOW_SEC / 2 + np.arange(len(scores)) * PATCH_HOP_SEC
+    lo = np.searchsorted(centres, starts / sr, side='left')
+    hi = np.searchsorted(centres, (starts + window_length) / sr, side='left')
+    # A window that contains no patch centre falls back to the nearest patch
+    empty = hi <= lo
+    lo = np.where(empty, np.minimum(lo, len(scores) - 1), lo)
+    hi = np.where(empty, lo + 1, hi)
+
+    window_scores = (cumsum[hi] - cumsum[lo]) / (hi - lo)[:, None]
+    return starts, window_scores
+
+
+def build_timeline(starts, window_scores, class_map, sr=16000):
+    top_classes = window_scores.argmax(axis=1)
+    timeline = []
+    for start, top_class, mean_scores in zip(starts, top_classes, window_scores):
+        timeline.append({
+            "time": round(int(start) / sr, 2),
+            "label": class_map[top_class],
+            "confidence": float(mean_scores[top_class])
+        })
+    return timeline
+
+
+def load_model(model_dir=model_dir):
+    # TensorFlow is only imported here, so the rest of the module stays cheap to import
+    import tensorflow as tf
+    if model_dir is None:
+        import tensorflow_hub as hub
+        return hub.load(YAMNET_HANDLE)
+    if not os.path.exists(os.path.join(model_dir, 'saved_model.pb')):
+        import tensorflow_hub as hub
+        with stage('yamnet_download'):
+            shutil.copytree(hub.resolve(YAMNET_HANDLE), model_dir, dirs_exist_ok=True)
+    return tf.saved_model.load(model_dir)
+
+
+def audio_timeline(model, audio_file, class_map, batched=batched, scores_file=None):
+    # Label timeline for one audio file with an already loaded model
+    with stage('yamnet_decode') as timer:
+        wav, sr = librosa.load(audio_file, sr=16000, mono=True)
+        timer.items = len(wav)
+    return wav_timeline(model, wav, class_map, sr, batched, scores_file)
+
+
+def wav_scores(model, wav, sr=16000, batched=batched):
+    # (window start samples, window x class score matrix) for a 16 kHz mono waveform
+    with stage('yamnet', batched=batched) as timer:
+        if batched:
+            starts, window_scores = window_scores_batched(model, wav, sr)
+        else:
+            starts, window_scores = window_scores_loop(model, wav, sr)
+        timer.items = len(starts)
+    return starts, window_scores
+
+
+def wav_timeline(model, wav, class_map, sr=16000, batched=batched, scores_file=None):
+    # Label timeline for a 16 kHz mono waveform already in memory; with
+    # scores_file, the top-k scores are saved there for later relabelling
+    starts, window_scores = wav_scores(model, wav, sr, batched)
+    if scores_file is not None:
+        save_scores(scores_file, starts, window_scores, class_map, sr)
+    return build_timeline(starts, window_scores, class_map, sr)
+
+
+if __name__ == '__main__':
+    class_map = load_class_map()
+    model = load_model()
+    timeline = audio_timeline(model, audio_file, class_map, scores_file=scores_path(output_json))
+
+    with open(output_json, "w") as f:
+        json.dump(timeline, f, indent=2)
+
+    print(f"Saved {output_json} and {scores_path(output_json)}")